@@ -0,0 +1,145 @@
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import Optional
+from . import models, schemas, database, search, dedup, routing, email_service
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """Troca o driver síncrono pelo equivalente assíncrono (aiosqlite/asyncpg)"""
+    url = database.normalize_database_url(url)
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme.split('+')[0], scheme)}://{rest}"
+
+def create_async_db_engine(url: str = database.SQLALCHEMY_DATABASE_URL, **kwargs):
+    """Mesmas configurações de create_db_engine (pool no PostgreSQL, pragmas no SQLite)"""
+    url = async_database_url(url)
+    if url.startswith("sqlite"):
+        if ":memory:" not in url and "mode=memory" not in url:
+            # O aiosqlite usa NullPool por padrão em arquivos: uma conexão nova (e os pragmas) a cada requisição
+            kwargs.setdefault("poolclass", AsyncAdaptedQueuePool)
+        db_engine = create_async_engine(url, connect_args={"timeout": database.SQLITE_BUSY_TIMEOUT_MS / 1000}, **kwargs)
+        event.listen(db_engine.sync_engine, "connect", database._configure_sqlite)
+        return db_engine
+
+    return create_async_engine(
+        url,
+        pool_size=database.DB_POOL_SIZE,
+        max_overflow=database.DB_MAX_OVERFLOW,
+        pool_timeout=database.DB_POOL_TIMEOUT,
+        pool_recycle=database.DB_POOL_RECYCLE,
+        pool_pre_ping=database.DB_POOL_PRE_PING,
+        **kwargs,
+    )
+
+async_engine = create_async_db_engine()
+# expire_on_commit=False: objetos continuam legíveis após o commit sem novo SELECT implícito
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_data_version(db: AsyncSession, scope: str) -> int:
+    return (await db.scalar(database.data_version_statement(scope))) or 0
+
+async def create_lead(db: AsyncSession, lead: schemas.LeadCreate, indicador_id: int, policy: str = dedup.LEAD_DEDUP_POLICY):
+    try:
+        db_lead = await db.run_sync(database.prepare_lead, lead, indicador_id, policy)
+    except (dedup.DuplicateLeadError, routing.NoVendedorError):
+        await db.rollback()
+        raise
+    await db.commit()
+    # updated_at/created_at são gerados pelo banco
+    await db.refresh(db_lead)
+    return db_lead
+
+async def _lead_rows(db: AsyncSession, cursor: Optional[str], limit: int, **filters):
+    # Tuplas de LEAD_COLUMNS: evita montar entidades ORM e validar cada uma no response_model
+    rows = (await db.execute(database.leads_page_statement(cursor, limit, columns=database.LEAD_COLUMNS, **filters))).all()
+    return database.split_page(rows, limit)
+
+async def get_all_leads(db: AsyncSession, cursor: Optional[str] = None, limit: int = 100):
+    return await _lead_rows(db, cursor, limit)
+
+async def get_indicador_leads(db: AsyncSession, indicador_id: int, cursor: Optional[str] = None, limit: int = 100):
+    return await _lead_rows(db, cursor, limit, indicador_id=indicador_id)
+
+async def get_vendedor_leads(db: AsyncSession, vendedor_id: int, cursor: Optional[str] = None, limit: int = 100):
+    return await _lead_rows(db, cursor, limit, vendedor_id=vendedor_id)
+
+async def search_leads(
+    db: AsyncSession,
+    q: str,
+    limit: int = 20,
+    vendedor_id: Optional[int] = None,
+    indicador_id: Optional[int] = None,
+):
+    terms = search.query_terms(q)
+    if not terms:
+        return []
+    statement = search.search_statement(
+        db.bind.dialect.name, terms, limit, vendedor_id, indicador_id, columns=database.LEAD_COLUMNS
+    )
+    return (await db.execute(statement)).all()
+
+async def get_lead_changes(
+    db: AsyncSession,
+    since: Optional[str] = None,
+    limit: int = 1000,
+    vendedor_id: Optional[int] = None,
+    indicador_id: Optional[int] = None,
+):
+    """
+    Retorna (leads atuais, ids removidos, próximo token, há mais). Leads alterados e
+    depois removidos (ou fora do escopo) aparecem só entre os removidos.
+    Token inválido levanta ValueError.
+    """
+    position = database.decode_changes_token(since) if since else None
+    statement = database.lead_changes_statement(position, limit, vendedor_id, indicador_id, db.bind.dialect.name)
+    changes = (await db.execute(statement)).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        position = (changes[-1].txid, changes[-1].seq)
+    next_since = database.encode_changes_token(*(position or (0, 0)))
+
+    latest = database.latest_operations(changes)
+    upsert_ids = [lead_id for lead_id, operation in latest.items() if operation != models.ChangeOperation.DELETE]
+    leads = []
+    if upsert_ids:
+        statement = select(*database.LEAD_COLUMNS).where(models.Lead.id.in_(upsert_ids))
+        if vendedor_id is not None:
+            statement = statement.where(models.Lead.vendedor_id == vendedor_id)
+        if indicador_id is not None:
+            statement = statement.where(models.Lead.indicador_id == indicador_id)
+        leads = (await db.execute(statement.order_by(models.Lead.id))).all()
+    found = {lead.id for lead in leads}
+    deleted = [lead_id for lead_id in latest if lead_id not in found]
+    return leads, deleted, next_since, has_more
+
+async def delete_lead(db: AsyncSession, lead_id: int) -> bool:
+    db_lead = await db.get(models.Lead, lead_id)
+    if not db_lead:
+        return False
+    await db.delete(db_lead)
+    await db.commit()
+    return True
+
+async def update_lead_status(db: AsyncSession, lead_id: int, lead_update: schemas.LeadUpdate):
+    db_lead = await db.scalar(select(models.Lead).where(models.Lead.id == lead_id))
+    if not db_lead:
+        return None
+
+    await db.run_sync(email_service.queue_lead_status_changed_emails, models.Lead.id == lead_id, lead_update.status)
+    for field, value in lead_update.model_dump(exclude_unset=True).items():
+        setattr(db_lead, field, value)
+
+    await db.commit()
+    # updated_at é gerado pelo banco (onupdate=func.now())
+    await db.refresh(db_lead)
+    return db_lead
@@ -1,31 +1,129 @@
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
 from . import models, schemas, database
-import bcrypt
-from fastapi import Depends, HTTPException, Header
+from .cache import TTLCache
+from .passwords import hasher
+from fastapi import HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional
+import base64
+import hashlib
+import hmac
+import json
 import os
-from .email_service import send_welcome_email
+import secrets
+import time
+from . import email_service
 
-SECRET_KEY = os.getenv("SESSION_SECRET", "indicavende-secret-key-change-in-production")
+def _secret_key() -> str:
+    key = os.getenv("SECRET_KEY") or os.getenv("SESSION_SECRET")
+    if not key:
+        # Nunca uma chave fixa no código: com ela qualquer um assinaria tokens de qualquer usuário
+        key = secrets.token_urlsafe(32)
+        print(
+            "⚠️ SECRET_KEY não definida: usando uma chave aleatória deste processo. Os tokens deixam "
+            "de valer ao reiniciar e não são aceitos por outros workers; defina SECRET_KEY em produção"
+        )
+    return key
+
+SECRET_KEY = _secret_key()
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+# Autenticação antiga só pelo header X-User-Email, sem assinatura: qualquer um se passa por
+# qualquer usuário. Desligada por padrão; ligar só durante a migração de clientes antigos
+ALLOW_LEGACY_EMAIL_AUTH = os.getenv("ALLOW_LEGACY_EMAIL_AUTH", "false").lower() == "true"
+
+# Cache dos usuários (sem senha) para os endpoints que precisam da linha completa
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "300")),
+)
 
 def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hasher.hash(password)
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SECRET_KEY.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+def create_access_token(user, expires_minutes: int = ACCESS_TOKEN_EXPIRE_MINUTES, scope: Optional[str] = None) -> str:
+    """
+    Token de sessão assinado (HMAC-SHA256) com id, email, nome, perfil e expiração.
+    Pode ser verificado sem consultar o banco. Tokens com `scope` só valem para
+    o uso indicado (ex.: links de exportação) e não autenticam o restante da API.
+    """
+    claims = {
+        "sub": user.id,
+        "email": user.email,
+        "name": user.name,
+        "role": user.role.value if isinstance(user.role, models.UserRole) else user.role,
+        "exp": int(time.time()) + expires_minutes * 60,
+    }
+    if scope:
+        claims["scope"] = scope
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+def decode_access_token(token: str, scope: Optional[str] = None) -> Optional[dict]:
+    try:
+        payload, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time() or claims.get("scope") != scope:
+        return None
+    return claims
+
+def get_user_cached(db: Session, email: str) -> Optional[schemas.UserResponse]:
+    user = user_cache.get(email)
+    if user is None:
+        db_user = database.get_user_by_email(db, email)
+        if db_user is None:
+            return None
+        user = schemas.UserResponse.model_validate(db_user)
+        user_cache.set(email, user)
+    return user
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+def invalidate_user(email: str):
+    user_cache.pop(email)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = database.get_user_by_email(db, email)
-    if not user or not verify_password(password, user.password):
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    invalidate_user(target.email)
+    # Email alterado: remove também a chave antiga
+    for old_email in inspect(target).attrs.email.history.deleted:
+        invalidate_user(old_email)
+
+async def authenticate_user_async(db: Session, email: str, password: str):
+    """Email e senha do login; o bcrypt roda no pool dedicado, fora do event loop"""
+    user = await run_in_threadpool(database.get_user_by_email, db, email)
+    if not user or not await hasher.verify_async(password, user.password):
         return False
+    if hasher.needs_rehash(user.password):
+        # Custo configurado mudou: regrava o hash aproveitando a senha em texto puro
+        new_hash = await hasher.hash_async(password)
+        await run_in_threadpool(_update_password_hash, db, user, new_hash)
     return user
 
-def create_user(db: Session, user: schemas.UserCreate):
+def _update_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.password = hashed_password
+    db.commit()
+    db.refresh(user)
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
     db_user = database.get_user_by_email(db, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email já registrado")
     
-    hashed_password = hash_password(user.password)
+    if hashed_password is None:
+        hashed_password = hash_password(user.password)
     db_user = models.User(
         name=user.name,
         email=user.email,
@@ -33,22 +131,55 @@ def create_user(db: Session, user: schemas.UserCreate):
         role=user.role
     )
     db.add(db_user)
+    # Email de boas-vindas entra na fila na mesma transação do usuário
+    email_service.queue_welcome_email(db, db_user.email, db_user.name)
     db.commit()
     db.refresh(db_user)
     
-    # Enviar email de boas-vindas
-    send_welcome_email(db_user.email, db_user.name)
-    
     return db_user
 
-def get_current_user(db: Session = Depends(database.get_db), user_email: Optional[str] = Header(None, alias="X-User-Email")):
-    if not user_email:
+def _get_legacy_user(user_email: str) -> Optional[schemas.UserResponse]:
+    db = database.SessionLocal()
+    try:
+        return get_user_cached(db, user_email)
+    finally:
+        db.close()
+
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    user_email: Optional[str] = Header(None, alias="X-User-Email"),
+) -> schemas.CurrentUser:
+    # Dependência async: com token, a autenticação não usa o threadpool nem o banco
+    if authorization:
+        scheme, _, token = authorization.partition(" ")
+        claims = decode_access_token(token) if scheme.lower() == "bearer" else None
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Token inválido ou expirado")
+        return schemas.CurrentUser(id=claims["sub"], email=claims["email"], name=claims["name"], role=claims["role"])
+    
+    # Compatibilidade com clientes antigos que ainda enviam apenas o email (ALLOW_LEGACY_EMAIL_AUTH)
+    if not user_email or not ALLOW_LEGACY_EMAIL_AUTH:
         raise HTTPException(status_code=401, detail="Authentication required")
     
-    user = database.get_user_by_email(db, email=user_email)
+    user = user_cache.get(user_email) or await run_in_threadpool(_get_legacy_user, user_email)
     if user is None:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    return schemas.CurrentUser(id=user.id, email=user.email, name=user.name, role=user.role)
+
+EXPORT_TOKEN_EXPIRE_MINUTES = int(os.getenv("EXPORT_TOKEN_EXPIRE_MINUTES", "5"))
+
+async def get_export_user(
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None),
+    user_email: Optional[str] = Header(None, alias="X-User-Email"),
+) -> schemas.CurrentUser:
+    """Aceita o token de sessão ou um token de exportação na query string (links de download)"""
+    if token:
+        claims = decode_access_token(token, scope="export")
+        if claims is None:
+            raise HTTPException(status_code=401, detail="Link de exportação inválido ou expirado")
+        return schemas.CurrentUser(id=claims["sub"], email=claims["email"], name=claims["name"], role=claims["role"])
+    return await get_current_user(authorization, user_email)
 
 def seed_database(db: Session):
     users_data = [
@@ -1,13 +1,67 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, and_, or_, bindparam, case, cast, delete, extract, insert, literal, null, select, true, update, BigInteger, Integer, Text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from . import models, schemas
+from sqlalchemy.orm import sessionmaker, object_session
+from sqlalchemy.orm.attributes import get_history
+from . import models, schemas, events, rollups, search, dedup, routing, email_service
 from sqlalchemy.orm import Session
-import bcrypt
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+import base64
+import os
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./indicavende.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./indicavende.db")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Pool (PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+def normalize_database_url(url: str) -> str:
+    # Render/Heroku fornecem "postgres://", que o SQLAlchemy 2 não aceita
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL: leitores não bloqueiam o escritor; busy_timeout espera o lock em vez de falhar
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+    search.register_sqlite_functions(dbapi_connection)
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, **kwargs):
+    """Cria o engine conforme o banco: pool ajustado no PostgreSQL, pragmas no SQLite"""
+    url = normalize_database_url(url)
+    if url.startswith("sqlite"):
+        db_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            **kwargs,
+        )
+        event.listen(db_engine, "connect", _configure_sqlite)
+        return db_engine
+    
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        **kwargs,
+    )
+
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -17,37 +71,691 @@ def get_db():
     finally:
         db.close()
 
-def create_lead(db: Session, lead: schemas.LeadCreate, indicador_id: int):
-    db_lead = models.Lead(
-        **lead.dict(),
-        indicador_id=indicador_id
+# Escopos de data_versions: cada escrita incrementa a versão na própria transação, e os
+# ETags das listagens são derivados dela sem consultar as tabelas. Em "leads" o incremento
+# fica para o fim da transação (before_commit), para a linha ficar travada só até o commit
+LEADS_SCOPE = "leads"
+USERS_SCOPE = "users"
+
+def bump_version_statement(scope: str):
+    return (
+        update(models.DataVersion)
+        .where(models.DataVersion.scope == scope)
+        .values(version=models.DataVersion.version + 1)
     )
+
+def data_version_statement(scope: str):
+    return select(models.DataVersion.version).where(models.DataVersion.scope == scope)
+
+def get_data_version(db: Session, scope: str) -> int:
+    return db.scalar(data_version_statement(scope)) or 0
+
+def lock_leads(connection):
+    """
+    Trava de manutenção (reconstrução do rollup e da busca, dedup --apply): bloqueia as
+    escritas em leads até o commit (LOCK TABLE no PostgreSQL; no SQLite o UPDATE da versão
+    já abre a transação de escrita, e o banco tem um único escritor) e incrementa a versão.
+    As escritas da API não usam esta trava.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("LOCK TABLE leads IN SHARE ROW EXCLUSIVE MODE")
+    connection.execute(bump_version_statement(LEADS_SCOPE))
+
+def lock_lead_rows(connection, where):
+    """
+    Trava (SELECT ... FOR UPDATE, em ordem de id) os leads de `where` até o commit, antes de
+    ler os valores atuais que saem do rollup e do histórico: duas transações alterando o
+    mesmo lead não descontam o mesmo status duas vezes. No SQLite não há FOR UPDATE; a
+    primeira escrita da transação já serializa as demais.
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(select(models.Lead.id).where(where).order_by(models.Lead.id).with_for_update())
+
+def _txid(dialect_name: str):
+    # Transação atual (xid8 como bigint); só o PostgreSQL tem escritas concorrentes a ordenar
+    if dialect_name == "postgresql":
+        return cast(cast(func.pg_current_xact_id(), Text), BigInteger)
+    return None
+
+def record_lead_changes(connection, rows, session: Optional[Session] = None):
+    """
+    Registra alterações de leads (dicts com lead_id, operation, vendedor_id, indicador_id)
+    com o txid da transação. Com `session`, a versão "leads" é incrementada no fim da
+    transação e as alterações são publicadas em events.broker após o commit.
+    """
+    if rows:
+        statement = insert(models.LeadChange)
+        txid = _txid(connection.dialect.name)
+        if txid is not None:
+            statement = statement.values(txid=txid)
+        connection.execute(statement, rows)
+        if session is not None:
+            session.info["leads_changed"] = True
+            session.info.setdefault("lead_events", []).extend(rows)
+
+@event.listens_for(Session, "after_commit")
+def _publish_lead_events(session):
+    changes = session.info.pop("lead_events", None)
+    if changes:
+        events.broker.publish_lead_changes(changes)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_lead_events(session):
+    session.info.pop("lead_events", None)
+
+# Estado da transação: se houve escrita em leads, a versão gravada e os deltas do routing
+LEADS_SESSION_KEYS = ("leads_changed", "leads_version", "routing_deltas", "routing_assigned")
+
+@event.listens_for(Session, "before_commit")
+def _bump_leads_version(session):
+    """
+    Incrementa a versão "leads" por último na transação que gravou leads, na conexão da
+    própria sessão: a versão fica visível junto com as linhas (quem lê uma, lê a outra) e a
+    linha de data_versions fica travada só do UPDATE até o commit.
+    """
+    # Os listeners do flush registram as alterações (record_lead_changes)
+    session.flush()
+    if session.info.pop("leads_changed", False):
+        session.info["leads_version"] = session.execute(
+            bump_version_statement(LEADS_SCOPE).returning(models.DataVersion.version)
+        ).scalar()
+
+@event.listens_for(Session, "after_commit")
+def _commit_routing_counters(session):
+    version, deltas = session.info.pop("leads_version", None), session.info.pop("routing_deltas", None)
+    session.info.pop("routing_assigned", None)
+    if version is not None:
+        routing.router.commit(deltas or {}, version)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_leads_state(session):
+    for key in LEADS_SESSION_KEYS:
+        session.info.pop(key, None)
+
+# Escritas pelo ORM (inclusive pela sessão assíncrona); INSERT/UPDATE em massa chamam
+# lock_lead_rows, rollups, histórico, busca e record_lead_changes diretamente. A trava da
+# linha vem antes dos demais listeners, que leem os valores atuais do lead no banco.
+@event.listens_for(models.Lead, "before_update")
+@event.listens_for(models.Lead, "before_delete")
+def _lock_lead(mapper, connection, target):
+    lock_lead_rows(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "before_insert")
+@event.listens_for(models.Lead, "before_update")
+def _normalize_phone(mapper, connection, target):
+    if target.phone_normalized is None or get_history(target, "phone").has_changes():
+        target.phone_normalized = dedup.normalize_phone(target.phone)
+
+# Atributos que definem a linha do lead em lead_daily_counts (created_at não muda)
+ROLLUP_ATTRIBUTES = ("status", "vendedor_id", "indicador_id")
+
+def _rollup_changed(target) -> bool:
+    return any(get_history(target, name).has_changes() for name in ROLLUP_ATTRIBUTES)
+
+@event.listens_for(models.Lead, "after_insert")
+def _rollup_insert(mapper, connection, target):
+    rollups.add_leads(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "before_update")
+def _rollup_before_update(mapper, connection, target):
+    # Tira o lead da linha antiga enquanto o banco ainda tem os valores anteriores
+    if _rollup_changed(target):
+        rollups.add_leads(connection, models.Lead.id == target.id, sign=-1)
+
+@event.listens_for(models.Lead, "after_update")
+def _rollup_after_update(mapper, connection, target):
+    if _rollup_changed(target):
+        rollups.add_leads(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "before_delete")
+def _rollup_delete(mapper, connection, target):
+    rollups.add_leads(connection, models.Lead.id == target.id, sign=-1)
+
+# Contadores do routing (em aberto/fechados/total por vendedor), aplicados no commit
+def _previous(target, name: str):
+    history = get_history(target, name)
+    return history.deleted[0] if history.deleted else getattr(target, name)
+
+@event.listens_for(models.Lead, "after_insert")
+def _routing_insert(mapper, connection, target):
+    routing.track(object_session(target), target.vendedor_id, target.status)
+
+@event.listens_for(models.Lead, "after_update")
+def _routing_update(mapper, connection, target):
+    if _rollup_changed(target):
+        session = object_session(target)
+        routing.track(session, _previous(target, "vendedor_id"), _previous(target, "status"), -1)
+        routing.track(session, target.vendedor_id, target.status)
+
+@event.listens_for(models.Lead, "before_delete")
+def _routing_delete(mapper, connection, target):
+    routing.track(object_session(target), target.vendedor_id, target.status, -1)
+
+# Histórico de status (lead_status_changes): a criação entra como transição sem origem
+STATUS_HISTORY_COLUMNS = ["lead_id", "vendedor_id", "from_status", "to_status", "changed_at"]
+
+def record_lead_creations(connection, where):
+    connection.execute(insert(models.LeadStatusChange).from_select(STATUS_HISTORY_COLUMNS, select(
+        models.Lead.id, models.Lead.vendedor_id, null(), models.Lead.status, models.Lead.created_at,
+    ).where(where)))
+
+def seconds_between(dialect_name: str, start, end):
+    if dialect_name == "postgresql":
+        return extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+def record_status_transitions(connection, where, to_status: models.LeadStatus):
+    """
+    Registra a transição para `to_status` dos leads de `where`; chamar antes do UPDATE.
+    Fecha a etapa atual desses leads gravando o tempo nela, para as estatísticas não
+    precisarem parear transições.
+    """
+    history = models.LeadStatusChange
+    moving = and_(where, models.Lead.status != to_status)
+    connection.execute(
+        update(history)
+        .where(history.lead_id.in_(select(models.Lead.id).where(moving)), history.seconds_in_stage.is_(None))
+        .values(seconds_in_stage=cast(seconds_between(connection.dialect.name, history.changed_at, func.now()), Integer))
+    )
+    connection.execute(insert(history).from_select(STATUS_HISTORY_COLUMNS, select(
+        models.Lead.id, models.Lead.vendedor_id, models.Lead.status,
+        literal(to_status, history.to_status.type), func.now(),
+    ).where(moving)))
+
+@event.listens_for(models.Lead, "after_insert")
+def _history_insert(mapper, connection, target):
+    record_lead_creations(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "before_update")
+def _history_update(mapper, connection, target):
+    if get_history(target, "status").has_changes():
+        record_status_transitions(connection, models.Lead.id == target.id, target.status)
+
+@event.listens_for(models.Lead, "before_delete")
+def _history_delete(mapper, connection, target):
+    connection.execute(delete(models.LeadStatusChange).where(models.LeadStatusChange.lead_id == target.id))
+
+# Índice de busca (lead_search)
+SEARCH_ATTRIBUTES = ("client_name", "phone", "city_state", "observation")
+
+@event.listens_for(models.Lead, "after_insert")
+def _search_insert(mapper, connection, target):
+    search.index_leads(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "after_update")
+def _search_update(mapper, connection, target):
+    if any(get_history(target, name).has_changes() for name in SEARCH_ATTRIBUTES):
+        search.reindex_leads(connection, models.Lead.id == target.id)
+
+@event.listens_for(models.Lead, "before_delete")
+def _search_delete(mapper, connection, target):
+    search.unindex_leads(connection, models.Lead.id == target.id)
+
+def _lead_change_listener(operation: models.ChangeOperation):
+    def listener(mapper, connection, target):
+        record_lead_changes(connection, [{
+            "lead_id": target.id,
+            "operation": operation,
+            "vendedor_id": target.vendedor_id,
+            "indicador_id": target.indicador_id,
+        }], object_session(target))
+    return listener
+
+event.listen(models.Lead, "after_insert", _lead_change_listener(models.ChangeOperation.INSERT))
+event.listen(models.Lead, "after_update", _lead_change_listener(models.ChangeOperation.UPDATE))
+event.listen(models.Lead, "after_delete", _lead_change_listener(models.ChangeOperation.DELETE))
+
+@event.listens_for(models.User, "after_insert")
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _bump_users_version(mapper, connection, target):
+    connection.execute(bump_version_statement(USERS_SCOPE))
+
+def find_original_lead(db: Session, phone: str) -> Optional[int]:
+    """Id do lead original com o telefone; trava o telefone (dedup.lock_phones) para não haver corrida"""
+    phone_normalized = dedup.normalize_phone(phone)
+    if phone_normalized is None:
+        return None
+    dedup.lock_phones(db.connection(), [phone_normalized])
+    row = db.execute(dedup.originals_statement([phone_normalized])).first()
+    return row[1] if row else None
+
+def route_leads(db: Session, rows: list):
+    """Preenche pelo routing o vendedor_id das linhas sem vendedor; chamar antes de gravar leads"""
+    pending = [row for row in rows if row.get("vendedor_id") is None]
+    if not pending:
+        return
+    leads_version, users_version = get_data_version(db, LEADS_SCOPE), get_data_version(db, USERS_SCOPE)
+    for row in pending:
+        row["vendedor_id"] = routing.router.assign(db, leads_version, users_version, row["city_state"])
+
+def prepare_lead(db: Session, lead: schemas.LeadCreate, indicador_id: int, policy: str = dedup.LEAD_DEDUP_POLICY) -> models.Lead:
+    """
+    Trava o telefone e monta o lead a gravar no commit: o original com a observação
+    acrescentada (merge) ou um novo, com duplicate_of_id (flag), o vendedor do routing se
+    não informado e o email "lead_assigned" na fila.
+    Telefone repetido com a política reject levanta DuplicateLeadError (quem chama faz rollback).
+    Compartilhado pelas camadas síncrona e assíncrona (via run_sync).
+    """
+    original_id = find_original_lead(db, lead.phone)
+    if original_id is not None and policy == "reject":
+        raise dedup.DuplicateLeadError(original_id)
+    if original_id is not None and policy == "merge":
+        db_lead = db.get(models.Lead, original_id, with_for_update=True)
+        db_lead.observation = dedup.merge_observation(db_lead.observation, lead.observation)
+        return db_lead
+    row = {**lead.model_dump(), "indicador_id": indicador_id, "duplicate_of_id": original_id}
+    route_leads(db, [row])
+    db_lead = models.Lead(**row)
     db.add(db_lead)
+    # O id só existe depois do INSERT; o email ao vendedor vai na mesma transação
+    db.flush()
+    email_service.queue_lead_assigned_emails(db, models.Lead.id == db_lead.id)
+    return db_lead
+
+def create_lead(db: Session, lead: schemas.LeadCreate, indicador_id: int, policy: str = dedup.LEAD_DEDUP_POLICY):
+    try:
+        db_lead = prepare_lead(db, lead, indicador_id, policy)
+    except (dedup.DuplicateLeadError, routing.NoVendedorError):
+        db.rollback()
+        raise
     db.commit()
     db.refresh(db_lead)
     return db_lead
 
-def get_all_leads(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Lead).offset(skip).limit(limit).all()
+def _insert_leads(db: Session, rows: list) -> list:
+    # (id, vendedor_id) na mesma ordem de `rows`
+    if not rows:
+        return []
+    return db.execute(
+        insert(models.Lead).returning(models.Lead.id, models.Lead.vendedor_id, sort_by_parameter_order=True), rows
+    ).all()
+
+def _merge_observations(db: Session, merges: dict) -> list:
+    """
+    Acrescenta as observações de `merges` (id do original -> observações recebidas) aos
+    leads originais. Retorna as alterações para o log.
+    """
+    lead = models.Lead
+    updates, changes = [], []
+    for lead_id, observation, vendedor_id, indicador_id in db.execute(
+        select(lead.id, lead.observation, lead.vendedor_id, lead.indicador_id)
+        .where(lead.id.in_(merges)).order_by(lead.id).with_for_update()
+    ):
+        merged = observation
+        for new_observation in merges[lead_id]:
+            merged = dedup.merge_observation(merged, new_observation)
+        if merged != observation:
+            updates.append({"lead_id": lead_id, "merged_observation": merged})
+            changes.append({"lead_id": lead_id, "operation": models.ChangeOperation.UPDATE, "vendedor_id": vendedor_id, "indicador_id": indicador_id})
+    if updates:
+        db.execute(
+            update(lead.__table__).where(lead.id == bindparam("lead_id"))
+            .values(observation=bindparam("merged_observation"), updated_at=func.now()),
+            updates,
+        )
+        search.reindex_leads(db.connection(), lead.id.in_([u["lead_id"] for u in updates]))
+    return changes
+
+def bulk_create_leads(db: Session, leads, indicador_id: int, policy: str = dedup.LEAD_DEDUP_POLICY) -> list:
+    """
+    Insere vários leads com executemany e faz commit (uma transação por chamada).
+    Telefones já cadastrados ou repetidos no lote seguem `policy` (ver dedup). Retorna,
+    para cada lead, (resultado, id): "created"/"flagged" com o id do novo lead,
+    "merged"/"rejected" com o id do original.
+    """
+    rows = [
+        {**lead.model_dump(), "indicador_id": indicador_id, "phone_normalized": dedup.normalize_phone(lead.phone), "duplicate_of_id": None}
+        for lead in leads
+    ]
+    phones = {row["phone_normalized"] for row in rows if row["phone_normalized"]}
+    dedup.lock_phones(db.connection(), phones)
+    originals = dict(db.execute(dedup.originals_statement(phones)).all()) if phones else {}
+
+    results = [None] * len(rows)
+    first_in_batch = {}
+    new = []
+    # Duplicados de um lead do próprio lote: (índice, índice do primeiro, resultado)
+    repeated = []
+    merges = defaultdict(list)
+    for i, row in enumerate(rows):
+        phone = row["phone_normalized"]
+        original = originals.get(phone)
+        first = first_in_batch.get(phone)
+        if original is None and first is None:
+            if phone:
+                first_in_batch[phone] = i
+            new.append(i)
+        elif original is not None:
+            if policy == "flag":
+                row["duplicate_of_id"] = original
+                new.append(i)
+            else:
+                results[i] = ("merged" if policy == "merge" else "rejected", original)
+                if policy == "merge":
+                    merges[original].append(row["observation"])
+        else:
+            if policy == "merge":
+                rows[first]["observation"] = dedup.merge_observation(rows[first]["observation"], row["observation"])
+            repeated.append((i, first, {"flag": "flagged", "merge": "merged"}.get(policy, "rejected")))
 
-def get_indicador_leads(db: Session, indicador_id: int):
-    return db.query(models.Lead).filter(models.Lead.indicador_id == indicador_id).all()
+    flagged = [(i, first) for i, first, result in repeated if result == "flagged"]
+    route_leads(db, [rows[i] for i in new] + [rows[i] for i, _ in flagged])
+    created = _insert_leads(db, [rows[i] for i in new])
+    lead_ids = {i: lead_id for i, (lead_id, _) in zip(new, created)}
+    for i, first in flagged:
+        rows[i]["duplicate_of_id"] = lead_ids[first]
+    flagged_created = _insert_leads(db, [rows[i] for i, _ in flagged])
+    lead_ids.update((i, lead_id) for (i, _), (lead_id, _) in zip(flagged, flagged_created))
+    created += flagged_created
 
-def get_vendedor_leads(db: Session, vendedor_id: int):
-    return db.query(models.Lead).filter(models.Lead.vendedor_id == vendedor_id).all()
+    for i, lead_id in lead_ids.items():
+        results[i] = ("flagged" if rows[i]["duplicate_of_id"] is not None else "created", lead_id)
+    for i, first, result in repeated:
+        if result != "flagged":
+            results[i] = (result, lead_ids[first])
+
+    changes = _merge_observations(db, merges) if merges else []
+    if created:
+        created_ids = models.Lead.id.in_([lead_id for lead_id, _ in created])
+        rollups.add_leads(db.connection(), created_ids)
+        record_lead_creations(db.connection(), created_ids)
+        search.index_leads(db.connection(), created_ids)
+        email_service.queue_lead_assigned_emails(db, created_ids)
+        for _, vendedor_id in created:
+            routing.track(db, vendedor_id, models.LeadStatus.NOVO)
+        changes += [
+            {"lead_id": lead_id, "operation": models.ChangeOperation.INSERT, "vendedor_id": vendedor_id, "indicador_id": indicador_id}
+            for lead_id, vendedor_id in created
+        ]
+    record_lead_changes(db.connection(), changes, db)
+    db.commit()
+    return results
+
+# Colunas de LeadResponse, lidas como tuplas na listagem e na exportação
+LEAD_COLUMNS = (
+    models.Lead.id, models.Lead.client_name, models.Lead.phone, models.Lead.city_state,
+    models.Lead.observation, models.Lead.status, models.Lead.indicador_id, models.Lead.vendedor_id,
+    models.Lead.created_at, models.Lead.updated_at, models.Lead.duplicate_of_id,
+)
+
+def encode_cursor(lead: models.Lead) -> str:
+    raw = f"{lead.created_at.isoformat()}|{lead.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, lead_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(lead_id)
+    except ValueError as e:
+        raise ValueError("Cursor inválido") from e
+
+def leads_page_statement(
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    indicador_id: Optional[int] = None,
+    vendedor_id: Optional[int] = None,
+    columns=None,
+):
+    """
+    SELECT de uma página por cursor (keyset) em (created_at, id), do lead mais recente
+    para o mais antigo. Busca limit + 1 linhas para saber se há próxima página.
+    Com `columns`, seleciona tuplas em vez de entidades ORM.
+    Usado pela camada assíncrona (async_database) e pelos benchmarks.
+    """
+    statement = select(*columns) if columns else select(models.Lead)
+    if indicador_id is not None:
+        statement = statement.where(models.Lead.indicador_id == indicador_id)
+    if vendedor_id is not None:
+        statement = statement.where(models.Lead.vendedor_id == vendedor_id)
+    if cursor:
+        created_at, lead_id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            models.Lead.created_at < created_at,
+            and_(models.Lead.created_at == created_at, models.Lead.id < lead_id),
+        ))
+    return statement.order_by(models.Lead.created_at.desc(), models.Lead.id.desc()).limit(limit + 1)
+
+def split_page(leads, limit: int):
+    """Retorna os leads da página e o cursor da próxima página (None na última)"""
+    next_cursor = encode_cursor(leads[limit - 1]) if len(leads) > limit else None
+    return leads[:limit], next_cursor
+
+def encode_changes_token(txid: int, seq: int) -> str:
+    raw = f"{txid}|{seq}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_changes_token(token: str):
+    try:
+        txid, seq = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8").split("|")
+        return int(txid), int(seq)
+    except ValueError as e:
+        raise ValueError("Token inválido") from e
+
+def lead_changes_statement(since, limit: int, vendedor_id: Optional[int] = None, indicador_id: Optional[int] = None, dialect_name: str = "sqlite"):
+    """
+    Alterações depois de `since` ((txid, seq) ou None), em ordem; busca limit + 1 para saber
+    se há mais. No PostgreSQL, seq é reservado no INSERT mas só fica visível no commit, fora
+    de ordem: a leitura para antes da transação ativa mais antiga (xmin do snapshot), e o
+    que ainda não foi confirmado entra no próximo pedido, com txid maior que o token. No
+    SQLite há um único escritor e seq fica visível na ordem de commit (txid é sempre 0).
+    """
+    change = models.LeadChange
+    statement = select(change.txid, change.seq, change.lead_id, change.operation)
+    if since is not None:
+        txid, seq = since
+        statement = statement.where(or_(change.txid > txid, and_(change.txid == txid, change.seq > seq)))
+    if dialect_name == "postgresql":
+        statement = statement.where(change.txid < cast(cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), Text), BigInteger))
+    if vendedor_id is not None:
+        statement = statement.where(change.vendedor_id == vendedor_id)
+    if indicador_id is not None:
+        statement = statement.where(change.indicador_id == indicador_id)
+    return statement.order_by(change.txid, change.seq).limit(limit + 1)
+
+def latest_operations(changes) -> dict:
+    """Compacta o log: só a última operação de cada lead importa para o cliente"""
+    latest = {}
+    for _, _, lead_id, operation in changes:
+        latest[lead_id] = operation
+    return latest
+
+def _filter_leads(query, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    if start_date:
+        query = query.filter(models.Lead.created_at >= datetime.combine(start_date, time.min))
+    if end_date:
+        query = query.filter(models.Lead.created_at < datetime.combine(end_date + timedelta(days=1), time.min))
+    if vendedor_id:
+        query = query.filter(models.Lead.vendedor_id == vendedor_id)
+    return query
+
+def _filter_daily_counts(query, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    # Mesmo recorte de _filter_leads, sobre o rollup diário
+    if start_date:
+        query = query.filter(models.LeadDailyCount.day >= start_date)
+    if end_date:
+        query = query.filter(models.LeadDailyCount.day <= end_date)
+    if vendedor_id:
+        query = query.filter(models.LeadDailyCount.vendedor_id == vendedor_id)
+    return query
+
+def get_leads_per_day(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    dia = models.LeadDailyCount.day
+    total = func.sum(models.LeadDailyCount.total)
+    query = _filter_daily_counts(db.query(dia.label("dia"), total.label("total")), start_date, end_date, vendedor_id)
+    return query.group_by(dia).having(total > 0).order_by(dia).all()
+
+def get_lead_status_counts(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    total = func.sum(models.LeadDailyCount.total)
+    query = _filter_daily_counts(db.query(models.LeadDailyCount.status, total), start_date, end_date, vendedor_id)
+    return dict(query.group_by(models.LeadDailyCount.status).having(total > 0).all())
+
+def get_lead_rankings(db: Session, dimension: str, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    Linhas (id, nome, leads, fechados, perdidos) por vendedor ou indicador (`dimension`
+    é "vendedor_id" ou "indicador_id"), somadas no rollup diário. Filtros pela criação.
+    """
+    counts = models.LeadDailyCount
+    user_id = getattr(counts, dimension)
+    total = func.sum(counts.total)
+
+    def with_status(status):
+        return func.sum(case((counts.status == status, counts.total), else_=0))
+
+    query = db.query(user_id, models.User.name, total, with_status(models.LeadStatus.FECHADO), with_status(models.LeadStatus.PERDIDO))
+    query = _filter_daily_counts(query.join(models.User, models.User.id == user_id), start_date, end_date)
+    return query.group_by(user_id, models.User.name).having(total > 0).all()
+
+def get_time_to_close(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    """Média, por vendedor, dos segundos entre a criação e o fechamento dos leads criados no período"""
+    history = models.LeadStatusChange
+    seconds = seconds_between(db.get_bind().dialect.name, models.Lead.created_at, history.changed_at)
+    query = (
+        db.query(models.Lead.vendedor_id, func.avg(seconds))
+        .join(history, history.lead_id == models.Lead.id)
+        .filter(history.to_status == models.LeadStatus.FECHADO)
+    )
+    return dict(_filter_leads(query, start_date, end_date).group_by(models.Lead.vendedor_id).all())
+
+# Etapas do funil, em ordem; "perdido" sai do funil a partir de qualquer etapa
+FUNNEL_STAGES = (
+    models.LeadStatus.NOVO,
+    models.LeadStatus.EM_CONTATO,
+    models.LeadStatus.EM_NEGOCIACAO,
+    models.LeadStatus.FECHADO,
+)
+
+def get_funnel_reach(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    """
+    Linhas (vendedor_id, etapas, leads): `etapas` é a máscara das etapas que o lead de fato
+    registrou no histórico de status (bit i = FUNNEL_STAGES[i]). Etapas puladas (novo direto
+    para fechado, PATCH /leads/bulk-status, histórico aproximado da migração 007) não contam.
+    Filtros pela criação do lead.
+    """
+    history = models.LeadStatusChange
+    bit = case(*((history.to_status == status, 1 << index) for index, status in enumerate(FUNNEL_STAGES)), else_=0)
+    # Soma dos bits distintos = OR das etapas do lead
+    per_lead = select(models.Lead.vendedor_id, func.sum(bit.distinct()).label("stages")).join(history, history.lead_id == models.Lead.id)
+    per_lead = _filter_leads(per_lead, start_date, end_date, vendedor_id).group_by(models.Lead.id, models.Lead.vendedor_id).subquery()
+    return db.execute(
+        select(per_lead.c.vendedor_id, per_lead.c.stages, func.count()).group_by(per_lead.c.vendedor_id, per_lead.c.stages)
+    ).all()
+
+def get_lost_by_stage(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    """Linhas (vendedor_id, etapa de origem, leads) das transições para "perdido" """
+    history = models.LeadStatusChange
+    statement = (
+        select(models.Lead.vendedor_id, history.from_status, func.count(func.distinct(history.lead_id)))
+        .join(history, history.lead_id == models.Lead.id)
+        .where(history.to_status == models.LeadStatus.PERDIDO)
+    )
+    statement = _filter_leads(statement, start_date, end_date, vendedor_id)
+    return db.execute(statement.group_by(models.Lead.vendedor_id, history.from_status)).all()
+
+def get_stage_durations(db: Session, start_date: Optional[date] = None, end_date: Optional[date] = None, vendedor_id: Optional[int] = None):
+    """
+    Linhas (vendedor_id, etapa, segundos) das etapas já encerradas, com a etapa como
+    índice em models.LeadStatus (colunas inteiras, prontas para numpy). Filtros pela
+    data de entrada na etapa.
+    """
+    history = models.LeadStatusChange
+    stage = case(*((history.to_status == status, index) for index, status in enumerate(models.LeadStatus)))
+    statement = select(history.vendedor_id, stage, history.seconds_in_stage).where(history.seconds_in_stage.isnot(None))
+    if start_date:
+        statement = statement.where(history.changed_at >= datetime.combine(start_date, time.min))
+    if end_date:
+        statement = statement.where(history.changed_at < datetime.combine(end_date + timedelta(days=1), time.min))
+    if vendedor_id:
+        statement = statement.where(history.vendedor_id == vendedor_id)
+    # Pela Connection (Core): sem o processamento de linhas da Session, que domina o tempo aqui
+    return db.connection().execute(statement)
+
+def iter_leads_for_export(
+    db: Session,
+    chunk_size: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[models.LeadStatus] = None,
+    vendedor_id: Optional[int] = None,
+    indicador_id: Optional[int] = None,
+):
+    """
+    Gera lotes de tuplas (colunas de LEAD_COLUMNS) lidos com cursor do lado do
+    servidor, sem montar objetos ORM nem carregar o resultado inteiro.
+    """
+    query = _filter_leads(select(*LEAD_COLUMNS), start_date, end_date, vendedor_id)
+    if status is not None:
+        query = query.filter(models.Lead.status == status)
+    if indicador_id is not None:
+        query = query.filter(models.Lead.indicador_id == indicador_id)
+    query = query.order_by(models.Lead.id).execution_options(stream_results=True, yield_per=chunk_size)
+    yield from db.execute(query).partitions()
 
 def update_lead_status(db: Session, lead_id: int, lead_update: schemas.LeadUpdate):
     db_lead = db.query(models.Lead).filter(models.Lead.id == lead_id).first()
     if not db_lead:
         return None
     
-    for field, value in lead_update.dict(exclude_unset=True).items():
+    email_service.queue_lead_status_changed_emails(db, models.Lead.id == lead_id, lead_update.status)
+    for field, value in lead_update.model_dump(exclude_unset=True).items():
         setattr(db_lead, field, value)
     
     db.commit()
     db.refresh(db_lead)
     return db_lead
 
+def bulk_update_lead_status(db: Session, update: schemas.LeadBulkStatusUpdate, vendedor_id: Optional[int] = None) -> int:
+    """
+    Aplica status (e observação, se enviada) a uma lista de ids e/ou a um filtro
+    em um único UPDATE. Com os dois, valem só os ids que atendem ao filtro; `vendedor_id`
+    restringe aos leads do vendedor. Lista vazia é recusada no schema (min_length=1).
+    """
+    query = db.query(models.Lead)
+    if update.ids is not None:
+        query = query.filter(models.Lead.id.in_(update.ids))
+    if update.filter is not None:
+        criteria = update.filter
+        query = _filter_leads(query, criteria.start_date, criteria.end_date, criteria.vendedor_id)
+        if criteria.status is not None:
+            query = query.filter(models.Lead.status == criteria.status)
+        if criteria.indicador_id is not None:
+            query = query.filter(models.Lead.indicador_id == criteria.indicador_id)
+    if vendedor_id is not None:
+        query = query.filter(models.Lead.vendedor_id == vendedor_id)
+    
+    affected = query.whereclause if query.whereclause is not None else true()
+    lock_lead_rows(db.connection(), affected)
+    # Contagens atuais dos leads afetados: saem do status antigo e entram no novo no rollup
+    deltas = defaultdict(int)
+    for day, status, lead_vendedor_id, indicador_id, total in db.execute(rollups.lead_groups_statement(query.whereclause)):
+        deltas[(day, status, lead_vendedor_id, indicador_id)] -= total
+        deltas[(day, update.status, lead_vendedor_id, indicador_id)] += total
+    record_status_transitions(db.connection(), affected, update.status)
+    email_service.queue_lead_status_changed_emails(db, affected, update.status)
+    if update.observation is not None:
+        search.set_observation(db.connection(), affected, update.observation)
+
+    values = {models.Lead.status: update.status}
+    if update.observation is not None:
+        values[models.Lead.observation] = update.observation
+    # RETURNING traz os leads alterados para o log de /leads/changes no mesmo UPDATE
+    statement = models.Lead.__table__.update().values(values).returning(
+        models.Lead.id, models.Lead.vendedor_id, models.Lead.indicador_id
+    )
+    if query.whereclause is not None:
+        statement = statement.where(query.whereclause)
+    updated = db.execute(statement).all()
+    rollups.apply_deltas(db.connection(), deltas)
+    for (_, status, lead_vendedor_id, _), total in deltas.items():
+        routing.track(db, lead_vendedor_id, status, total)
+    if updated:
+        record_lead_changes(db.connection(), [
+            {"lead_id": lead_id, "operation": models.ChangeOperation.UPDATE, "vendedor_id": lead_vendedor_id, "indicador_id": indicador_id}
+            for lead_id, lead_vendedor_id, indicador_id in updated
+        ], db)
+    db.commit()
+    return len(updated)
+
 def get_all_users(db: Session):
     return db.query(models.User).all()
 
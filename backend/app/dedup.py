@@ -0,0 +1,154 @@
+"""
+Telefones normalizados (leads.phone_normalized: DDD + número, só dígitos) e detecção de
+leads duplicados na criação. A política vem de LEAD_DEDUP_POLICY:
+
+- reject: recusa o lead (409 na criação; erro na linha na importação em massa)
+- merge: não cria; acrescenta a observação ao lead já cadastrado e o retorna
+- flag: cria o lead com duplicate_of_id apontando para o já cadastrado
+
+O lead "original" de um telefone é o mais antigo (menor id) com o mesmo phone_normalized.
+
+Varredura dos leads existentes (relatório; com --apply grava phone_normalized e duplicate_of_id):
+    python -m app.dedup scan [--apply]
+"""
+from sqlalchemy import bindparam, false, func, select, update
+from typing import Optional
+import os
+import re
+import zlib
+from . import models
+
+DEDUP_POLICIES = ("reject", "merge", "flag")
+LEAD_DEDUP_POLICY = os.getenv("LEAD_DEDUP_POLICY", "flag")
+DEDUP_SCAN_CHUNK_SIZE = int(os.getenv("DEDUP_SCAN_CHUNK_SIZE", "10000"))
+# Travas consultivas do PostgreSQL por telefone: o telefone cai em uma de N faixas
+DEDUP_LOCK_STRIPES = int(os.getenv("LEAD_DEDUP_LOCK_STRIPES", "256"))
+DEDUP_LOCK_KEY = 7_240_302
+
+if LEAD_DEDUP_POLICY not in DEDUP_POLICIES:
+    raise ValueError(f"LEAD_DEDUP_POLICY deve ser um de {', '.join(DEDUP_POLICIES)}")
+
+NON_DIGITS = re.compile(r"\D")
+
+class DuplicateLeadError(Exception):
+    def __init__(self, lead_id: int):
+        self.lead_id = lead_id
+        super().__init__(f"Telefone já cadastrado no lead {lead_id}")
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """
+    DDD + número, só dígitos: "(11) 98765-4321", "+55 11 98765-4321" e "011 98765 4321"
+    viram "11987654321". Celular antigo sem o nono dígito ("(11) 8765-4321") ganha o 9.
+    Números fora desse formato ficam só com os dígitos; sem dígitos, None.
+    """
+    digits = NON_DIGITS.sub("", phone or "")
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        digits = digits[2:]
+    elif len(digits) in (11, 12) and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10 and digits[2] in "6789":
+        digits = digits[:2] + "9" + digits[2:]
+    return digits or None
+
+def merge_observation(current: Optional[str], new: Optional[str]) -> Optional[str]:
+    """Observação do lead original após um merge: a nova vira uma linha a mais, se ainda não houver"""
+    if not new or (current and new in current.split("\n")):
+        return current
+    return f"{current}\n{new}" if current else new
+
+def lock_phones(connection, phones):
+    """
+    Trava até o commit os telefones (normalizados) que vão ser procurados e gravados, para
+    que duas transações não criem dois "originais" do mesmo telefone. No PostgreSQL, uma
+    trava consultiva por faixa, em ordem (sem deadlock entre lotes); no SQLite, uma escrita
+    vazia abre a transação de escrita antes da busca, e o banco tem um único escritor.
+    """
+    if connection.dialect.name == "postgresql":
+        for stripe in sorted({zlib.crc32(phone.encode("utf-8")) % DEDUP_LOCK_STRIPES for phone in phones if phone}):
+            connection.execute(select(func.pg_advisory_xact_lock(DEDUP_LOCK_KEY, stripe)))
+    elif connection.dialect.name == "sqlite":
+        lead = models.Lead.__table__
+        connection.execute(update(lead).where(false()).values(id=lead.c.id))
+
+def originals_statement(phones):
+    """(phone_normalized, id do lead original) de cada telefone já cadastrado"""
+    lead = models.Lead
+    return (
+        select(lead.phone_normalized, func.min(lead.id))
+        .where(lead.phone_normalized.in_(phones))
+        .group_by(lead.phone_normalized)
+    )
+
+def scan(connection, flag: bool = True, chunk_size: int = DEDUP_SCAN_CHUNK_SIZE):
+    """
+    Percorre todos os leads uma vez, em ordem de id, e retorna (alterações, estatísticas).
+    O primeiro lead de cada telefone é o original; os seguintes são duplicados dele. Um
+    dicionário telefone -> original resolve cada lead em O(1), sem comparar pares.
+    Com flag=False só corrige phone_normalized.
+    """
+    lead = models.Lead
+    rows = connection.execution_options(yield_per=chunk_size).execute(
+        select(lead.id, lead.phone, lead.phone_normalized, lead.duplicate_of_id, lead.vendedor_id, lead.indicador_id)
+        .order_by(lead.id)
+    )
+    originals = {}
+    changes = []
+    stats = {"leads": 0, "duplicates": 0}
+    for lead_id, phone, phone_normalized, duplicate_of_id, vendedor_id, indicador_id in rows:
+        stats["leads"] += 1
+        normalized = normalize_phone(phone)
+        original = originals.setdefault(normalized, lead_id) if normalized else lead_id
+        if original != lead_id:
+            stats["duplicates"] += 1
+        if not flag:
+            original, duplicate_of_id = lead_id, None
+        target = original if original != lead_id else None
+        if normalized != phone_normalized or target != duplicate_of_id:
+            changes.append({
+                "lead_id": lead_id, "normalized": normalized, "original_id": target,
+                "flag_changed": target != duplicate_of_id, "vendedor_id": vendedor_id, "indicador_id": indicador_id,
+            })
+    stats["phones"] = len(originals)
+    stats["changes"] = len(changes)
+    return changes, stats
+
+def apply(connection, changes: list, flag: bool = True, chunk_size: int = DEDUP_SCAN_CHUNK_SIZE):
+    """Grava as alterações de scan em lotes (executemany)"""
+    values = {"phone_normalized": bindparam("normalized")}
+    if flag:
+        values["duplicate_of_id"] = bindparam("original_id")
+    statement = update(models.Lead.__table__).where(models.Lead.id == bindparam("lead_id")).values(values)
+    for start in range(0, len(changes), chunk_size):
+        connection.execute(statement, changes[start:start + chunk_size])
+
+def main():
+    import argparse
+    import time
+    from . import database
+
+    parser = argparse.ArgumentParser(description="Varredura de leads duplicados por telefone")
+    parser.add_argument("command", choices=["scan"])
+    parser.add_argument("--apply", action="store_true", help="grava phone_normalized e duplicate_of_id")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with database.engine.begin() as conn:
+        if args.apply:
+            # Trava de manutenção: nenhuma escrita em leads durante a varredura
+            database.lock_leads(conn)
+        changes, stats = scan(conn)
+        if args.apply:
+            apply(conn, changes)
+            database.record_lead_changes(conn, [
+                {"lead_id": c["lead_id"], "operation": models.ChangeOperation.UPDATE,
+                 "vendedor_id": c["vendedor_id"], "indicador_id": c["indicador_id"]}
+                for c in changes if c["flag_changed"]
+            ])
+    print(
+        f"{stats['leads']} leads, {stats['phones']} telefones, {stats['duplicates']} duplicados; "
+        f"{stats['changes']} alterações {'gravadas' if args.apply else 'pendentes (use --apply)'} "
+        f"em {time.perf_counter() - start:.1f} s"
+    )
+
+if __name__ == "__main__":
+    main()
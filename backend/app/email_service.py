@@ -1,105 +1,367 @@
-
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from datetime import datetime, timedelta, timezone
+from string import Template
+from threading import Event, Thread
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session, aliased
+import html
+import json
 import os
+import time
 from typing import Optional
+from . import models, metrics
+
+# Configurações do servidor SMTP (usando variáveis de ambiente)
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.smtp2go.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "2525"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+SMTP_IDLE_SECONDS = float(os.getenv("SMTP_IDLE_SECONDS", "60"))
+SENDER_EMAIL = os.getenv("SENDER_EMAIL", "noreply@indicavende.com")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD", "kjcd5588J#")
+
+# Fila de envio (tabela email_outbox)
+EMAIL_WORKER_ENABLED = os.getenv("EMAIL_WORKER_ENABLED", "true").lower() == "true"
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "8"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "3600"))
+# Tempo de posse de um email em envio; depois disso outro worker pode retomá-lo
+EMAIL_LEASE_SECONDS = float(os.getenv("EMAIL_LEASE_SECONDS", "300"))
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates", "email")
+APP_URL = os.getenv("APP_URL", "https://indicavende.replit.app")
+
+EMAIL_SUBJECTS = {
+    "welcome": "Parabéns! Você criou uma conta na IndicaVende",
+    "lead_assigned": "Novo lead para você: $client_name",
+    "lead_status_changed": "Seu lead $client_name agora está: $status_label",
+}
+
+STATUS_LABELS = {
+    models.LeadStatus.NOVO: "Novo",
+    models.LeadStatus.EM_CONTATO: "Em Contato",
+    models.LeadStatus.EM_NEGOCIACAO: "Em Negociação",
+    models.LeadStatus.FECHADO: "Fechado",
+    models.LeadStatus.PERDIDO: "Perdido",
+}
+
+class EmailTemplate:
+    """Assunto, texto e HTML de um tipo de email, compilados uma única vez"""
+
+    def __init__(self, kind: str, subject: str, text: str, html: str):
+        self.kind = kind
+        self.subject = Template(subject)
+        self.text = Template(text)
+        self.html = Template(html)
 
-def send_welcome_email(user_email: str, user_name: str) -> bool:
+    def render(self, context: dict):
+        escaped = {key: html.escape(str(value)) for key, value in context.items()}
+        return (
+            self.subject.substitute(context),
+            self.text.substitute(context),
+            self.html.substitute(escaped),
+        )
+
+def load_templates(directory: str = TEMPLATES_DIR, app_url: str = APP_URL) -> dict:
+    def read(name):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            return f.read()
+
+    # Layout e campos fixos são aplicados na carga: cada envio só substitui os campos do
+    # destinatário e monta as próprias partes MIME
+    layout = read("_layout.html")
+    text_fields = {"app_url": app_url}
+    html_fields = {"app_url": html.escape(app_url)}
+    return {
+        kind: EmailTemplate(
+            kind,
+            subject,
+            Template(read(f"{kind}.txt")).safe_substitute(text_fields),
+            Template(layout.replace("$content", read(f"{kind}.html"))).safe_substitute(html_fields),
+        )
+        for kind, subject in EMAIL_SUBJECTS.items()
+    }
+
+TEMPLATES = load_templates()
+
+def build_message(kind: str, recipient: str, context: dict) -> MIMEMultipart:
+    subject, text_content, html_content = TEMPLATES[kind].render(context)
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = SENDER_EMAIL
+    message["To"] = recipient
+    message.attach(MIMEText(text_content, "plain", "utf-8"))
+    message.attach(MIMEText(html_content, "html", "utf-8"))
+    return message
+
+def queue_email(db: Session, kind: str, recipient: str, context: dict) -> models.EmailOutbox:
     """
-    Envia email de boas-vindas para novo usuário
+    Grava o email na fila (tabela email_outbox) na mesma transação da sessão;
+    o envio acontece depois, no EmailDispatcher (acordado no commit). Não faz commit.
     """
-    try:
-        # Configurações do servidor SMTP (usando variáveis de ambiente)
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.smtp2go.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "2525"))
-        sender_email = os.getenv("SENDER_EMAIL", "noreply@indicavende.com")
-        sender_password = os.getenv("SENDER_PASSWORD", "kjcd5588J#")
-        
-        # Se não houver configuração de email, não envia (modo desenvolvimento)
-        if not sender_email or not sender_password:
-            print(f"⚠️ Email não configurado. Email que seria enviado para: {user_email}")
-            return True
-        
-        # Criar mensagem
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Parabéns! Você criou uma conta na IndicaVende"
-        message["From"] = sender_email
-        message["To"] = user_email
-        
-        # Corpo do email em HTML
-        html_content = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                    <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 30px; text-align: center; border-radius: 10px 10px 0 0;">
-                        <h1 style="color: white; margin: 0;">🚀 IndicaVende</h1>
-                    </div>
-                    
-                    <div style="background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px;">
-                        <h2 style="color: #667eea;">Parabéns, {user_name}!</h2>
-                        
-                        <p>Você criou uma conta na plataforma <strong>IndicaVende</strong>! 🎉</p>
-                        
-                        <p>Estamos muito felizes em ter você conosco. Agora você pode:</p>
-                        
-                        <ul style="background: white; padding: 20px; border-left: 4px solid #667eea; border-radius: 5px;">
-                            <li>✅ Gerenciar seus leads de forma eficiente</li>
-                            <li>✅ Acompanhar suas vendas em tempo real</li>
-                            <li>✅ Aumentar sua produtividade com nosso dashboard</li>
-                        </ul>
-                        
-                        <p>Acesse agora mesmo e comece a transformar suas indicações em resultados!</p>
-                        
-                        <div style="text-align: center; margin: 30px 0;">
-                            <a href="https://indicavende.replit.app" 
-                               style="background: #667eea; color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; display: inline-block;">
-                                Acessar Plataforma
-                            </a>
-                        </div>
-                        
-                        <p style="color: #666; font-size: 14px; margin-top: 30px; border-top: 1px solid #ddd; padding-top: 20px;">
-                            Se você tiver alguma dúvida, estamos aqui para ajudar!<br>
-                            Equipe IndicaVende
-                        </p>
-                    </div>
-                </div>
-            </body>
-        </html>
-        """
-        
-        # Versão em texto simples (fallback)
-        text_content = f"""
-        Parabéns, {user_name}!
-        
-        Você criou uma conta na plataforma IndicaVende! 🎉
-        
-        Estamos muito felizes em ter você conosco. Agora você pode:
-        
-        ✅ Gerenciar seus leads de forma eficiente
-        ✅ Acompanhar suas vendas em tempo real
-        ✅ Aumentar sua produtividade com nosso dashboard
-        
-        Acesse agora mesmo e comece a transformar suas indicações em resultados!
-        
-        Equipe IndicaVende
-        """
-        
-        # Adicionar partes do email
-        part1 = MIMEText(text_content, "plain")
-        part2 = MIMEText(html_content, "html")
-        message.attach(part1)
-        message.attach(part2)
-        
-        # Enviar email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+    if kind not in TEMPLATES:
+        raise ValueError(f"Tipo de email desconhecido: {kind}")
+    email = models.EmailOutbox(kind=kind, recipient=recipient, context=json.dumps(context))
+    db.add(email)
+    db.info["emails_queued"] = True
+    return email
+
+def _queue_emails(db: Session, kind: str, emails: list) -> int:
+    # [(destinatário, contexto)] em um único INSERT (executemany)
+    if emails:
+        db.execute(insert(models.EmailOutbox), [
+            {"kind": kind, "recipient": recipient, "context": json.dumps(context)} for recipient, context in emails
+        ])
+        db.info["emails_queued"] = True
+    return len(emails)
+
+def queue_welcome_email(db: Session, user_email: str, user_name: str) -> models.EmailOutbox:
+    return queue_email(db, "welcome", user_email, {"user_name": user_name})
+
+def queue_lead_assigned_emails(db: Session, where) -> int:
+    """
+    Enfileira um "lead_assigned" para o vendedor de cada lead de `where`, já gravados na
+    transação. Vendedor e indicador vêm de um JOIN por id: as relationships de Lead são
+    lazy e não carregam na sessão assíncrona (run_sync).
+    """
+    lead = models.Lead
+    vendedor, indicador = aliased(models.User), aliased(models.User)
+    rows = db.execute(
+        select(vendedor.email, vendedor.name, indicador.name, lead.client_name, lead.phone, lead.city_state, lead.observation)
+        .select_from(lead)
+        .join(vendedor, vendedor.id == lead.vendedor_id)
+        .join(indicador, indicador.id == lead.indicador_id)
+        .where(where)
+        .order_by(lead.id)
+    )
+    return _queue_emails(db, "lead_assigned", [
+        (vendedor_email, {
+            "vendedor_name": vendedor_name,
+            "indicador_name": indicador_name,
+            "client_name": client_name,
+            "phone": phone,
+            "city_state": city_state,
+            "observation": observation or "Nenhuma",
+        })
+        for vendedor_email, vendedor_name, indicador_name, client_name, phone, city_state, observation in rows
+    ])
+
+def queue_lead_status_changed_emails(db: Session, where, status: models.LeadStatus) -> int:
+    """
+    Enfileira um "lead_status_changed" para o indicador de cada lead de `where` que vai
+    mudar para `status`. Chamar antes do UPDATE, enquanto o banco tem o status anterior.
+    """
+    lead = models.Lead
+    rows = db.execute(
+        select(models.User.email, models.User.name, lead.client_name, lead.status)
+        .select_from(lead)
+        .join(models.User, models.User.id == lead.indicador_id)
+        .where(where, lead.status != status)
+        .order_by(lead.id)
+    )
+    return _queue_emails(db, "lead_status_changed", [
+        (indicador_email, {
+            "indicador_name": indicador_name,
+            "client_name": client_name,
+            "old_status_label": STATUS_LABELS[old_status],
+            "status_label": STATUS_LABELS[status],
+        })
+        for indicador_email, indicador_name, client_name, old_status in rows
+    ])
+
+smtp_send_duration = metrics.Histogram("smtp_send_seconds", "Duração do envio de um email por SMTP", ("result",))
+
+class SMTPConnection:
+    """Conexão SMTP reaproveitada entre envios; reconecta se o servidor fechar"""
+
+    def __init__(self, host: str = SMTP_SERVER, port: int = SMTP_PORT, username: str = SENDER_EMAIL,
+                 password: str = SENDER_PASSWORD, use_tls: bool = SMTP_USE_TLS, timeout: float = SMTP_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.username and self.password)
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
             server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(message)
+        server.login(self.username, self.password)
+        return server
+
+    def send(self, message: MIMEMultipart):
+        # Se não houver configuração de email, não envia (modo desenvolvimento)
+        if not self.configured:
+            print(f"⚠️ Email não configurado. Email que seria enviado para: {message['To']}")
+            return
         
-        print(f"✅ Email de boas-vindas enviado para: {user_email}")
-        return True
+        start = time.perf_counter()
+        result = "error"
+        try:
+            for tentativa in range(2):
+                if self._server is None:
+                    self._server = self._connect()
+                try:
+                    self._server.send_message(message)
+                    self._last_used = time.monotonic()
+                    result = "sent"
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    # Conexão ociosa derrubada pelo servidor: reconecta uma vez
+                    self._server = None
+                    if tentativa:
+                        raise
+        finally:
+            # Inclui conexão, STARTTLS e login quando o envio precisou abrir a conexão
+            smtp_send_duration.observe(time.perf_counter() - start, result)
+
+    def close_if_idle(self, idle_seconds: float = SMTP_IDLE_SECONDS):
+        if self._server is not None and time.monotonic() - self._last_used > idle_seconds:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def retry_delay(attempts: int) -> timedelta:
+    """Backoff exponencial: base, 2x base, 4x base... limitado a EMAIL_RETRY_MAX_SECONDS"""
+    return timedelta(seconds=min(EMAIL_RETRY_BASE_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS))
+
+class EmailDispatcher:
+    """
+    Worker em background que esvazia a fila de emails em lotes, usando uma única
+    conexão SMTP. Falhas são reagendadas com backoff exponencial até EMAIL_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, session_factory=None, connection: SMTPConnection = None,
+                 batch_size: int = EMAIL_BATCH_SIZE, poll_seconds: float = EMAIL_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.connection = connection or SMTPConnection()
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wake = Event()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(target=self._run, name="email-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.connection.close()
+
+    def wake(self):
+        """Avisa o worker que há emails novos na fila"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                print(f"❌ Erro ao processar fila de emails: {str(e)}")
+                processed = 0
+            if processed < self.batch_size:
+                self.connection.close_if_idle()
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def _claim(self, db: Session) -> list:
+        now = _utcnow()
+        elegivel = (
+            models.EmailOutbox.status.in_([models.EmailStatus.PENDING, models.EmailStatus.SENDING]),
+            models.EmailOutbox.next_attempt_at <= now,
+        )
+        candidatos = [
+            email_id for (email_id,) in db.query(models.EmailOutbox.id)
+            .filter(*elegivel)
+            .order_by(models.EmailOutbox.next_attempt_at)
+            .limit(self.batch_size)
+        ]
+        claimed = []
+        for email_id in candidatos:
+            # UPDATE condicional: só um worker consegue reservar cada email
+            updated = db.query(models.EmailOutbox).filter(models.EmailOutbox.id == email_id, *elegivel).update({
+                models.EmailOutbox.status: models.EmailStatus.SENDING,
+                models.EmailOutbox.attempts: models.EmailOutbox.attempts + 1,
+                models.EmailOutbox.next_attempt_at: now + timedelta(seconds=EMAIL_LEASE_SECONDS),
+            }, synchronize_session=False)
+            if updated:
+                claimed.append(email_id)
+        db.commit()
+        return claimed
+
+    def process_batch(self) -> int:
+        """Envia um lote da fila; retorna quantos emails foram processados"""
+        if self.session_factory is None:
+            from .database import SessionLocal
+            self.session_factory = SessionLocal
         
-    except Exception as e:
-        print(f"❌ Erro ao enviar email: {str(e)}")
-        return False
+        db = self.session_factory()
+        try:
+            claimed = self._claim(db)
+            if not claimed:
+                return 0
+            emails = db.query(models.EmailOutbox).filter(models.EmailOutbox.id.in_(claimed)).all()
+            for email in emails:
+                try:
+                    self.connection.send(build_message(email.kind, email.recipient, json.loads(email.context)))
+                except Exception as e:
+                    self.connection.close()
+                    self._schedule_retry(email, e)
+                else:
+                    email.status = models.EmailStatus.SENT
+                    email.sent_at = _utcnow()
+                    email.last_error = None
+                    print(f"✅ Email '{email.kind}' enviado para: {email.recipient}")
+                # Commit por email: um envio concluído não é repetido se o worker cair no meio do lote
+                db.commit()
+            return len(emails)
+        finally:
+            db.close()
+
+    def _schedule_retry(self, email: models.EmailOutbox, error: Exception):
+        email.last_error = str(error)
+        if email.attempts >= EMAIL_MAX_ATTEMPTS:
+            email.status = models.EmailStatus.FAILED
+            print(f"❌ Email para {email.recipient} descartado após {email.attempts} tentativas: {error}")
+        else:
+            email.status = models.EmailStatus.PENDING
+            email.next_attempt_at = _utcnow() + retry_delay(email.attempts)
+            print(f"⚠️ Falha ao enviar email para {email.recipient} (tentativa {email.attempts}): {error}")
+
+dispatcher = EmailDispatcher()
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session):
+    if session.info.pop("emails_queued", False):
+        dispatcher.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_queued(session):
+    session.info.pop("emails_queued", None)
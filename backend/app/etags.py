@@ -0,0 +1,30 @@
+"""
+ETags das listagens (GET condicional). Derivados da versão do escopo em
+data_versions e dos parâmetros que mudam o corpo (usuário, cursor, filtros).
+"""
+from fastapi import Response
+from typing import Optional
+import hashlib
+
+# O cliente pode guardar a resposta, mas precisa revalidar a cada uso
+CACHE_CONTROL = "private, no-cache"
+
+def make_etag(version: int, *parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+    # Fraco: o mesmo conteúdo pode ser enviado com ou sem compressão
+    return f'W/"{version}-{digest}"'
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match (RFC 9110, 13.1.2)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+def set_headers(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
@@ -0,0 +1,138 @@
+"""
+Pub/sub em processo para os eventos de leads enviados por SSE (GET /events/leads).
+
+Os eventos são publicados depois do commit da sessão que gravou as alterações e
+entregues a cada assinante pela fila asyncio do seu loop. Com vários workers, cada
+um só vê as escritas feitas por ele; o cliente deve tratar o evento como um aviso
+para revalidar (os GETs com ETag tornam isso barato) e não como a única fonte.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+import asyncio
+import json
+import os
+from . import metrics
+
+EVENTS_MAX_QUEUE = int(os.getenv("EVENTS_MAX_QUEUE", "1000"))
+# Acima disso, um commit vira um único evento "leads_bulk_changed" por tópico
+EVENTS_MAX_PER_COMMIT = int(os.getenv("EVENTS_MAX_PER_COMMIT", "100"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Streams são encerrados periodicamente: o cliente reconecta (e reapresenta o token)
+# e o shutdown do uvicorn não fica esperando conexões eternas
+EVENTS_MAX_STREAM_SECONDS = float(os.getenv("EVENTS_MAX_STREAM_SECONDS", "300"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+
+EVENT_TYPES = {"insert": "lead_created", "update": "lead_updated", "delete": "lead_deleted"}
+
+ALL_LEADS_TOPIC = "leads"
+
+def vendedor_topic(vendedor_id: int) -> str:
+    return f"leads:vendedor:{vendedor_id}"
+
+def indicador_topic(indicador_id: int) -> str:
+    return f"leads:indicador:{indicador_id}"
+
+def topics_for_user(user) -> list:
+    if user.role == "gestor":
+        return [ALL_LEADS_TOPIC]
+    if user.role == "vendedor":
+        return [vendedor_topic(user.id)]
+    return [indicador_topic(user.id)]
+
+class _Subscriber:
+    def __init__(self, loop, max_queue: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Cliente lento: descarta o atraso e pede que recarregue tudo
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    def deliver(self, event):
+        # publish pode ser chamado de threads do threadpool
+        self.loop.call_soon_threadsafe(self._put, event)
+
+class EventBroker:
+    def __init__(self, max_queue: int = EVENTS_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._topics = defaultdict(set)
+        self._lock = Lock()
+
+    @contextmanager
+    def subscribe(self, topics):
+        """Registra uma fila no loop atual para os tópicos dados; use dentro da corrotina"""
+        subscriber = _Subscriber(asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            for topic in topics:
+                self._topics[topic].add(subscriber)
+        try:
+            yield subscriber.queue
+        finally:
+            with self._lock:
+                for topic in topics:
+                    self._topics[topic].discard(subscriber)
+                    if not self._topics[topic]:
+                        del self._topics[topic]
+
+    def publish(self, topics, event):
+        with self._lock:
+            subscribers = set().union(*(self._topics.get(topic, ()) for topic in topics))
+        for subscriber in subscribers:
+            subscriber.deliver(event)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(set().union(*self._topics.values())) if self._topics else 0
+
+    def publish_lead_changes(self, changes):
+        """Publica as alterações de um commit (dicts de lead_changes) nos tópicos de cada lead"""
+        if len(changes) > EVENTS_MAX_PER_COMMIT:
+            counts = defaultdict(int)
+            for change in changes:
+                for topic in _lead_topics(change):
+                    counts[topic] += 1
+            for topic, count in counts.items():
+                self.publish([topic], {"type": "leads_bulk_changed", "count": count})
+            return
+
+        for change in changes:
+            operation = getattr(change["operation"], "value", change["operation"])
+            self.publish(_lead_topics(change), {
+                "type": EVENT_TYPES[operation],
+                "lead_id": change["lead_id"],
+                "vendedor_id": change["vendedor_id"],
+                "indicador_id": change["indicador_id"],
+            })
+
+def _lead_topics(change) -> list:
+    return [ALL_LEADS_TOPIC, vendedor_topic(change["vendedor_id"]), indicador_topic(change["indicador_id"])]
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+broker = EventBroker()
+
+metrics.Gauge("sse_subscribers", "Conexões abertas em /events/leads", function=broker.subscriber_count)
+
+async def sse_stream(topics):
+    """Corpo de uma resposta text/event-stream com os eventos dos tópicos e keepalives"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENTS_MAX_STREAM_SECONDS
+    with broker.subscribe(topics) as queue:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(EVENTS_KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(event)
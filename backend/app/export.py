@@ -0,0 +1,109 @@
+from datetime import date, datetime
+from typing import Iterable, Iterator, Optional
+import csv
+import io
+import json
+import os
+from . import models, database
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_HEADER = [column.key for column in database.LEAD_COLUMNS]
+
+# O Starlette acrescenta "; charset=utf-8" aos tipos text/*
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _value(value):
+    if isinstance(value, models.LeadStatus):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def stream_csv(chunks: Iterable) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para o Excel reconhecer UTF-8
+    writer.writerow(EXPORT_HEADER)
+    yield ("﻿" + buffer.getvalue()).encode("utf-8")
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_value(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+def stream_ndjson(chunks: Iterable) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_HEADER, map(_value, row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Destino do ParquetWriter que acumula bytes e os entrega a cada row group"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def stream_parquet(chunks: Iterable) -> Iterator[bytes]:
+    # Dependência opcional: pyarrow
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("client_name", pa.string()), ("phone", pa.string()), ("city_state", pa.string()),
+        ("observation", pa.string()), ("status", pa.string()), ("indicador_id", pa.int64()), ("vendedor_id", pa.int64()),
+        ("created_at", pa.timestamp("s")), ("updated_at", pa.timestamp("s")), ("duplicate_of_id", pa.int64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        columns = list(zip(*rows))
+        columns[5] = [status.value if status is not None else None for status in columns[5]]
+        writer.write_table(pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+STREAMERS = {"csv": stream_csv, "ndjson": stream_ndjson, "parquet": stream_parquet}
+
+def export_leads(fmt: str, **filters) -> Iterator[bytes]:
+    """
+    Gera o arquivo de exportação em pedaços. Abre a própria sessão, pois o corpo
+    é enviado depois que o endpoint retorna.
+    """
+    db = database.SessionLocal()
+    try:
+        yield from STREAMERS[fmt](database.iter_leads_for_export(db, EXPORT_CHUNK_SIZE, **filters))
+    finally:
+        db.close()
+
+def export_filename(fmt: str, today: Optional[date] = None) -> str:
+    today = today or date.today()
+    return f"relatorio_leads_{today.strftime('%Y%m%d')}.{fmt}"
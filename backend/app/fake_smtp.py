@@ -0,0 +1,112 @@
+"""
+Servidor SMTP falso para desenvolvimento e testes: aceita qualquer login,
+não suporta STARTTLS e guarda as mensagens recebidas em memória. Com `failures`,
+recusa os próximos envios com um erro temporário (451).
+
+Uso local:
+    python -m app.fake_smtp --port 2525
+    SMTP_SERVER=localhost SMTP_PORT=2525 SMTP_USE_TLS=false uvicorn app.main:app
+"""
+from email import message_from_bytes
+from email.message import Message
+from threading import Lock, Thread
+from typing import List
+import argparse
+import socketserver
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode("utf-8"))
+
+    def handle(self):
+        self._reply("220 fake-smtp pronto")
+        for raw in self.rfile:
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250-fake-smtp")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self._reply("235 autenticado")
+            elif verb == "MAIL" and self.server.take_failure():
+                self._reply("451 falha temporária")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 fim com <CRLF>.<CRLF>")
+                self.server.store(self._read_data())
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 tchau")
+                return
+            else:
+                self._reply("502 comando não implementado")
+
+    def _read_data(self) -> bytes:
+        lines = []
+        for raw in self.rfile:
+            if raw in (b".\r\n", b".\n"):
+                break
+            # Remove o ponto de "dot-stuffing" (RFC 5321, 4.5.2)
+            lines.append(raw[1:] if raw.startswith(b"..") else raw)
+        return b"".join(lines)
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "localhost", port: int = 0, verbose: bool = False):
+        super().__init__((host, port), _SMTPHandler)
+        self.verbose = verbose
+        self.messages: List[Message] = []
+        # Envios a recusar com 451 (-1: todos)
+        self.failures = 0
+        self._lock = Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def take_failure(self) -> bool:
+        with self._lock:
+            if self.failures == 0:
+                return False
+            if self.failures > 0:
+                self.failures -= 1
+            return True
+
+    def store(self, data: bytes):
+        message = message_from_bytes(data)
+        with self._lock:
+            self.messages.append(message)
+        if self.verbose:
+            print(f"📨 {message['To']}: {message['Subject']}")
+
+    def start(self):
+        self._thread = Thread(target=self.serve_forever, name="fake-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor SMTP falso para desenvolvimento")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=2525)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, verbose=True)
+    print(f"Servidor SMTP falso em {args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
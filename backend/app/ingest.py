@@ -0,0 +1,189 @@
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from fastapi import Request
+from typing import Iterator, TextIO
+import csv
+import io
+import json
+import os
+import tempfile
+from . import schemas, database, routing
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_MAX_REPORTED_ERRORS = int(os.getenv("BULK_MAX_REPORTED_ERRORS", "1000"))
+# Uploads maiores que isso vão para disco enquanto são recebidos
+BULK_SPOOL_MAX_MEMORY = int(os.getenv("BULK_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+JSON_READ_CHUNK = 64 * 1024
+
+CONTENT_TYPES = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+def detect_format(content_type: str):
+    return CONTENT_TYPES.get((content_type or "").split(";")[0].strip().lower())
+
+async def spool_request(request: Request):
+    """Recebe o corpo em um arquivo temporário (memória até BULK_SPOOL_MAX_MEMORY, depois disco)"""
+    spool = tempfile.SpooledTemporaryFile(max_size=BULK_SPOOL_MAX_MEMORY, mode="w+b")
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return io.TextIOWrapper(spool, encoding="utf-8-sig", errors="replace", newline="")
+
+def iter_json_array(stream: TextIO) -> Iterator:
+    """Lê um array JSON objeto por objeto, sem carregar o corpo inteiro na memória"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+
+    while True:
+        # Pula espaços, "[" inicial e vírgulas entre elementos
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == "," or (not started and buffer[pos] == "[")):
+            if buffer[pos] == "[":
+                started = True
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                raise ValueError("O corpo JSON deve ser um array")
+            if buffer[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Um número no fim do buffer pode estar incompleto: só aceita se houver mais texto
+                if end < len(buffer) or eof:
+                    yield obj
+                    pos = end
+                    continue
+        if eof:
+            raise ValueError("Array JSON incompleto")
+        chunk = stream.read(JSON_READ_CHUNK)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def iter_csv(stream: TextIO) -> Iterator:
+    for row in csv.DictReader(stream):
+        yield {key: (value if value != "" else None) for key, value in row.items() if key}
+
+def iter_rows(stream: TextIO, fmt: str) -> Iterator:
+    """
+    Itera (número da linha, objeto ou exceção). Erros de sintaxe em NDJSON afetam só
+    a própria linha; em JSON/CSV um erro de sintaxe interrompe a leitura.
+    """
+    if fmt == "ndjson":
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+        return
+
+    rows = iter_json_array(stream) if fmt == "json" else iter_csv(stream)
+    number = 0
+    try:
+        for number, obj in enumerate(rows, start=1):
+            yield number, obj
+    except (ValueError, csv.Error) as e:
+        yield number + 1, e
+
+class BulkLeadImport:
+    """Valida e insere leads em lotes; cada lote é uma transação"""
+
+    def __init__(self, db: Session, indicador_id: int, batch_size: int = BULK_BATCH_SIZE):
+        self.db = db
+        self.indicador_id = indicador_id
+        self.batch_size = batch_size
+        self.vendedor_ids = set()
+        self.created = 0
+        self.failed = 0
+        self.merged = 0
+        self.flagged = 0
+        self.errors = []
+        self._batch = []
+
+    def _error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def add(self, row: int, obj):
+        if isinstance(obj, Exception):
+            self._error(row, f"Formato inválido: {obj}")
+            return
+        try:
+            lead = schemas.LeadCreate.model_validate(obj)
+        except ValidationError as e:
+            self._error(row, "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err["loc"] else err["msg"] for err in e.errors()
+            ))
+            return
+        if lead.vendedor_id is not None and lead.vendedor_id not in self.vendedor_ids:
+            self._error(row, f"vendedor_id {lead.vendedor_id} não é um vendedor")
+            return
+        self._batch.append((row, lead))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def _count(self, row: int, result: str, lead_id: int):
+        if result == "rejected":
+            self._error(row, f"Telefone já cadastrado no lead {lead_id}")
+            return
+        if result == "merged":
+            self.merged += 1
+            return
+        self.created += 1
+        if result == "flagged":
+            self.flagged += 1
+
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        try:
+            results = database.bulk_create_leads(self.db, [lead for _, lead in batch], self.indicador_id)
+        except routing.NoVendedorError as e:
+            self.db.rollback()
+            for row, _ in batch:
+                self._error(row, str(e))
+            return
+        except SQLAlchemyError:
+            self.db.rollback()
+            # Isola as linhas problemáticas inserindo o lote uma a uma
+            for row, lead in batch:
+                try:
+                    [(result, lead_id)] = database.bulk_create_leads(self.db, [lead], self.indicador_id)
+                except SQLAlchemyError as e:
+                    self.db.rollback()
+                    self._error(row, f"Erro ao gravar: {e.__class__.__name__}")
+                else:
+                    self._count(row, result, lead_id)
+            return
+        for (row, _), (result, lead_id) in zip(batch, results):
+            self._count(row, result, lead_id)
+
+    def run(self, stream: TextIO, fmt: str) -> dict:
+        self.vendedor_ids = {v.id for v in database.get_vendedores(self.db)}
+        for row, obj in iter_rows(stream, fmt):
+            self.add(row, obj)
+        self.flush()
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "merged": self.merged,
+            "flagged": self.flagged,
+            "errors": self.errors,
+        }
@@ -1,15 +1,35 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, timedelta
 import uvicorn
 
-from . import models, schemas, auth, database
+from . import models, schemas, auth, database, async_database, stats, migrations, passwords, email_service, ingest, export, etags, events, dedup, routing, metrics
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware
 from .database import engine, get_db
+from .async_database import get_async_db
 
-models.Base.metadata.create_all(bind=engine)
+migrations.run_migrations(engine)
 
-app = FastAPI(title="IndicaVende API", version="1.0.0")
+app = FastAPI(title="IndicaVende API", version="1.0.0", default_response_class=ORJSONResponse)
+
+@app.on_event("startup")
+def start_email_dispatcher():
+    if email_service.EMAIL_WORKER_ENABLED:
+        email_service.dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_email_dispatcher():
+    email_service.dispatcher.stop()
+
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    await async_database.async_engine.dispose()
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,66 +38,352 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+# Por último: a mais externa, mede também a compressão
+app.add_middleware(MetricsMiddleware)
 
-@app.post("/auth/login", response_model=schemas.UserResponse)
-def login(credentials: schemas.LoginRequest, db: Session = Depends(get_db)):
-    user = auth.authenticate_user(db, credentials.email, credentials.password)
+LEAD_FIELDS = [column.key for column in database.LEAD_COLUMNS]
+
+@app.post("/auth/login", response_model=schemas.LoginResponse)
+async def login(credentials: schemas.LoginRequest, db: Session = Depends(get_db)):
+    user = await auth.authenticate_user_async(db, credentials.email, credentials.password)
     if not user:
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
+    return {
+        **schemas.UserResponse.model_validate(user).model_dump(),
+        "access_token": auth.create_access_token(user),
+        "expires_in": auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+@app.get("/auth/me", response_model=schemas.UserResponse)
+def read_current_user(
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    user = auth.get_user_cached(db, current_user.email)
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
     return user
 
 @app.post("/auth/register", response_model=schemas.UserResponse)
-def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
-    return auth.create_user(db, user_data)
+async def register(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Email repetido é recusado antes do bcrypt, sem ocupar o pool de hash
+    if await run_in_threadpool(database.get_user_by_email, db, user_data.email):
+        raise HTTPException(status_code=400, detail="Email já registrado")
+    hashed_password = await passwords.hasher.hash_async(user_data.password)
+    return await run_in_threadpool(auth.create_user, db, user_data, hashed_password)
 
 @app.post("/leads/", response_model=schemas.LeadResponse)
-def create_lead(lead: schemas.LeadCreate, db: Session = Depends(get_db), current_user: schemas.UserResponse = Depends(auth.get_current_user)):
-    return database.create_lead(db, lead, current_user.id)
+async def create_lead(lead: schemas.LeadCreate, db: AsyncSession = Depends(get_async_db), current_user: schemas.CurrentUser = Depends(auth.get_current_user)):
+    # Telefone já cadastrado: conforme LEAD_DEDUP_POLICY, recusa, devolve o original ou marca duplicate_of_id.
+    # Sem vendedor_id, o vendedor é escolhido pelo routing
+    try:
+        return await async_database.create_lead(db, lead, current_user.id)
+    except (dedup.DuplicateLeadError, routing.NoVendedorError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-@app.get("/leads/", response_model=List[schemas.LeadResponse])
-def get_leads(
-    skip: int = 0, 
-    limit: int = 100, 
+@app.post("/leads/bulk", response_model=schemas.BulkLeadResult)
+async def bulk_create_leads(
+    request: Request,
+    batch_size: int = Query(ingest.BULK_BATCH_SIZE, ge=1, le=10000),
     db: Session = Depends(get_db),
-    current_user: schemas.UserResponse = Depends(auth.get_current_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    fmt = ingest.detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Envie application/json, application/x-ndjson ou text/csv")
+    
+    stream = await ingest.spool_request(request)
+    try:
+        importer = ingest.BulkLeadImport(db, current_user.id, batch_size)
+        return await run_in_threadpool(importer.run, stream, fmt)
+    finally:
+        stream.close()
+
+@app.get("/leads/export")
+def export_leads(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson|parquet)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[models.LeadStatus] = None,
+    vendedor_id: Optional[int] = None,
+    current_user: schemas.CurrentUser = Depends(auth.get_export_user)
+):
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Exportação Parquet indisponível (pyarrow não instalado)")
+    
+    filters = {"start_date": start_date, "end_date": end_date, "status": status, "vendedor_id": vendedor_id}
+    if current_user.role == "vendedor":
+        filters["vendedor_id"] = current_user.id
+    elif current_user.role == "indicador":
+        filters["indicador_id"] = current_user.id
+    
+    return StreamingResponse(
+        export.export_leads(fmt, **filters),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{export.export_filename(fmt)}"'},
+    )
+
+@app.post("/leads/export/link", response_model=schemas.ExportLink)
+def create_export_link(current_user: schemas.CurrentUser = Depends(auth.get_current_user)):
+    return {
+        "token": auth.create_access_token(current_user, auth.EXPORT_TOKEN_EXPIRE_MINUTES, scope="export"),
+        "expires_in": auth.EXPORT_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+@app.get("/leads/", response_model=schemas.LeadPage)
+async def get_leads(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
 ):
-    if current_user.role == "gestor":
-        return database.get_all_leads(db, skip, limit)
-    elif current_user.role == "vendedor":
-        return database.get_vendedor_leads(db, current_user.id)
-    else:
-        return database.get_indicador_leads(db, current_user.id)
+    version = await async_database.get_data_version(db, database.LEADS_SCOPE)
+    etag = etags.make_etag(version, current_user.role, current_user.id, cursor, limit)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    try:
+        if current_user.role == "gestor":
+            leads, next_cursor = await async_database.get_all_leads(db, cursor, limit)
+        elif current_user.role == "vendedor":
+            leads, next_cursor = await async_database.get_vendedor_leads(db, current_user.id, cursor, limit)
+        else:
+            leads, next_cursor = await async_database.get_indicador_leads(db, current_user.id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Tuplas já no formato de LeadResponse: serializa direto, sem validar item a item
+    return ORJSONResponse(
+        {"items": [dict(zip(LEAD_FIELDS, lead)) for lead in leads], "next_cursor": next_cursor},
+        headers={"ETag": etag, "Cache-Control": etags.CACHE_CONTROL},
+    )
+
+@app.get("/leads/changes", response_model=schemas.LeadChanges)
+async def get_lead_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    # Sem since devolve todos os leads; o cliente aplica upserts/deletes à cópia local e
+    # repete com o `since` retornado (imediatamente, enquanto has_more for verdadeiro).
+    # O token é opaco: (transação, seq) da última alteração lida
+    scope = {}
+    if current_user.role == "vendedor":
+        scope["vendedor_id"] = current_user.id
+    elif current_user.role == "indicador":
+        scope["indicador_id"] = current_user.id
+    try:
+        leads, deleted, next_since, has_more = await async_database.get_lead_changes(db, since, limit, **scope)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ORJSONResponse({
+        "upserts": [dict(zip(LEAD_FIELDS, lead)) for lead in leads],
+        "deletes": deleted,
+        "since": next_since,
+        "has_more": has_more,
+    })
+
+@app.get("/leads/search", response_model=schemas.LeadSearchResults)
+async def search_leads(
+    q: str = Query(..., min_length=3, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    # Nome, trecho do telefone (com ou sem máscara), cidade ou observação; do mais relevante ao menos
+    version = await async_database.get_data_version(db, database.LEADS_SCOPE)
+    etag = etags.make_etag(version, current_user.role, current_user.id, q, limit)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    scope = {}
+    if current_user.role == "vendedor":
+        scope["vendedor_id"] = current_user.id
+    elif current_user.role == "indicador":
+        scope["indicador_id"] = current_user.id
+    leads = await async_database.search_leads(db, q, limit, **scope)
+    return ORJSONResponse(
+        {"items": [dict(zip(LEAD_FIELDS, lead)) for lead in leads]},
+        headers={"ETag": etag, "Cache-Control": etags.CACHE_CONTROL},
+    )
 
 @app.put("/leads/{lead_id}", response_model=schemas.LeadResponse)
-def update_lead_status(
+async def update_lead_status(
     lead_id: int, 
     lead_update: schemas.LeadUpdate, 
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role not in ["vendedor", "gestor"]:
+        raise HTTPException(status_code=403, detail="Sem permissão para atualizar leads")
+    db_lead = await async_database.update_lead_status(db, lead_id, lead_update)
+    if db_lead is None:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    return db_lead
+
+@app.delete("/leads/{lead_id}", status_code=204)
+async def delete_lead(
+    lead_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role != "gestor":
+        raise HTTPException(status_code=403, detail="Sem permissão para remover leads")
+    if not await async_database.delete_lead(db, lead_id):
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    return Response(status_code=204)
+
+@app.patch("/leads/bulk-status", response_model=schemas.BulkStatusResult)
+def bulk_update_lead_status(
+    lead_update: schemas.LeadBulkStatusUpdate,
     db: Session = Depends(get_db),
-    current_user: schemas.UserResponse = Depends(auth.get_current_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
 ):
     if current_user.role not in ["vendedor", "gestor"]:
         raise HTTPException(status_code=403, detail="Sem permissão para atualizar leads")
-    return database.update_lead_status(db, lead_id, lead_update)
+    criteria = lead_update.filter.model_dump(exclude_none=True) if lead_update.filter else {}
+    if not lead_update.ids and not criteria:
+        raise HTTPException(status_code=400, detail="Informe ids ou um filtro com pelo menos um critério")
+    
+    # Vendedor só altera os próprios leads
+    vendedor_id = current_user.id if current_user.role == "vendedor" else None
+    return {"updated": database.bulk_update_lead_status(db, lead_update, vendedor_id)}
 
 @app.get("/users/", response_model=List[schemas.UserResponse])
 def get_users(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
-    current_user: schemas.UserResponse = Depends(auth.get_current_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
 ):
     if current_user.role != "gestor":
         raise HTTPException(status_code=403, detail="Acesso negado")
+    etag = etags.make_etag(database.get_data_version(db, database.USERS_SCOPE), "users")
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
     return database.get_all_users(db)
 
 @app.get("/vendedores/", response_model=List[schemas.UserResponse])
 def get_vendedores(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db),
-    current_user: schemas.UserResponse = Depends(auth.get_current_user)
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
 ):
+    etag = etags.make_etag(database.get_data_version(db, database.USERS_SCOPE), "vendedores")
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
     return database.get_vendedores(db)
 
+@app.get("/stats/leads/daily", response_model=schemas.DailyLeadStats)
+def get_daily_lead_stats(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role != "gestor":
+        raise HTTPException(status_code=403, detail="Acesso negado")
+    # O auto-refresh do dashboard revalida aqui: sem escritas em leads, nada é recalculado
+    etag = etags.make_etag(database.get_data_version(db, database.LEADS_SCOPE), "stats", start_date, end_date, vendedor_id)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return stats.leads_daily_stats(db, start_date, end_date, vendedor_id)
+
+@app.get("/stats/funnel", response_model=schemas.LeadFunnel)
+def get_lead_funnel(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role != "gestor":
+        raise HTTPException(status_code=403, detail="Acesso negado")
+    etag = etags.make_etag(database.get_data_version(db, database.LEADS_SCOPE), "funnel", start_date, end_date, vendedor_id)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return stats.lead_funnel(db, start_date, end_date, vendedor_id)
+
+@app.get("/stats/stage-durations", response_model=schemas.StageDurations)
+def get_stage_durations(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role != "gestor":
+        raise HTTPException(status_code=403, detail="Acesso negado")
+    etag = etags.make_etag(database.get_data_version(db, database.LEADS_SCOPE), "stage-durations", start_date, end_date, vendedor_id)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return stats.stage_durations(db, start_date, end_date, vendedor_id)
+
+@app.get("/stats/leaderboard", response_model=schemas.Leaderboard)
+def get_leaderboard(
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    days: Optional[int] = Query(None, ge=1, le=3650),
+    limit: int = Query(10, ge=1, le=100),
+    rank_by: str = Query("closed", pattern="^(closed|leads|conversion_rate)$"),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    if current_user.role != "gestor":
+        raise HTTPException(status_code=403, detail="Acesso negado")
+    # `days`: janela dos últimos N dias, incluindo hoje
+    if days is not None:
+        start_date, end_date = date.today() - timedelta(days=days - 1), None
+    version = database.get_data_version(db, database.LEADS_SCOPE)
+    etag = etags.make_etag(version, "leaderboard", start_date, end_date, limit, rank_by)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    etags.set_headers(response, etag)
+    return stats.leaderboard(db, version, start_date, end_date, limit, rank_by)
+
+@app.get("/events/leads")
+async def lead_events(current_user: schemas.CurrentUser = Depends(auth.get_current_user)):
+    # SSE: gestor recebe todos os eventos; vendedor e indicador, só os dos próprios leads
+    return StreamingResponse(
+        events.sse_stream(events.topics_for_user(current_user)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok",
+        "password_hashing": passwords.hasher.stats(),
+        "event_subscribers": events.broker.subscriber_count(),
+        "routing": routing.router.stats(),
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    # Formato texto do Prometheus: latência por rota, consultas por requisição, bcrypt, SMTP
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/seed")
 def seed_database(db: Session = Depends(get_db)):
     return auth.seed_database(db)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Streams SSE abertos não impedem o shutdown por mais de 10 s
+    uvicorn.run(app, host="0.0.0.0", port=8000, timeout_graceful_shutdown=10)
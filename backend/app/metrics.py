@@ -0,0 +1,231 @@
+"""
+Métricas do processo no formato texto do Prometheus (GET /metrics), sem dependências.
+
+- MetricsMiddleware: latência por rota (template da rota, não o caminho, para não
+  explodir a cardinalidade), requisições em andamento e, por requisição, quantas
+  consultas foram ao banco e quanto tempo levaram
+- eventos do SQLAlchemy em todas as engines (síncrona e assíncrona): tempo de cada
+  consulta e log das que passam de SLOW_QUERY_MS
+- os módulos registram suas próprias métricas (bcrypt em passwords, SMTP em
+  email_service) e valores lidos na hora da coleta (`function`)
+
+Cada métrica fica em memória no processo; com vários workers, cada um expõe as suas.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+from typing import Callable, Optional
+import os
+import time
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# Trecho do SQL impresso no log de consultas lentas
+SLOW_QUERY_LOG_CHARS = int(os.getenv("SLOW_QUERY_LOG_CHARS", "500"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# O Starlette acrescenta "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    """Com `function`, o valor é lido na coleta (dict rótulos -> valor, ou um número)"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function: Optional[Callable] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._lock = Lock()
+        self._values = {}
+        registry.register(self)
+
+    def _samples(self):
+        if self.function is not None:
+            values = self.function()
+            return list(values.items()) if isinstance(values, dict) else [((), values)]
+        with self._lock:
+            return list(self._values.items())
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self._samples():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        # Contagem por faixa (não cumulativa), a soma acumulada é montada só na coleta
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in samples:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = Counter("http_requests_total", "Requisições HTTP atendidas", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "Latência das requisições HTTP", ("method", "route"))
+http_in_flight = Gauge("http_requests_in_flight", "Requisições HTTP em andamento (inclui streams SSE)")
+http_request_queries = Histogram(
+    "http_request_db_queries", "Consultas ao banco por requisição", ("method", "route"), buckets=QUERY_COUNT_BUCKETS
+)
+http_request_db_time = Histogram("http_request_db_seconds", "Tempo em consultas ao banco por requisição", ("method", "route"))
+db_query_duration = Histogram("db_query_duration_seconds", "Duração das consultas ao banco", ("operation",))
+db_slow_queries = Counter("db_slow_queries_total", "Consultas acima de SLOW_QUERY_MS", ("operation",))
+process_cpu = Counter("process_cpu_seconds_total", "Tempo de CPU do processo (usuário + sistema)", function=time.process_time)
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+# Estatísticas da requisição atual. O contexto acompanha o threadpool (rotas síncronas)
+# e os greenlets da engine assíncrona, então as consultas caem na requisição certa
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+def _operation(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_start(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_end(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    operation = _operation(statement)
+    db_query_duration.observe(elapsed, operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        db_slow_queries.inc(operation)
+        route = route_label(stats.scope) if stats is not None else "-"
+        sql = " ".join(statement.split())[:SLOW_QUERY_LOG_CHARS]
+        print(f"🐢 Consulta lenta ({elapsed * 1000:.0f} ms, {route}): {sql}")
+
+@event.listens_for(Engine, "handle_error")
+def _query_error(exception_context):
+    # Consulta que falhou: descarta o início registrado em before_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+def route_label(scope) -> str:
+    # FastAPI grava a rota encontrada no scope; caminhos sem rota (404) ficam agrupados
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _request_stats.reset(token)
+            method, route = scope["method"], route_label(scope)
+            http_requests.inc(method, route, str(status))
+            http_request_duration.observe(elapsed, method, route)
+            http_request_queries.observe(stats.queries, method, route)
+            http_request_db_time.observe(stats.db_seconds, method, route)
@@ -0,0 +1,417 @@
+from contextlib import contextmanager
+from sqlalchemy import (
+    BigInteger, Column, Integer, String, Date, DateTime, Enum, ForeignKey, Index, MetaData, Table, Text,
+    bindparam, case, cast, column, extract, inspect, literal, null, or_, select, table,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+import re
+import unicodedata
+
+# Tabela de controle: uma linha por migração aplicada
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+# Chave do pg_advisory_xact_lock que serializa as migrações entre processos
+MIGRATION_LOCK_KEY = 7_240_301
+
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    """
+    Registra uma migração. Cada migração recebe uma Connection já dentro de uma
+    transação e deve ser idempotente (checkfirst), pois bancos criados antes deste
+    módulo existir já possuem parte do schema.
+    """
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+def _create_index(conn: Connection, table, name: str):
+    index = next(i for i in table.indexes if i.name == name)
+    index.create(bind=conn, checkfirst=True)
+
+# Schema do baseline, congelado: não acompanha models.py, e as mudanças seguintes chegam
+# aos bancos novos pelas próprias migrações, como nos bancos antigos
+baseline_metadata = MetaData()
+Table(
+    "users",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(100), nullable=False),
+    Column("email", String(100), unique=True, index=True, nullable=False),
+    Column("password", String(255), nullable=False),
+    Column("role", Enum("GESTOR", "VENDEDOR", "INDICADOR", name="userrole"), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+)
+Table(
+    "leads",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("client_name", String(100), nullable=False),
+    Column("phone", String(20), nullable=False),
+    Column("city_state", String(100), nullable=False),
+    Column("observation", Text),
+    Column("status", Enum("NOVO", "EM_CONTATO", "EM_NEGOCIACAO", "FECHADO", "PERDIDO", name="leadstatus")),
+    Column("indicador_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("vendedor_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+@migration(1, "Tabelas iniciais (users, leads)")
+def _initial_tables(conn: Connection):
+    baseline_metadata.create_all(bind=conn)
+
+# A partir daqui, cada migração traz as definições que usa congeladas como estavam quando
+# foi escrita, e nenhuma chama código do app: mudanças em models.py, rollups, search ou
+# dedup não alteram o que uma migração antiga faz num banco que ainda não a aplicou
+LEAD_STATUSES = ("NOVO", "EM_CONTATO", "EM_NEGOCIACAO", "FECHADO", "PERDIDO")
+baseline_leads = baseline_metadata.tables["leads"]
+
+lead_indexes_metadata = MetaData()
+Table(
+    "leads",
+    lead_indexes_metadata,
+    Column("status", Enum(*LEAD_STATUSES, name="leadstatus")),
+    Column("indicador_id", Integer),
+    Column("vendedor_id", Integer),
+    Column("created_at", DateTime(timezone=True)),
+    Index("ix_leads_created_at", "created_at"),
+    Index("ix_leads_vendedor_created", "vendedor_id", "created_at"),
+    Index("ix_leads_indicador_created", "indicador_id", "created_at"),
+    Index("ix_leads_status_created", "status", "created_at"),
+)
+
+@migration(2, "Índices compostos de leads para filtros por vendedor, indicador, status e data")
+def _lead_indexes(conn: Connection):
+    for index in lead_indexes_metadata.tables["leads"].indexes:
+        index.create(bind=conn, checkfirst=True)
+
+email_outbox_metadata = MetaData()
+Table(
+    "email_outbox",
+    email_outbox_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("kind", String(50), nullable=False),
+    Column("recipient", String(100), nullable=False),
+    Column("context", Text, nullable=False),
+    Column("status", Enum("PENDING", "SENDING", "SENT", "FAILED", name="emailstatus"), nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("next_attempt_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("last_error", Text),
+    Column("created_at", DateTime(timezone=True), server_default=func.now()),
+    Column("sent_at", DateTime(timezone=True)),
+    Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+)
+
+@migration(3, "Fila de emails (email_outbox)")
+def _email_outbox(conn: Connection):
+    email_outbox_metadata.create_all(bind=conn)
+
+data_versions_metadata = MetaData()
+data_versions = Table(
+    "data_versions",
+    data_versions_metadata,
+    Column("scope", String(32), primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+@migration(4, "Versões por escopo para ETags das listagens (data_versions)")
+def _data_versions(conn: Connection):
+    data_versions_metadata.create_all(bind=conn)
+    existing = set(conn.execute(select(data_versions.c.scope)).scalars())
+    for scope in ("leads", "users"):
+        if scope not in existing:
+            conn.execute(data_versions.insert().values(scope=scope, version=0))
+
+# Ainda sem txid (migração 10)
+lead_changes_metadata = MetaData()
+lead_changes = Table(
+    "lead_changes",
+    lead_changes_metadata,
+    Column("seq", Integer, primary_key=True, autoincrement=True),
+    Column("lead_id", Integer, nullable=False),
+    Column("operation", Enum("INSERT", "UPDATE", "DELETE", name="changeoperation"), nullable=False),
+    Column("vendedor_id", Integer),
+    Column("indicador_id", Integer),
+    Column("changed_at", DateTime(timezone=True), server_default=func.now()),
+    Index("ix_lead_changes_vendedor_seq", "vendedor_id", "seq"),
+    Index("ix_lead_changes_indicador_seq", "indicador_id", "seq"),
+    sqlite_autoincrement=True,
+)
+
+@migration(5, "Log de alterações de leads (lead_changes) com os leads existentes como inserções")
+def _lead_changes(conn: Connection):
+    lead_changes_metadata.create_all(bind=conn)
+    if conn.execute(select(lead_changes.c.seq).limit(1)).first() is None:
+        # Com since=0 o cliente recebe todos os leads, inclusive os anteriores ao log
+        leads = baseline_leads
+        conn.execute(lead_changes.insert().from_select(
+            ["lead_id", "operation", "vendedor_id", "indicador_id"],
+            select(
+                leads.c.id, literal("INSERT", lead_changes.c.operation.type), leads.c.vendedor_id, leads.c.indicador_id
+            ).order_by(leads.c.id),
+        ))
+
+lead_daily_counts_metadata = MetaData()
+lead_daily_counts = Table(
+    "lead_daily_counts",
+    lead_daily_counts_metadata,
+    Column("day", Date, primary_key=True),
+    Column("status", Enum(*LEAD_STATUSES, name="leadstatus"), primary_key=True),
+    Column("vendedor_id", Integer, primary_key=True),
+    Column("indicador_id", Integer, primary_key=True),
+    Column("total", Integer, nullable=False),
+    Index("ix_lead_daily_counts_vendedor_day", "vendedor_id", "day"),
+)
+
+@migration(6, "Rollup diário de leads (lead_daily_counts) calculado a partir dos leads existentes")
+def _lead_daily_counts(conn: Connection):
+    lead_daily_counts_metadata.create_all(bind=conn)
+    leads = baseline_leads
+    day = func.date(leads.c.created_at, type_=Date)
+    grouped = (leads.c.status, leads.c.vendedor_id, leads.c.indicador_id)
+    conn.execute(lead_daily_counts.delete())
+    conn.execute(lead_daily_counts.insert().from_select(
+        ["day", "status", "vendedor_id", "indicador_id", "total"],
+        select(day, *grouped, func.count()).group_by(day, *grouped),
+    ))
+
+lead_status_changes_metadata = MetaData()
+lead_status_changes = Table(
+    "lead_status_changes",
+    lead_status_changes_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("lead_id", Integer, nullable=False),
+    Column("vendedor_id", Integer, nullable=False),
+    Column("from_status", Enum(*LEAD_STATUSES, name="leadstatus")),
+    Column("to_status", Enum(*LEAD_STATUSES, name="leadstatus"), nullable=False),
+    Column("changed_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+    Column("seconds_in_stage", Integer),
+    Index("ix_lead_status_changes_lead_changed", "lead_id", "changed_at"),
+    Index("ix_lead_status_changes_vendedor_changed", "vendedor_id", "changed_at"),
+)
+
+@migration(7, "Histórico de status dos leads (lead_status_changes) aproximado para os leads existentes")
+def _lead_status_changes(conn: Connection):
+    table = lead_status_changes
+    lead_status_changes_metadata.create_all(bind=conn)
+    if conn.execute(select(table.c.id).limit(1)).first() is not None:
+        return
+    # Sem o histórico real: cada lead entra como "novo" na criação e, se já avançou,
+    # muda direto para o status atual na última atualização
+    leads = baseline_leads
+    novo = literal("NOVO", table.c.to_status.type)
+    left_at = func.coalesce(leads.c.updated_at, leads.c.created_at)
+    if conn.dialect.name == "postgresql":
+        elapsed = extract("epoch", left_at - leads.c.created_at)
+    else:
+        elapsed = (func.julianday(left_at) - func.julianday(leads.c.created_at)) * 86400
+    seconds = case(
+        # Tempo desconhecido fica de fora das estatísticas de duração
+        (or_(leads.c.status == "NOVO", leads.c.updated_at.is_(None)), null()),
+        else_=cast(elapsed, Integer),
+    )
+    conn.execute(table.insert().from_select(
+        ["lead_id", "vendedor_id", "from_status", "to_status", "changed_at", "seconds_in_stage"],
+        select(leads.c.id, leads.c.vendedor_id, null(), novo, leads.c.created_at, seconds).order_by(leads.c.id),
+    ))
+    conn.execute(table.insert().from_select(
+        ["lead_id", "vendedor_id", "from_status", "to_status", "changed_at"],
+        select(leads.c.id, leads.c.vendedor_id, novo, leads.c.status, left_at)
+        .where(leads.c.status != "NOVO").order_by(leads.c.id),
+    ))
+
+SEARCH_COLUMNS = ("client_name", "phone", "city_state", "observation")
+lead_search_metadata = MetaData()
+pg_lead_search = Table(
+    "lead_search",
+    lead_search_metadata,
+    Column("lead_id", Integer, primary_key=True),
+    *(Column(name, Text) for name in SEARCH_COLUMNS),
+    Column("document", Text, nullable=False),
+    Index("ix_lead_search_document", "document", postgresql_using="gin", postgresql_ops={"document": "gin_trgm_ops"}),
+)
+
+def _fold(text):
+    if text is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def _digits(text):
+    return re.sub(r"\D", "", text) if text is not None else None
+
+@migration(8, "Índice de busca de leads (lead_search: FTS5 no SQLite, pg_trgm no PostgreSQL)")
+def _lead_search(conn: Connection):
+    leads = baseline_leads
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS lead_search USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='trigram')"
+        )
+        # Cópias desta migração, com nomes próprios: as do app (search_fold) podem mudar
+        dbapi_connection = conn.connection.dbapi_connection
+        dbapi_connection.create_function("migration_008_fold", 1, _fold)
+        dbapi_connection.create_function("migration_008_digits", 1, _digits)
+        search_table = table("lead_search", column("rowid"), *(column(name) for name in SEARCH_COLUMNS))
+        values = [
+            func.migration_008_fold(leads.c.client_name), func.migration_008_digits(leads.c.phone),
+            func.migration_008_fold(leads.c.city_state), func.migration_008_fold(leads.c.observation),
+        ]
+    else:
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS unaccent")
+        lead_search_metadata.create_all(bind=conn)
+        search_table = pg_lead_search
+        values = [
+            func.lower(func.unaccent(leads.c.client_name)), func.regexp_replace(leads.c.phone, r"\D", "", "g"),
+            func.lower(func.unaccent(leads.c.city_state)), func.lower(func.unaccent(leads.c.observation)),
+        ]
+        values.append(func.concat_ws(" ", *values))
+    conn.execute(search_table.delete())
+    conn.execute(search_table.insert().from_select(
+        [c.name for c in search_table.c], select(leads.c.id, *values),
+    ))
+
+lead_phone_metadata = MetaData()
+lead_phone = Table(
+    "leads",
+    lead_phone_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("phone", String(20), nullable=False),
+    Column("phone_normalized", String(20)),
+    Column("duplicate_of_id", Integer),
+    Index("ix_leads_phone_normalized", "phone_normalized"),
+)
+
+def _normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        digits = digits[2:]
+    elif len(digits) in (11, 12) and digits.startswith("0"):
+        digits = digits[1:]
+    if len(digits) == 10 and digits[2] in "6789":
+        digits = digits[:2] + "9" + digits[2:]
+    return digits or None
+
+@migration(9, "Telefone normalizado e duplicate_of_id em leads, com índice para o dedup")
+def _lead_phone_normalized(conn: Connection):
+    leads = lead_phone
+    existing = {column["name"] for column in inspect(conn).get_columns(leads.name)}
+    for column in (leads.c.phone_normalized, leads.c.duplicate_of_id):
+        if column.name not in existing:
+            conn.exec_driver_sql(
+                f"ALTER TABLE {leads.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}"
+            )
+    # Só normaliza; os duplicados já existentes são marcados por `python -m app.dedup scan --apply`
+    changes = [
+        {"lead_id": lead_id, "normalized": _normalize_phone(phone)}
+        for lead_id, phone, phone_normalized in conn.execute(
+            select(leads.c.id, leads.c.phone, leads.c.phone_normalized).order_by(leads.c.id)
+        )
+        if _normalize_phone(phone) != phone_normalized
+    ]
+    if changes:
+        conn.execute(
+            leads.update().where(leads.c.id == bindparam("lead_id")).values(phone_normalized=bindparam("normalized")),
+            changes,
+        )
+    _create_index(conn, leads, "ix_leads_phone_normalized")
+
+lead_changes_txid_metadata = MetaData()
+lead_changes_txid = Table(
+    "lead_changes",
+    lead_changes_txid_metadata,
+    Column("seq", Integer, primary_key=True),
+    Column("txid", BigInteger, nullable=False),
+    Column("vendedor_id", Integer),
+    Column("indicador_id", Integer),
+    Index("ix_lead_changes_txid_seq", "txid", "seq"),
+    Index("ix_lead_changes_vendedor_txid_seq", "vendedor_id", "txid", "seq"),
+    Index("ix_lead_changes_indicador_txid_seq", "indicador_id", "txid", "seq"),
+)
+
+@migration(10, "Transação (txid) no log de alterações de leads, com índices por (txid, seq)")
+def _lead_changes_txid(conn: Connection):
+    table = lead_changes_txid
+    existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+    if table.c.txid.name not in existing:
+        # Alterações anteriores ficam com txid 0: vêm antes de todas as novas
+        conn.exec_driver_sql(
+            f"ALTER TABLE {table.name} ADD COLUMN {table.c.txid.name} {table.c.txid.type.compile(conn.dialect)} NOT NULL DEFAULT 0"
+        )
+    for name in ("ix_lead_changes_vendedor_seq", "ix_lead_changes_indicador_seq"):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    for index in table.indexes:
+        index.create(bind=conn, checkfirst=True)
+
+def applied_versions(conn: Connection):
+    if not inspect(conn).has_table(schema_migrations.name):
+        return set()
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+@contextmanager
+def _locked_transaction(engine: Engine):
+    """
+    Transação com a trava de migração do banco: pg_advisory_xact_lock no PostgreSQL;
+    BEGIN IMMEDIATE no SQLite (o driver só abriria a transação no primeiro INSERT/UPDATE,
+    deixando o DDL fora dela). Outro processo migrando espera até o commit.
+    """
+    if engine.dialect.name != "sqlite":
+        with engine.begin() as conn:
+            conn.execute(select(func.pg_advisory_xact_lock(MIGRATION_LOCK_KEY)))
+            yield conn
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.exec_driver_sql("ROLLBACK")
+            raise
+        conn.exec_driver_sql("COMMIT")
+
+def run_migrations(engine: Engine, target: int = None):
+    """
+    Aplica, em ordem, as migrações pendentes até `target` (todas, se None). Cada uma roda
+    na própria transação, com a trava de migração; vários workers iniciando juntos
+    esperam a vez e pulam o que outro já aplicou.
+    """
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+
+    executed = []
+    for version, description, fn in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        with _locked_transaction(engine) as conn:
+            migration_metadata.create_all(bind=conn)
+            if version in applied_versions(conn):
+                continue
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(version=version, description=description))
+        executed.append(version)
+    return executed
+
+if __name__ == "__main__":
+    import sys
+    from .database import engine
+
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        with engine.connect() as conn:
+            applied = applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{'✅' if version in applied else '⏳'} {version:03d} {description}")
+    else:
+        target = int(sys.argv[1]) if len(sys.argv) > 1 else None
+        executed = run_migrations(engine, target)
+        print(f"Migrações aplicadas: {executed or 'nenhuma'}")
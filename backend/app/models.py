@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import BigInteger, Column, Integer, String, Date, DateTime, ForeignKey, Text, Enum, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.sqlite import DATETIME as SQLiteDateTime
 from sqlalchemy.sql import func
 import enum
 
 Base = declarative_base()
 
+# No SQLite o CURRENT_TIMESTAMP é gravado sem microssegundos; gravar os valores vindos do
+# Python no mesmo formato mantém as comparações de texto exatas (usadas na paginação por cursor)
+Timestamp = DateTime(timezone=True).with_variant(SQLiteDateTime(truncate_microseconds=True), "sqlite")
+
 class UserRole(str, enum.Enum):
     GESTOR = "gestor"
     VENDEDOR = "vendedor"
@@ -18,6 +23,17 @@ class LeadStatus(str, enum.Enum):
     FECHADO = "fechado"
     PERDIDO = "perdido"
 
+class ChangeOperation(str, enum.Enum):
+    INSERT = "insert"
+    UPDATE = "update"
+    DELETE = "delete"
+
+class EmailStatus(str, enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -26,7 +42,7 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     password = Column(String(255), nullable=False)
     role = Column(Enum(UserRole), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
 
 class Lead(Base):
     __tablename__ = "leads"
@@ -37,12 +53,110 @@ class Lead(Base):
     city_state = Column(String(100), nullable=False)
     observation = Column(Text)
     status = Column(Enum(LeadStatus), default=LeadStatus.NOVO)
+    # DDD + número, só dígitos (dedup.normalize_phone), preenchido pelo listener em database.py
+    phone_normalized = Column(String(20))
+    # Lead mais antigo com o mesmo telefone (política de dedup "flag")
+    duplicate_of_id = Column(Integer)
     
     indicador_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     vendedor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+    updated_at = Column(Timestamp, onupdate=func.now())
     
     indicador = relationship("User", foreign_keys=[indicador_id])
     vendedor = relationship("User", foreign_keys=[vendedor_id])
+    
+    # Novos índices precisam de uma migração em migrations.py para chegar aos bancos existentes
+    __table_args__ = (
+        Index("ix_leads_created_at", "created_at"),
+        Index("ix_leads_vendedor_created", "vendedor_id", "created_at"),
+        Index("ix_leads_indicador_created", "indicador_id", "created_at"),
+        Index("ix_leads_status_created", "status", "created_at"),
+        Index("ix_leads_phone_normalized", "phone_normalized"),
+    )
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    recipient = Column(String(100), nullable=False)
+    context = Column(Text, nullable=False, default="{}")
+    status = Column(Enum(EmailStatus), nullable=False, default=EmailStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Timestamp, server_default=func.now(), nullable=False)
+    last_error = Column(Text)
+    
+    created_at = Column(Timestamp, server_default=func.now())
+    sent_at = Column(Timestamp)
+    
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class DataVersion(Base):
+    """Contador de versão por escopo ("leads", "users"), incrementado a cada escrita"""
+    __tablename__ = "data_versions"
+    
+    scope = Column(String(32), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class LeadChange(Base):
+    """
+    Log de alterações de leads, lido em ordem de (txid, seq) por GET /leads/changes.
+    txid é a transação que gravou a linha no PostgreSQL (0 no SQLite, onde as escritas são
+    serializadas e `seq` já segue a ordem dos commits)
+    """
+    __tablename__ = "lead_changes"
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    txid = Column(BigInteger, nullable=False, server_default=text("0"))
+    lead_id = Column(Integer, nullable=False)
+    operation = Column(Enum(ChangeOperation), nullable=False)
+    # Copiados do lead para filtrar por perfil mesmo depois de um DELETE
+    vendedor_id = Column(Integer)
+    indicador_id = Column(Integer)
+    changed_at = Column(Timestamp, server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_lead_changes_txid_seq", "txid", "seq"),
+        Index("ix_lead_changes_vendedor_txid_seq", "vendedor_id", "txid", "seq"),
+        Index("ix_lead_changes_indicador_txid_seq", "indicador_id", "txid", "seq"),
+        # Sem AUTOINCREMENT o SQLite pode reutilizar o maior rowid
+        {"sqlite_autoincrement": True},
+    )
+
+class LeadDailyCount(Base):
+    """Rollup de leads por dia de criação × status atual × vendedor × indicador"""
+    __tablename__ = "lead_daily_counts"
+    
+    day = Column(Date, primary_key=True)
+    status = Column(Enum(LeadStatus), primary_key=True)
+    vendedor_id = Column(Integer, primary_key=True)
+    indicador_id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_lead_daily_counts_vendedor_day", "vendedor_id", "day"),
+    )
+
+class LeadStatusChange(Base):
+    """
+    Histórico de status dos leads: uma linha por transição (from_status nulo na criação).
+    seconds_in_stage é preenchido quando o lead sai da etapa; nulo na etapa atual.
+    """
+    __tablename__ = "lead_status_changes"
+    
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, nullable=False)
+    vendedor_id = Column(Integer, nullable=False)
+    from_status = Column(Enum(LeadStatus))
+    to_status = Column(Enum(LeadStatus), nullable=False)
+    changed_at = Column(Timestamp, nullable=False, server_default=func.now())
+    seconds_in_stage = Column(Integer)
+    
+    __table_args__ = (
+        Index("ix_lead_status_changes_lead_changed", "lead_id", "changed_at"),
+        Index("ix_lead_status_changes_vendedor_changed", "vendedor_id", "changed_at"),
+    )
@@ -0,0 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from fastapi import HTTPException
+import asyncio
+import bcrypt
+import os
+import time
+from . import metrics
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+class PasswordHasher:
+    """
+    Executor dedicado e limitado para bcrypt. Um pico de logins enfileira aqui,
+    em vez de ocupar as threads que atendem os demais endpoints; acima de
+    `max_queue` operações pendentes a requisição é recusada com 503.
+    """
+
+    def __init__(self, rounds: int, workers: int, max_queue: int):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._lock = Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def hash(self, password: str) -> str:
+        start = time.perf_counter()
+        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+        password_hash_duration.observe(time.perf_counter() - start, "hash")
+        return hashed
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        start = time.perf_counter()
+        valid = bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        password_hash_duration.observe(time.perf_counter() - start, "verify")
+        return valid
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        # Formato bcrypt: $2b$<custo>$<salt+hash>
+        try:
+            return int(hashed_password.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(status_code=503, detail="Servidor ocupado, tente novamente", headers={"Retry-After": "1"})
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash_async(self, password: str) -> str:
+        return await self._submit(self.hash, password)
+
+    async def verify_async(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(self.verify, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = self._pending
+            rejected = self._rejected
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "queue_depth": max(0, pending - self.workers),
+            "pending": pending,
+            "rejected": rejected,
+        }
+
+password_hash_duration = metrics.Histogram("password_hash_seconds", "Duração do bcrypt (CPU)", ("operation",))
+
+hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+metrics.Gauge("password_hash_pending", "Operações bcrypt em execução ou na fila", function=lambda: hasher.stats()["pending"])
+metrics.Counter("password_hash_rejected_total", "Operações bcrypt recusadas (503) com a fila cheia", function=lambda: hasher.stats()["rejected"])
@@ -0,0 +1,75 @@
+"""
+Rollup de leads por dia (lead_daily_counts), mantido na mesma transação de cada
+escrita em leads. As estatísticas leem estes contadores em vez da tabela de leads.
+
+Reconstrução completa (backfill ou correção de divergências):
+    python -m app.rollups rebuild
+"""
+from sqlalchemy import Date, delete, func, insert, select, true
+from sqlalchemy.dialects import postgresql, sqlite
+from . import models
+
+# Dia de criação (o mesmo de get_leads_per_day), tipado como Date para voltar como date no Python
+LEAD_DAY = func.date(models.Lead.created_at, type_=Date)
+DIMENSIONS = ["day", "status", "vendedor_id", "indicador_id"]
+
+def lead_groups_statement(where=None):
+    """Contagem de leads (filtrados por `where`) agrupada pelas dimensões do rollup"""
+    grouped = (models.Lead.status, models.Lead.vendedor_id, models.Lead.indicador_id)
+    return (
+        select(LEAD_DAY, *grouped, func.count())
+        .where(where if where is not None else true())
+        .group_by(LEAD_DAY, *grouped)
+    )
+
+def _upsert(connection):
+    # INSERT ... ON CONFLICT DO UPDATE: existe no SQLite (>= 3.24) e no PostgreSQL. Soma ao
+    # valor atual da linha: transações concorrentes não dependem de ordem nem se sobrescrevem
+    dialect_insert = postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    statement = dialect_insert(models.LeadDailyCount)
+    return statement.on_conflict_do_update(
+        index_elements=DIMENSIONS,
+        set_={"total": models.LeadDailyCount.total + statement.excluded.total},
+    )
+
+def add_leads(connection, where, sign: int = 1):
+    """Soma (sign=1) ou subtrai (sign=-1) dos contadores os leads que atendem `where`, em SQL"""
+    groups = lead_groups_statement(where)
+    if sign != 1:
+        groups = groups.with_only_columns(*groups.selected_columns[:-1], func.count() * sign)
+    connection.execute(_upsert(connection).from_select(DIMENSIONS + ["total"], groups))
+
+def apply_deltas(connection, deltas: dict):
+    """Aplica {(dia, status, vendedor_id, indicador_id): delta}; deltas nulos são ignorados"""
+    rows = [
+        {"day": day, "status": status, "vendedor_id": vendedor_id, "indicador_id": indicador_id, "total": delta}
+        for (day, status, vendedor_id, indicador_id), delta in deltas.items()
+        if delta
+    ]
+    if rows:
+        connection.execute(_upsert(connection), rows)
+
+def rebuild(connection):
+    """Recalcula o rollup inteiro a partir de leads"""
+    connection.execute(delete(models.LeadDailyCount))
+    connection.execute(insert(models.LeadDailyCount).from_select(DIMENSIONS + ["total"], lead_groups_statement()))
+
+def main():
+    import argparse
+    import time
+    from . import database
+
+    parser = argparse.ArgumentParser(description="Manutenção do rollup diário de leads")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    start = time.perf_counter()
+    with database.engine.begin() as conn:
+        # Trava de manutenção: nenhuma escrita em leads durante a reconstrução
+        database.lock_leads(conn)
+        rebuild(conn)
+        rows = conn.execute(select(func.count()).select_from(models.LeadDailyCount)).scalar()
+    print(f"Rollup reconstruído: {rows} linhas em {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Distribuição automática de leads criados sem vendedor_id (POST /leads/ e /leads/bulk).
+
+Estratégias (LEAD_ROUTING_STRATEGY):
+- round_robin: vendedores em rodízio
+- least_open: o vendedor com menos leads em aberto (novo, em contato, em negociação)
+- region: entre os vendedores da UF do lead em LEAD_ROUTING_REGIONS ("SP=2,4;RJ=3"),
+  o com menos leads em aberto; UF sem vendedores cai em least_open
+- conversion: rodízio ponderado pela taxa de conversão (fechados / total, suavizada)
+
+Os contadores por vendedor (em aberto, fechados, total) ficam em memória e a decisão não
+consulta o banco. Cada transação que grava leads registra seus deltas na sessão (track)
+e incrementa a versão "leads" de data_versions antes do commit; depois do commit os
+deltas entram nos contadores se a versão for a seguinte à deles. Os contadores são
+recarregados do rollup lead_daily_counts na mesma consulta que lê a versão (um único
+snapshot: quem vê as linhas de uma escrita vê a versão dela, e os deltas dela não entram
+de novo), quando a versão no banco passou da vista aqui (outro processo, um script, ou
+commits deste processo fora de ordem) e a cada ROUTING_RESYNC_SECONDS.
+As decisões de transações concorrentes não se esperam: duas podem escolher o mesmo
+vendedor com os mesmos contadores, mas os contadores em si não perdem nem repetem escritas.
+"""
+from collections import defaultdict
+from sqlalchemy import func, select, true
+from threading import Lock
+from typing import Optional
+import os
+import re
+import time
+from . import models, metrics
+
+OPEN_STATUSES = frozenset({models.LeadStatus.NOVO, models.LeadStatus.EM_CONTATO, models.LeadStatus.EM_NEGOCIACAO})
+ROUTING_STRATEGIES = ("round_robin", "least_open", "region", "conversion")
+LEAD_ROUTING_STRATEGY = os.getenv("LEAD_ROUTING_STRATEGY", "least_open")
+ROUTING_RESYNC_SECONDS = float(os.getenv("ROUTING_RESYNC_SECONDS", "300"))
+
+if LEAD_ROUTING_STRATEGY not in ROUTING_STRATEGIES:
+    raise ValueError(f"LEAD_ROUTING_STRATEGY deve ser um de {', '.join(ROUTING_STRATEGIES)}")
+
+# "São Paulo/SP", "Belo Horizonte - MG", "Curitiba, PR"
+UF_PATTERN = re.compile(r"[/\-,]\s*([A-Za-z]{2})\s*$")
+
+class NoVendedorError(Exception):
+    def __init__(self):
+        super().__init__("Nenhum vendedor disponível para receber o lead")
+
+def parse_regions(value: str) -> dict:
+    """"SP=2,4;RJ=3" -> {"SP": [2, 4], "RJ": [3]}"""
+    regions = {}
+    for entry in filter(None, (part.strip() for part in value.split(";"))):
+        uf, _, ids = entry.partition("=")
+        regions[uf.strip().upper()] = [int(i) for i in ids.split(",") if i.strip()]
+    return regions
+
+LEAD_ROUTING_REGIONS = parse_regions(os.getenv("LEAD_ROUTING_REGIONS", ""))
+
+def lead_uf(city_state: Optional[str]) -> Optional[str]:
+    match = UF_PATTERN.search(city_state or "")
+    return match.group(1).upper() if match else None
+
+def track(session, vendedor_id: int, status: models.LeadStatus, count: int = 1):
+    """Registra na sessão `count` leads entrando (ou, negativo, saindo) do vendedor com `status`"""
+    deltas = session.info.setdefault("routing_deltas", defaultdict(int))
+    deltas[(vendedor_id, status)] += count
+
+def _new_load() -> dict:
+    return {"open": 0, "closed": 0, "total": 0}
+
+def _add(loads: dict, vendedor_id: int, status: models.LeadStatus, count: int):
+    load = loads.get(vendedor_id)
+    if load is None:
+        # Vendedor removido (ou ainda não visto): os contadores dele não entram na decisão
+        return
+    load["total"] += count
+    if status in OPEN_STATUSES:
+        load["open"] += count
+    elif status == models.LeadStatus.FECHADO:
+        load["closed"] += count
+
+class LeadRouter:
+    """Contadores por vendedor em memória e as estratégias de distribuição"""
+
+    def __init__(self, strategy: str, regions: dict, resync_seconds: float):
+        self.strategy = strategy
+        self.regions = regions
+        self.resync_seconds = resync_seconds
+        self._lock = Lock()
+        self._loads = {}
+        self._vendedores = []
+        # Versões "leads" e "users" refletidas nos contadores (None: recarregar)
+        self._version = None
+        self._users_version = None
+        self._synced_at = 0.0
+        self._cursor = 0
+        self._current_weights = defaultdict(float)
+        self._reloads = 0
+        self._assigned = 0
+
+    def _load(self, session):
+        # Só leitura, fora do self._lock: na sessão assíncrona a consulta devolve o controle
+        # ao event loop, e outra requisição na mesma thread travaria esperando o lock
+        vendedores = session.execute(
+            select(models.User.id).where(models.User.role == models.UserRole.VENDEDOR).order_by(models.User.id)
+        ).scalars().all()
+        loads = {vendedor_id: _new_load() for vendedor_id in vendedores}
+        counts, versions = models.LeadDailyCount, models.DataVersion
+        # Versão e rollup na mesma consulta (mesmo snapshot); rollup vazio vem como uma linha nula
+        rows = session.execute(
+            select(versions.version, counts.vendedor_id, counts.status, func.sum(counts.total))
+            .select_from(versions)
+            .outerjoin(counts, true())
+            .where(versions.scope == "leads")
+            .group_by(versions.version, counts.vendedor_id, counts.status)
+        ).all()
+        version = rows[0][0] if rows else 0
+        for _, vendedor_id, status, total in rows:
+            if vendedor_id is not None:
+                _add(loads, vendedor_id, status, int(total))
+        return vendedores, loads, version
+
+    def _stale(self, leads_version: int, users_version: int) -> bool:
+        # Versão menor que a vista aqui: leitura anterior ao commit de outra sessão deste
+        # processo, cujos deltas já estão nos contadores
+        return (
+            self._version is None
+            or leads_version > self._version
+            or self._users_version != users_version
+            or time.monotonic() - self._synced_at > self.resync_seconds
+        )
+
+    def _open(self, vendedor_id: int, session) -> int:
+        # Em aberto = contadores + leads desta transação ainda sem commit
+        deltas = session.info.get("routing_deltas", {})
+        pending = sum(deltas.get((vendedor_id, status), 0) for status in OPEN_STATUSES)
+        return self._loads[vendedor_id]["open"] + pending + session.info["routing_assigned"][vendedor_id]
+
+    def _round_robin(self, session, city_state):
+        vendedor_id = self._vendedores[self._cursor % len(self._vendedores)]
+        self._cursor += 1
+        return vendedor_id
+
+    def _least_open(self, session, city_state, candidates=None):
+        return min(candidates or self._vendedores, key=lambda v: (self._open(v, session), v))
+
+    def _region(self, session, city_state):
+        candidates = [v for v in self.regions.get(lead_uf(city_state), ()) if v in self._loads]
+        return self._least_open(session, city_state, candidates)
+
+    def _conversion(self, session, city_state):
+        # Smooth weighted round-robin: cada vendedor recebe leads na proporção do peso,
+        # intercalados, sem sorteio
+        weights = {
+            v: (self._loads[v]["closed"] + 1) / (self._loads[v]["total"] + 2) for v in self._vendedores
+        }
+        for v, weight in weights.items():
+            self._current_weights[v] += weight
+        vendedor_id = max(self._vendedores, key=lambda v: (self._current_weights[v], -v))
+        self._current_weights[vendedor_id] -= sum(weights.values())
+        return vendedor_id
+
+    def assign(self, session, leads_version: int, users_version: int, city_state: Optional[str] = None, strategy: Optional[str] = None) -> int:
+        """
+        Escolhe o vendedor de um novo lead. Chamar antes de gravar leads na transação
+        (a recarga não pode ver escritas ainda sem commit); `leads_version` só decide se
+        os contadores estão atrasados.
+        """
+        with self._lock:
+            stale = self._stale(leads_version, users_version)
+        if stale:
+            vendedores, loads, version = self._load(session)
+        with self._lock:
+            if stale:
+                self._loads = loads
+                self._vendedores = vendedores
+                self._version = version
+                self._users_version = users_version
+                self._synced_at = time.monotonic()
+                self._reloads += 1
+            if not self._vendedores:
+                raise NoVendedorError()
+            session.info.setdefault("routing_assigned", defaultdict(int))
+            vendedor_id = getattr(self, f"_{strategy or self.strategy}")(session, city_state)
+            session.info["routing_assigned"][vendedor_id] += 1
+            self._assigned += 1
+            return vendedor_id
+
+    def commit(self, deltas: dict, version: int):
+        """Aplica os deltas de uma transação confirmada que levou leads à versão `version`"""
+        with self._lock:
+            if self._version is None or version != self._version + 1:
+                # Os contadores já são posteriores (recarregados) ou falta a versão anterior
+                # (outro processo, ou um commit ainda a caminho); no segundo caso a próxima
+                # decisão recarrega
+                return
+            for (vendedor_id, status), count in deltas.items():
+                _add(self._loads, vendedor_id, status, count)
+            self._version = version
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "vendedores": len(self._vendedores),
+                "assigned": self._assigned,
+                "reloads": self._reloads,
+            }
+
+router = LeadRouter(LEAD_ROUTING_STRATEGY, LEAD_ROUTING_REGIONS, ROUTING_RESYNC_SECONDS)
+
+metrics.Counter("routing_assigned_total", "Leads distribuídos automaticamente", function=lambda: router.stats()["assigned"])
+metrics.Counter("routing_reloads_total", "Recargas dos contadores do routing a partir do banco", function=lambda: router.stats()["reloads"])
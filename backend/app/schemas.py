@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Optional
+from datetime import date, datetime
 from .models import UserRole, LeadStatus
 
 class UserBase(BaseModel):
@@ -26,6 +26,18 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class LoginResponse(UserResponse):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class CurrentUser(BaseModel):
+    """Usuário autenticado, montado a partir do token (sem consulta ao banco)"""
+    id: int
+    email: str
+    name: str
+    role: UserRole
+
 class LeadBase(BaseModel):
     client_name: str
     phone: str
@@ -33,12 +45,30 @@ class LeadBase(BaseModel):
     observation: Optional[str] = None
 
 class LeadCreate(LeadBase):
-    vendedor_id: int
+    # Sem vendedor_id, o lead é distribuído pelo routing (LEAD_ROUTING_STRATEGY)
+    vendedor_id: Optional[int] = None
 
 class LeadUpdate(BaseModel):
     status: LeadStatus
     observation: Optional[str] = None
 
+class LeadFilter(BaseModel):
+    status: Optional[LeadStatus] = None
+    vendedor_id: Optional[int] = None
+    indicador_id: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+
+class LeadBulkStatusUpdate(BaseModel):
+    # ids e filter juntos: só os leads da lista que também atendem ao filtro (E)
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[LeadFilter] = None
+    status: LeadStatus
+    observation: Optional[str] = None
+
+class BulkStatusResult(BaseModel):
+    updated: int
+
 class LeadResponse(LeadBase):
     id: int
     status: LeadStatus
@@ -46,6 +76,115 @@ class LeadResponse(LeadBase):
     vendedor_id: int
     created_at: datetime
     updated_at: Optional[datetime]
+    duplicate_of_id: Optional[int] = None
     
     class Config:
         from_attributes = True
+
+class LeadPage(BaseModel):
+    items: List[LeadResponse]
+    next_cursor: Optional[str] = None
+
+class LeadSearchResults(BaseModel):
+    items: List[LeadResponse]
+
+class LeadChanges(BaseModel):
+    upserts: List[LeadResponse]
+    deletes: List[int]
+    since: str
+    has_more: bool
+
+class BulkRowError(BaseModel):
+    row: int
+    error: str
+
+class BulkLeadResult(BaseModel):
+    created: int
+    failed: int
+    # Telefones já cadastrados, conforme LEAD_DEDUP_POLICY (rejeitados entram em failed)
+    merged: int = 0
+    flagged: int = 0
+    errors: List[BulkRowError] = []
+
+class ExportLink(BaseModel):
+    token: str
+    expires_in: int
+
+class DailyLeadCount(BaseModel):
+    date: str
+    count: int
+
+class DailyLeadStats(BaseModel):
+    total_leads: int
+    closed: int
+    lost: int
+    in_progress: int
+    conversion_rate: float
+    days: int
+    confidence: float
+    mean: Optional[float] = None
+    median: Optional[float] = None
+    mode: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    skewness: Optional[float] = None
+    kurtosis: Optional[float] = None
+    ci_lower: Optional[float] = None
+    ci_upper: Optional[float] = None
+    series: List[DailyLeadCount] = []
+
+class FunnelStage(BaseModel):
+    status: LeadStatus
+    reached: int
+    lost: int
+    conversion_from_previous: Optional[float] = None
+    conversion_from_start: Optional[float] = None
+
+class VendedorFunnel(BaseModel):
+    vendedor_id: int
+    total_leads: int
+    stages: List[FunnelStage]
+
+class LeadFunnel(BaseModel):
+    total_leads: int
+    stages: List[FunnelStage]
+    by_vendedor: List[VendedorFunnel] = []
+
+class StageDuration(BaseModel):
+    status: LeadStatus
+    transitions: int
+    median_seconds: float
+    p90_seconds: float
+
+class VendedorStageDurations(BaseModel):
+    vendedor_id: int
+    stages: List[StageDuration]
+
+class StageDurations(BaseModel):
+    stages: List[StageDuration]
+    by_vendedor: List[VendedorStageDurations] = []
+
+class VendedorRanking(BaseModel):
+    vendedor_id: int
+    name: str
+    leads: int
+    closed: int
+    lost: int
+    conversion_rate: float
+    loss_rate: float
+    avg_seconds_to_close: Optional[float] = None
+
+class IndicadorRanking(BaseModel):
+    indicador_id: int
+    name: str
+    leads: int
+    closed: int
+    lost: int
+    conversion_rate: float
+    loss_rate: float
+
+class Leaderboard(BaseModel):
+    rank_by: str
+    vendedores: List[VendedorRanking]
+    indicadores: List[IndicadorRanking]
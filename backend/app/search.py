@@ -0,0 +1,203 @@
+"""
+Índice de busca de leads (lead_search), mantido na mesma transação de cada escrita
+em leads, como o rollup diário. Guarda nome, telefone (só dígitos), cidade e
+observação já normalizados (minúsculas, sem acentos).
+
+SQLite: tabela FTS5 com tokenizador trigram (rowid = id do lead).
+PostgreSQL: tabela comum com índice GIN pg_trgm (extensões pg_trgm e unaccent).
+Nos dois, cada termo com 3+ caracteres casa com qualquer trecho dos campos.
+
+Ranking: entre os SEARCH_RANK_WINDOW leads mais recentes que casam, vence quem tem os
+termos nos campos de maior peso (nome > telefone > cidade > observação). Um ranking
+global (bm25) percorreria todos os leads que casam, centenas de milhares em termos
+comuns como "silva"; a janela mantém o custo limitado.
+
+Reconstrução completa (após alterar leads direto no banco):
+    python -m app.search rebuild
+"""
+from sqlalchemy import Column, Index, Integer, MetaData, Table, Text, and_, column, delete, func, insert, literal_column, select, table, update
+from typing import Optional
+import os
+import re
+import unicodedata
+from . import models
+
+SEARCH_TABLE = "lead_search"
+SEARCH_COLUMNS = ["client_name", "phone", "city_state", "observation"]
+# Peso de um termo encontrado em cada coluna (mesma ordem de SEARCH_COLUMNS)
+COLUMN_WEIGHTS = (8, 4, 2, 1)
+SEARCH_RANK_WINDOW = int(os.getenv("SEARCH_RANK_WINDOW", "500"))
+# Trigram: termos menores não têm como casar
+MIN_TERM_LENGTH = 3
+
+# SQLite: a tabela FTS5 é virtual e criada por DDL próprio; esta definição só monta as consultas
+fts_search = table(SEARCH_TABLE, column("rowid"), *(column(name) for name in SEARCH_COLUMNS))
+
+# PostgreSQL: os campos concatenados em `document`, que é o que o índice trigram cobre
+search_metadata = MetaData()
+pg_search = Table(
+    SEARCH_TABLE,
+    search_metadata,
+    Column("lead_id", Integer, primary_key=True),
+    *(Column(name, Text) for name in SEARCH_COLUMNS),
+    Column("document", Text, nullable=False),
+    Index("ix_lead_search_document", "document", postgresql_using="gin", postgresql_ops={"document": "gin_trgm_ops"}),
+)
+
+# Telefones digitados com máscara: "(11) 98765-4321", "+55 11 98765 4321"
+PHONE_QUERY = re.compile(r"[\d\s()+.\-]+")
+NON_DIGITS = re.compile(r"\D")
+
+def fold(text: Optional[str]) -> Optional[str]:
+    """Minúsculas e sem acentos ("São José" -> "sao jose")"""
+    if text is None:
+        return None
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def digits(text: Optional[str]) -> Optional[str]:
+    return NON_DIGITS.sub("", text) if text is not None else None
+
+def register_sqlite_functions(dbapi_connection):
+    """Funções usadas ao indexar; registradas em cada conexão SQLite (database._configure_sqlite)"""
+    dbapi_connection.create_function("search_fold", 1, fold)
+    dbapi_connection.create_function("search_digits", 1, digits)
+
+def _search_table(dialect_name: str):
+    # Retorna a tabela e a coluna com o id do lead (no FTS5, o rowid)
+    if dialect_name == "sqlite":
+        return fts_search, fts_search.c.rowid
+    return pg_search, pg_search.c.lead_id
+
+def _document_values(dialect_name: str):
+    leads = models.Lead
+    if dialect_name == "sqlite":
+        return [
+            func.search_fold(leads.client_name), func.search_digits(leads.phone),
+            func.search_fold(leads.city_state), func.search_fold(leads.observation),
+        ]
+    values = [
+        func.lower(func.unaccent(leads.client_name)), func.regexp_replace(leads.phone, r"\D", "", "g"),
+        func.lower(func.unaccent(leads.city_state)), func.lower(func.unaccent(leads.observation)),
+    ]
+    return [*values, func.concat_ws(" ", *values)]
+
+def create(connection):
+    """Cria a tabela e o índice de busca (idempotente)"""
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize='trigram')"
+        )
+        return
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS unaccent")
+    pg_search.create(bind=connection, checkfirst=True)
+
+def index_leads(connection, where):
+    """Indexa os leads de `where` (que ainda não estejam no índice)"""
+    dialect_name = connection.dialect.name
+    search_table, lead_id = _search_table(dialect_name)
+    connection.execute(insert(search_table).from_select(
+        [c.name for c in search_table.c], select(models.Lead.id, *_document_values(dialect_name)).where(where),
+    ))
+
+def unindex_leads(connection, where):
+    """Remove do índice os leads de `where`; chamar antes de apagá-los"""
+    search_table, lead_id = _search_table(connection.dialect.name)
+    connection.execute(delete(search_table).where(lead_id.in_(select(models.Lead.id).where(where))))
+
+def reindex_leads(connection, where):
+    unindex_leads(connection, where)
+    index_leads(connection, where)
+
+def set_observation(connection, where, observation: str):
+    """Troca a observação indexada dos leads de `where`, sem reler os leads"""
+    search_table, lead_id = _search_table(connection.dialect.name)
+    values = {"observation": fold(observation)}
+    if search_table is pg_search:
+        values["document"] = func.concat_ws(
+            " ", pg_search.c.client_name, pg_search.c.phone, pg_search.c.city_state, values["observation"]
+        )
+    connection.execute(
+        update(search_table).where(lead_id.in_(select(models.Lead.id).where(where))).values(values)
+    )
+
+def rebuild(connection):
+    """Recria o índice a partir de todos os leads"""
+    search_table, _ = _search_table(connection.dialect.name)
+    connection.execute(delete(search_table))
+    index_leads(connection, models.Lead.id.isnot(None))
+
+def query_terms(q: str) -> list:
+    """
+    Termos da busca, normalizados como o índice. Uma busca só com dígitos e máscara de
+    telefone vira um único termo de dígitos; termos curtos demais para o trigram são ignorados.
+    """
+    if PHONE_QUERY.fullmatch(q):
+        terms = [digits(q)]
+    else:
+        terms = fold(q).split()
+    return [term for term in dict.fromkeys(terms) if len(term) >= MIN_TERM_LENGTH]
+
+def _score(dialect_name: str, search_table, terms: list):
+    position = func.instr if dialect_name == "sqlite" else func.strpos
+    return sum(
+        (position(func.coalesce(search_table.c[name], ""), term) > 0).cast(Integer) * weight
+        for term in terms
+        for name, weight in zip(SEARCH_COLUMNS, COLUMN_WEIGHTS)
+    )
+
+def search_statement(
+    dialect_name: str,
+    terms: list,
+    limit: int = 20,
+    vendedor_id: Optional[int] = None,
+    indicador_id: Optional[int] = None,
+    columns=None,
+):
+    """
+    SELECT dos leads que contêm todos os `terms`, do mais relevante para o menos.
+    Compartilhado pelas camadas síncrona e assíncrona.
+    """
+    search_table, lead_id = _search_table(dialect_name)
+    candidates = select(lead_id.label("lead_id"), _score(dialect_name, search_table, terms).label("score"))
+    candidates = candidates.select_from(search_table).join(models.Lead, models.Lead.id == lead_id)
+    if dialect_name == "sqlite":
+        # Cada termo entre aspas: o FTS5 não interpreta operadores dentro dele
+        match = " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        candidates = candidates.where(literal_column(SEARCH_TABLE).op("MATCH")(match))
+    else:
+        candidates = candidates.where(and_(*(pg_search.c.document.contains(term, autoescape=True) for term in terms)))
+    if vendedor_id is not None:
+        candidates = candidates.where(models.Lead.vendedor_id == vendedor_id)
+    if indicador_id is not None:
+        candidates = candidates.where(models.Lead.indicador_id == indicador_id)
+    candidates = candidates.order_by(lead_id.desc()).limit(SEARCH_RANK_WINDOW).subquery()
+
+    return (
+        select(*(columns or (models.Lead,)))
+        .join(candidates, candidates.c.lead_id == models.Lead.id)
+        .order_by(candidates.c.score.desc(), models.Lead.id.desc())
+        .limit(limit)
+    )
+
+def main():
+    import argparse
+    import time
+    from . import database
+
+    parser = argparse.ArgumentParser(description="Manutenção do índice de busca de leads")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    start = time.perf_counter()
+    with database.engine.begin() as conn:
+        # Trava de manutenção: nenhuma escrita em leads durante a reconstrução
+        database.lock_leads(conn)
+        create(conn)
+        rebuild(conn)
+    print(f"Índice de busca reconstruído em {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from itertools import chain
+from datetime import date
+from typing import Optional
+import numpy as np
+import scipy.stats as stats
+import os
+from . import models, database
+from .cache import TTLCache
+
+CONFIANCA = 0.95
+
+# Rankings completos por (versão de leads, período): qualquer escrita em leads muda a
+# versão e, com ela, a chave; o TTL só limita a memória das versões antigas
+leaderboard_cache = TTLCache(
+    maxsize=int(os.getenv("LEADERBOARD_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("LEADERBOARD_CACHE_TTL_SECONDS", "300")),
+)
+
+# Critérios de ordenação do ranking, com desempate
+RANKING_KEYS = {
+    "closed": lambda r: (r["closed"], r["conversion_rate"], r["leads"]),
+    "leads": lambda r: (r["leads"], r["closed"]),
+    "conversion_rate": lambda r: (r["conversion_rate"], r["closed"]),
+}
+
+def _as_float(value) -> Optional[float]:
+    # NaN/inf não são serializáveis em JSON; o dashboard trata None como "N/A"
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+def _daily_distribution(totais: np.ndarray) -> dict:
+    """
+    Replica as estatísticas que o dashboard calculava com pandas
+    (std com ddof=1, skew/kurtosis com correção de viés, moda = menor valor mais frequente)
+    """
+    n = totais.size
+    media = totais.mean()
+    desvio_padrao = totais.std(ddof=1) if n > 1 else np.nan
+
+    valores, frequencias = np.unique(totais, return_counts=True)
+    moda = valores[frequencias.argmax()]
+
+    desvios = totais - media
+    m2 = np.mean(desvios ** 2)
+    if n < 3:
+        assimetria = np.nan
+    elif m2 == 0:
+        assimetria = 0.0
+    else:
+        assimetria = stats.skew(totais, bias=False)
+    if n < 4:
+        curtose = np.nan
+    elif m2 == 0:
+        curtose = 0.0
+    else:
+        curtose = stats.kurtosis(totais, bias=False)
+
+    ic_inferior = ic_superior = None
+    if n > 1:
+        t_critico = stats.t.ppf((1 + CONFIANCA) / 2, n - 1)
+        margem_erro = t_critico * desvio_padrao / np.sqrt(n)
+        ic_inferior = _as_float(media - margem_erro)
+        ic_superior = _as_float(media + margem_erro)
+
+    return {
+        "mean": _as_float(media),
+        "median": _as_float(np.median(totais)),
+        "mode": _as_float(moda),
+        "std": _as_float(desvio_padrao),
+        "min": _as_float(totais.min()),
+        "max": _as_float(totais.max()),
+        "skewness": _as_float(assimetria),
+        "kurtosis": _as_float(curtose),
+        "ci_lower": ic_inferior,
+        "ci_upper": ic_superior,
+    }
+
+def leads_daily_stats(
+    db: Session,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+):
+    por_status = database.get_lead_status_counts(db, start_date, end_date, vendedor_id)
+    por_dia = database.get_leads_per_day(db, start_date, end_date, vendedor_id)
+
+    total_leads = sum(por_status.values())
+    fechados = por_status.get(models.LeadStatus.FECHADO, 0)
+    perdidos = por_status.get(models.LeadStatus.PERDIDO, 0)
+
+    result = {
+        "total_leads": total_leads,
+        "closed": fechados,
+        "lost": perdidos,
+        "in_progress": total_leads - fechados - perdidos,
+        "conversion_rate": (fechados / total_leads * 100) if total_leads > 0 else 0.0,
+        "days": len(por_dia),
+        "confidence": CONFIANCA,
+        "series": [{"date": str(dia), "count": total} for dia, total in por_dia],
+    }
+    if por_dia:
+        totais = np.fromiter((total for _, total in por_dia), dtype=np.float64, count=len(por_dia))
+        result.update(_daily_distribution(totais))
+    return result
+
+def _percent(part, whole) -> Optional[float]:
+    return float(part / whole * 100) if whole else None
+
+def _funnel_stages(reached: np.ndarray, continued: np.ndarray, lost: np.ndarray) -> list:
+    # reached[i]: leads que passaram pela etapa i; continued[i]: os que passaram pela etapa
+    # anterior e também pela i (sem contar quem pulou etapas)
+    return [
+        {
+            "status": status,
+            "reached": int(reached[i]),
+            "lost": int(lost[i]),
+            "conversion_from_previous": _percent(continued[i], reached[i - 1]) if i else None,
+            "conversion_from_start": _percent(reached[i], reached[0]),
+        }
+        for i, status in enumerate(database.FUNNEL_STAGES)
+    ]
+
+def lead_funnel(
+    db: Session,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+):
+    """
+    Funil dos leads criados no período, geral e por vendedor, pelas etapas registradas no
+    histórico de status (não cumulativo: quem pulou uma etapa não conta nela)
+    """
+    etapas = len(database.FUNNEL_STAGES)
+    indices = {status: i for i, status in enumerate(database.FUNNEL_STAGES)}
+    bits = 1 << np.arange(etapas)
+    reached = defaultdict(lambda: np.zeros(etapas, dtype=np.int64))
+    continued = defaultdict(lambda: np.zeros(etapas, dtype=np.int64))
+    lost = defaultdict(lambda: np.zeros(etapas, dtype=np.int64))
+
+    for vendedor, mascara, total in database.get_funnel_reach(db, start_date, end_date, vendedor_id):
+        # A entrada conta todos os leads, inclusive os criados já em outra etapa (ou perdidos)
+        passou = ((int(mascara or 0) | 1) & bits) != 0
+        reached[vendedor] += passou * total
+        continued[vendedor][1:] += (passou[1:] & passou[:-1]) * total
+    for vendedor, origem, total in database.get_lost_by_stage(db, start_date, end_date, vendedor_id):
+        if origem in indices:
+            lost[vendedor][indices[origem]] += total
+
+    vendedores = sorted(reached)
+    zeros = np.zeros(etapas, dtype=np.int64)
+    total_reached = sum((reached[v] for v in vendedores), zeros)
+    total_continued = sum((continued[v] for v in vendedores), zeros)
+    total_lost = sum((lost[v] for v in vendedores), zeros)
+    return {
+        "total_leads": int(total_reached[0]),
+        "stages": _funnel_stages(total_reached, total_continued, total_lost),
+        "by_vendedor": [
+            {
+                "vendedor_id": v,
+                "total_leads": int(reached[v][0]),
+                "stages": _funnel_stages(reached[v], continued[v], lost[v]),
+            }
+            for v in vendedores
+        ],
+    }
+
+def _group_percentiles(keys: np.ndarray, values: np.ndarray, percents=(50, 90)):
+    """
+    Percentis (nearest-rank) de `values` por grupo (linhas de `keys`), sem laço em Python:
+    uma ordenação por (chaves, valor) e a posição ceil(n * p / 100) de cada grupo
+    """
+    order = np.lexsort((values, *keys.T[::-1]))
+    keys, values = keys[order], values[order]
+    groups, starts, counts = np.unique(keys, axis=0, return_index=True, return_counts=True)
+    return groups, counts, [values[starts + (counts * p + 99) // 100 - 1] for p in percents]
+
+def _durations(keys: np.ndarray, values: np.ndarray):
+    etapas = list(models.LeadStatus)
+    groups, counts, (medianas, p90s) = _group_percentiles(keys, values)
+    return groups, [
+        {"status": etapas[etapa], "transitions": int(n), "median_seconds": float(mediana), "p90_seconds": float(p90)}
+        for etapa, n, mediana, p90 in zip(groups[:, -1], counts, medianas, p90s)
+    ]
+
+def stage_durations(
+    db: Session,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vendedor_id: Optional[int] = None,
+):
+    """Mediana e p90 do tempo em cada etapa já encerrada, geral e por vendedor"""
+    rows = database.get_stage_durations(db, start_date, end_date, vendedor_id)
+    vendedores, etapas, segundos = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 3).T
+
+    _, geral = _durations(etapas[:, None], segundos)
+    groups, por_etapa = _durations(np.column_stack((vendedores, etapas)), segundos)
+    por_vendedor = defaultdict(list)
+    for vendedor, duracao in zip(groups[:, 0], por_etapa):
+        por_vendedor[int(vendedor)].append(duracao)
+    return {
+        "stages": geral,
+        "by_vendedor": [{"vendedor_id": v, "stages": etapas_v} for v, etapas_v in por_vendedor.items()],
+    }
+
+def _rankings(rows, id_field: str) -> list:
+    return [
+        {
+            id_field: user_id,
+            "name": name,
+            "leads": int(leads),
+            "closed": int(fechados),
+            "lost": int(perdidos),
+            "conversion_rate": fechados / leads * 100,
+            "loss_rate": perdidos / leads * 100,
+        }
+        for user_id, name, leads, fechados, perdidos in rows
+    ]
+
+def _build_leaderboard(db: Session, start_date: Optional[date], end_date: Optional[date]) -> dict:
+    vendedores = _rankings(database.get_lead_rankings(db, "vendedor_id", start_date, end_date), "vendedor_id")
+    tempos = database.get_time_to_close(db, start_date, end_date)
+    for vendedor in vendedores:
+        tempo = tempos.get(vendedor["vendedor_id"])
+        vendedor["avg_seconds_to_close"] = float(tempo) if tempo is not None else None
+    return {
+        "vendedores": vendedores,
+        "indicadores": _rankings(database.get_lead_rankings(db, "indicador_id", start_date, end_date), "indicador_id"),
+    }
+
+def leaderboard(
+    db: Session,
+    version: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = 10,
+    rank_by: str = "closed",
+):
+    """Top `limit` vendedores e indicadores do período; `version` é a versão atual de leads"""
+    key = (version, start_date, end_date)
+    board = leaderboard_cache.get(key)
+    if board is None:
+        board = _build_leaderboard(db, start_date, end_date)
+        leaderboard_cache.set(key, board)
+    ranking = RANKING_KEYS[rank_by]
+    return {
+        "rank_by": rank_by,
+        "vendedores": sorted(board["vendedores"], key=ranking, reverse=True)[:limit],
+        "indicadores": sorted(board["indicadores"], key=ranking, reverse=True)[:limit],
+    }
@@ -0,0 +1,347 @@
+"""
+Benchmark da API: vazão e latências p50/p95/p99 por endpoint (login, criação de lead,
+listagem por perfil, atualização de status e estatísticas), com clientes concorrentes,
+no app em processo (httpx + ASGITransport, sem rede) e via uvicorn (1 worker).
+
+Os leads são gerados com os mesmos geradores de populate_db.py (nomes, cidades, DDDs,
+observações e pesos de status), direto nas tabelas; as migrações seguintes à criação do
+schema fazem o backfill do log de alterações, rollup, histórico e índice de busca, como
+num banco já existente. Com --database-url de um banco já gerado, os dados são
+reaproveitados (gerar 10M leads leva vários minutos).
+
+O resultado vai para um JSON (commit, dataset, ambiente e métricas por modo, endpoint e
+concorrência); --compare mostra a variação entre dois resultados e sai com código 1 se
+algum p95 piorou mais que --threshold.
+
+Uso:
+    python benchmarks/bench_api.py                                   # 10k leads, SQLite temporário
+    python benchmarks/bench_api.py --dataset 1m --database-url sqlite:////tmp/bench-1m.db
+    python benchmarks/bench_api.py --modes uvicorn --concurrency 10 100 --requests 2000
+    python benchmarks/bench_api.py --compare benchmarks/results/antes.json   # roda e compara
+    python benchmarks/bench_api.py --compare antes.json depois.json          # só compara
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+import httpx
+from sqlalchemy import func, select
+
+# Os módulos do app leem DATABASE_URL na importação: são importados em main(), depois
+# de apontar o ambiente para o banco do benchmark
+
+DATASETS = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+BATCH_SIZE = 50_000
+BENCH_PASSWORD = "bench123"
+# Domínio válido para o EmailStr do login (".local" é recusado)
+BENCH_EMAIL_DOMAIN = "bench.indicavende.me"
+# Até esta migração só há criação de tabelas; as seguintes calculam dados a partir dos leads
+SCHEMA_MIGRATION = 4
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def generate_dataset(engine, total: int, vendedores: int = 50, indicadores: int = 200, dias: int = 365, seed: int = 42):
+    import populate_db
+    from app import migrations, models, passwords
+
+    rng = random.Random(seed)
+    migrations.run_migrations(engine, target=SCHEMA_MIGRATION)
+    password = passwords.hasher.hash(BENCH_PASSWORD)
+    users = [{"name": "Gestor", "email": f"gestor@{BENCH_EMAIL_DOMAIN}", "password": password, "role": models.UserRole.GESTOR}]
+    users += [{"name": f"Vendedor {i}", "email": f"vendedor{i}@{BENCH_EMAIL_DOMAIN}", "password": password, "role": models.UserRole.VENDEDOR} for i in range(vendedores)]
+    users += [{"name": f"Indicador {i}", "email": f"indicador{i}@{BENCH_EMAIL_DOMAIN}", "password": password, "role": models.UserRole.INDICADOR} for i in range(indicadores)]
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), users)
+    bench_users = load_users(engine)
+
+    hoje = datetime.now()
+    vendedor_ids = [user.id for user in bench_users["vendedor"]]
+    indicador_ids = [user.id for user in bench_users["indicador"]]
+    for offset in range(0, total, BATCH_SIZE):
+        # phone_normalized só existe a partir da migração 9, que o preenche
+        rows = [populate_db.gerar_lead(vendedor_ids, indicador_ids, hoje, dias, rng) for _ in range(min(BATCH_SIZE, total - offset))]
+        with engine.begin() as conn:
+            conn.execute(models.Lead.__table__.insert(), rows)
+
+    start = time.perf_counter()
+    migrations.run_migrations(engine)
+    print(f"Backfill das migrações em {time.perf_counter() - start:.1f} s")
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+def load_users(engine) -> dict:
+    """Usuários do benchmark por perfil (vazio se o banco ainda não foi gerado)"""
+    from app import models
+
+    users = {role.value: [] for role in models.UserRole}
+    with engine.connect() as conn:
+        rows = conn.execute(
+            models.User.__table__.select().where(models.User.email.like(f"%@{BENCH_EMAIL_DOMAIN}")).order_by(models.User.id)
+        )
+        for row in rows:
+            users[row.role.value].append(SimpleNamespace(id=row.id, email=row.email, name=row.name, role=row.role))
+    return users
+
+def percentile(values: list, p: float) -> float:
+    # Nearest-rank sobre a lista já ordenada
+    return values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))]
+
+def summarize(timings: list, statuses: Counter, elapsed: float) -> dict:
+    timings.sort()
+    return {
+        "requests": len(timings),
+        "errors": sum(count for status, count in statuses.items() if status == "error" or status >= 400),
+        "status_codes": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "rps": len(timings) / elapsed,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": percentile(timings, 50),
+        "p95_ms": percentile(timings, 95),
+        "p99_ms": percentile(timings, 99),
+        "max_ms": timings[-1],
+    }
+
+def build_scenarios(users: dict, lead_ids: list, headers: dict) -> dict:
+    """Endpoint -> função (client, rng) que faz uma requisição"""
+    import populate_db
+    from app import models
+
+    vendedor_emails = [user.email for user in users["vendedor"]]
+    vendedor_ids = [user.id for user in users["vendedor"]]
+    statuses = [status.value for status in models.LeadStatus]
+    hoje = datetime.now()
+
+    def new_lead(rng):
+        # Sem vendedor_id: o lead passa pelo dedup e pelo routing, como no formulário do indicador
+        lead = populate_db.gerar_lead(vendedor_ids, [0], hoje, rng=rng)
+        return {key: lead[key] for key in ("client_name", "phone", "city_state", "observation")}
+
+    return {
+        "POST /auth/login": lambda client, rng: client.post(
+            "/auth/login", json={"email": rng.choice(vendedor_emails), "password": BENCH_PASSWORD}
+        ),
+        "POST /leads/": lambda client, rng: client.post("/leads/", headers=headers["indicador"], json=new_lead(rng)),
+        "GET /leads/ (gestor)": lambda client, rng: client.get("/leads/", headers=headers["gestor"], params={"limit": 50}),
+        "GET /leads/ (vendedor)": lambda client, rng: client.get("/leads/", headers=headers["vendedor"], params={"limit": 50}),
+        "GET /leads/ (indicador)": lambda client, rng: client.get("/leads/", headers=headers["indicador"], params={"limit": 50}),
+        "PUT /leads/{id}": lambda client, rng: client.put(
+            f"/leads/{rng.choice(lead_ids)}", headers=headers["vendedor"], json={"status": rng.choice(statuses)}
+        ),
+        "GET /stats/leads/daily": lambda client, rng: client.get(
+            "/stats/leads/daily", headers=headers["gestor"], params={"vendedor_id": rng.choice(vendedor_ids)}
+        ),
+        "GET /stats/funnel": lambda client, rng: client.get("/stats/funnel", headers=headers["gestor"]),
+        "GET /stats/leaderboard": lambda client, rng: client.get(
+            "/stats/leaderboard", headers=headers["gestor"], params={"days": 30}
+        ),
+    }
+
+async def run_scenario(client, request, concurrency: int, total: int, warmup: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        await request(client, rng)
+
+    timings = []
+    statuses = Counter()
+    queue = iter(range(total))
+
+    async def worker():
+        for _ in queue:
+            start = time.perf_counter()
+            try:
+                status = (await request(client, rng)).status_code
+            except httpx.HTTPError:
+                status = "error"
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(timings, statuses, time.perf_counter() - start)
+
+async def run_inprocess(scenarios: dict, args) -> list:
+    from app import async_database
+    from app.main import app
+
+    # Sem lifespan no ASGITransport: o engine assíncrono é fechado aqui (as threads do
+    # aiosqlite impediriam o processo de terminar)
+    transport = httpx.ASGITransport(app=app)
+    try:
+        return await run_mode(
+            "inprocess", lambda concurrency: httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout),
+            scenarios, args,
+        )
+    finally:
+        await async_database.async_engine.dispose()
+
+async def run_mode(mode: str, client_factory, scenarios: dict, args) -> list:
+    results = []
+    for endpoint, request in scenarios.items():
+        # bcrypt domina o login por projeto: menos requisições para não dominar o tempo do benchmark
+        total = args.login_requests if endpoint == "POST /auth/login" else args.requests
+        for concurrency in args.concurrency:
+            async with client_factory(concurrency) as client:
+                result = await run_scenario(client, request, concurrency, total, args.warmup, args.seed)
+            results.append({"mode": mode, "endpoint": endpoint, "concurrency": concurrency, **result})
+            print(f"{mode:9s} {endpoint:24s} c={concurrency:<4d} {result['rps']:8.1f} req/s  "
+                  f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f} ms  "
+                  f"erros {result['errors']}")
+    return results
+
+def git_commit() -> dict:
+    def git(*command):
+        return subprocess.run(["git", *command], capture_output=True, text=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+def result_key(result: dict) -> tuple:
+    return result["mode"], result["endpoint"], result["concurrency"]
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Imprime a variação de vazão e p95 por endpoint; retorna True se houve regressão"""
+    before = {result_key(r): r for r in baseline["results"]}
+    regressed = False
+    print(f"\n===== COMPARAÇÃO: {baseline.get('commit')} -> {current.get('commit')} =====")
+    for result in current["results"]:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        rps_change = (result["rps"] / old["rps"] - 1) * 100 if old["rps"] else 0.0
+        p95_change = (result["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0.0
+        flag = p95_change > threshold
+        regressed |= flag
+        mode, endpoint, concurrency = result_key(result)
+        print(f"{'⚠️ ' if flag else '   '}{mode:9s} {endpoint:24s} c={concurrency:<4d} "
+              f"{old['rps']:8.1f} -> {result['rps']:8.1f} req/s ({rps_change:+6.1f}%)  "
+              f"p95 {old['p95_ms']:7.1f} -> {result['p95_ms']:7.1f} ms ({p95_change:+6.1f}%)")
+    return regressed
+
+def load_result(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", choices=list(DATASETS), default="10k")
+    parser.add_argument("--leads", type=int, default=None, help="Quantidade de leads (substitui --dataset)")
+    parser.add_argument("--database-url", default=None, help="Banco do benchmark; se já gerado, é reaproveitado (padrão: SQLite temporário)")
+    parser.add_argument("--modes", nargs="+", choices=["inprocess", "uvicorn"], default=["inprocess", "uvicorn"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=500, help="Requisições por endpoint e nível de concorrência")
+    parser.add_argument("--login-requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10, help="Requisições descartadas antes de medir cada endpoint")
+    parser.add_argument("--endpoints", nargs="+", default=None, help="Só os endpoints cujo nome contém um destes trechos")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout por requisição, em segundos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help=f"Arquivo JSON do resultado (padrão: {RESULTS_DIR}/<data>-<commit>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", default=None,
+                        help="Um arquivo: compara o resultado desta execução com ele; dois: só compara os dois")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Piora de p95 (%%) considerada regressão")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        sys.exit(1 if compare(load_result(args.compare[0]), load_result(args.compare[1]), args.threshold) else 0)
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare aceita um ou dois arquivos")
+
+    total = args.leads if args.leads is not None else DATASETS[args.dataset]
+    tmpdir = None
+    url = args.database_url
+    if url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    os.environ["DATABASE_URL"] = url
+    os.environ["EMAIL_WORKER_ENABLED"] = "false"
+
+    from app import auth, database, migrations, models, passwords
+    from bench_async import start_server
+
+    engine = database.create_db_engine(url)
+    migrations.run_migrations(engine, target=SCHEMA_MIGRATION)
+    users = load_users(engine)
+    if users["vendedor"]:
+        print(f"Reaproveitando os dados de {url}")
+    else:
+        start = time.perf_counter()
+        generate_dataset(engine, total)
+        print(f"{total} leads gerados em {time.perf_counter() - start:.1f} s ({engine.dialect.name})")
+        users = load_users(engine)
+    migrations.run_migrations(engine)
+    with engine.connect() as conn:
+        lead_count = conn.scalar(select(func.count()).select_from(models.Lead.__table__))
+        lead_ids = list(conn.scalars(
+            select(models.Lead.id).where(models.Lead.vendedor_id == users["vendedor"][0].id).limit(10_000)
+        ))
+    engine.dispose()
+
+    headers = {role: {"Authorization": f"Bearer {auth.create_access_token(role_users[0])}"} for role, role_users in users.items()}
+    scenarios = build_scenarios(users, lead_ids, headers)
+    if args.endpoints:
+        scenarios = {name: request for name, request in scenarios.items() if any(part in name for part in args.endpoints)}
+
+    results = []
+    for mode in args.modes:
+        if mode == "inprocess":
+            results += asyncio.run(run_inprocess(scenarios, args))
+            continue
+        env = {**os.environ, "SECRET_KEY": auth.SECRET_KEY}
+        process = start_server("app.main:app", args.port, env)
+        try:
+            factory = lambda concurrency: httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout,
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            )
+            results += asyncio.run(run_mode(mode, factory, scenarios, args))
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    report = {
+        **git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "dataset": {"leads": lead_count, "database": engine.dialect.name, "users": {role: len(u) for role, u in users.items()}},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "bcrypt_rounds": passwords.BCRYPT_ROUNDS,
+        },
+        "settings": {
+            "requests": args.requests, "login_requests": args.login_requests,
+            "concurrency": args.concurrency, "warmup": args.warmup, "seed": args.seed,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{report['commit'] or 'sem-commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResultado salvo em {output}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    if args.compare:
+        sys.exit(1 if compare(load_result(args.compare[0]), report, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Teste de carga: rotas síncronas (threadpool + SessionLocal) x rotas assíncronas
+(AsyncEngine com aiosqlite/asyncpg) para GET /leads/, POST /leads/ e PUT /leads/{id}.
+
+Sobe um uvicorn (1 worker) para cada variante sobre o mesmo banco e dispara
+requisições concorrentes, reportando vazão e latências p50/p99.
+
+Uso:
+    python benchmarks/bench_async.py                        # SQLite temporário, 20k leads
+    python benchmarks/bench_async.py --concurrency 50 200 1000 --requests 4000
+    python benchmarks/bench_async.py --database-url postgresql://...
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import asyncio
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app import auth, database, migrations, models, schemas
+from bench_indexes import generate_leads
+
+# Variante síncrona das rotas, como eram antes da camada assíncrona
+sync_app = FastAPI()
+
+@sync_app.get("/leads/", response_model=schemas.LeadPage)
+def sync_get_leads(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(database.get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    statement = database.leads_page_statement(cursor, limit, vendedor_id=current_user.id)
+    leads, next_cursor = database.split_page(db.scalars(statement).all(), limit)
+    return {"items": leads, "next_cursor": next_cursor}
+
+@sync_app.post("/leads/", response_model=schemas.LeadResponse)
+def sync_create_lead(
+    lead: schemas.LeadCreate,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    return database.create_lead(db, lead, current_user.id)
+
+@sync_app.put("/leads/{lead_id}", response_model=schemas.LeadResponse)
+def sync_update_lead_status(
+    lead_id: int,
+    lead_update: schemas.LeadUpdate,
+    db: Session = Depends(database.get_db),
+    current_user: schemas.CurrentUser = Depends(auth.get_current_user)
+):
+    db_lead = database.update_lead_status(db, lead_id, lead_update)
+    if db_lead is None:
+        raise HTTPException(status_code=404, detail="Lead não encontrado")
+    return db_lead
+
+VARIANTS = {
+    "sync": "bench_async:sync_app",
+    "async": "app.main:app",
+}
+
+def start_server(app_path: str, port: int, env: dict):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        env={**env, "PYTHONPATH": os.path.dirname(__file__)},
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"uvicorn não subiu: {app_path}")
+
+async def run_load(base_url: str, scenario: str, concurrency: int, total: int, headers: dict, lead_ids: list, vendedor_id: int, timeout: float):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timings = []
+    errors = 0
+    queue = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=timeout) as client:
+        async def request():
+            if scenario == "GET /leads/":
+                return await client.get("/leads/", params={"limit": 50})
+            if scenario == "POST /leads/":
+                return await client.post("/leads/", json={
+                    "client_name": "Cliente carga", "phone": "(11) 90000-0000",
+                    "city_state": "São Paulo/SP", "vendedor_id": vendedor_id,
+                })
+            return await client.put(f"/leads/{random.choice(lead_ids)}", json={"status": random.choice(list(models.LeadStatus)).value})
+
+        async def worker():
+            nonlocal errors
+            for _ in queue:
+                start = time.perf_counter()
+                try:
+                    response = await request()
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                timings.append((time.perf_counter() - start) * 1000)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    timings.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(timings),
+        "p99_ms": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20_000)
+    parser.add_argument("--requests", type=int, default=2000, help="Requisições por cenário e nível de concorrência")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout por requisição, em segundos")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--database-url", default=None, help="Banco vazio para o benchmark (padrão: SQLite temporário)")
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.database_url
+    if url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    engine = database.create_db_engine(url)
+    migrations.run_migrations(engine)
+    vendedor_ids, _ = generate_leads(engine, args.leads)
+    with engine.connect() as conn:
+        lead_ids = [row[0] for row in conn.execute(
+            models.Lead.__table__.select().with_only_columns(models.Lead.id).where(models.Lead.vendedor_id == vendedor_ids[0])
+        )]
+    engine.dispose()
+
+    vendedor = SimpleNamespace(id=vendedor_ids[0], email="vendedor0@bench.local", name="Vendedor 0", role=models.UserRole.VENDEDOR)
+    headers = {"Authorization": f"Bearer {auth.create_access_token(vendedor)}"}
+    env = {**os.environ, "DATABASE_URL": url, "SECRET_KEY": auth.SECRET_KEY, "EMAIL_WORKER_ENABLED": "false"}
+
+    results = {}
+    for variant in args.variants:
+        process = start_server(VARIANTS[variant], args.port, env)
+        try:
+            for scenario in ("GET /leads/", "POST /leads/", "PUT /leads/{id}"):
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run_load(
+                        f"http://127.0.0.1:{args.port}", scenario, concurrency, args.requests, headers, lead_ids, vendedor_ids[0], args.timeout
+                    ))
+                    results[(scenario, concurrency, variant)] = result
+                    print(f"{variant:5s} {scenario:16s} c={concurrency:<5d} {result['rps']:8.1f} req/s  "
+                          f"p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  erros {result['errors']}")
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                # Worker travado (threadpool esgotado) não termina o shutdown gracioso
+                process.kill()
+                process.wait()
+
+    print("\n===== RESUMO (req/s, p99) =====")
+    for scenario in ("GET /leads/", "POST /leads/", "PUT /leads/{id}"):
+        for concurrency in args.concurrency:
+            print(f"{scenario:16s} c={concurrency:<5d}" + "".join(
+                f"  {variant} {results[(scenario, concurrency, variant)]['rps']:8.1f} ({results[(scenario, concurrency, variant)]['p99_ms']:7.1f} ms)"
+                for variant in args.variants
+            ))
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+if __name__ == "__main__":
+    main()
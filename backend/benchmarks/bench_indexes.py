@@ -0,0 +1,176 @@
+"""
+Benchmark dos índices de leads: planos de execução e tempos das consultas quentes
+antes e depois da migração 002 (índices compostos).
+
+Uso:
+    python benchmarks/bench_indexes.py                      # 1M leads em SQLite temporário
+    python benchmarks/bench_indexes.py --leads 100000
+    python benchmarks/bench_indexes.py --database-url postgresql://...
+"""
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import sessionmaker
+
+from app import database, migrations, models
+
+INDEX_MIGRATION = 2
+BATCH_SIZE = 50_000
+
+def generate_leads(engine, total: int, vendedores: int = 50, indicadores: int = 200, dias: int = 365):
+    users = [{"name": f"Vendedor {i}", "email": f"vendedor{i}@bench.local", "password": "x", "role": models.UserRole.VENDEDOR} for i in range(vendedores)]
+    users += [{"name": f"Indicador {i}", "email": f"indicador{i}@bench.local", "password": "x", "role": models.UserRole.INDICADOR} for i in range(indicadores)]
+    with engine.begin() as conn:
+        conn.execute(models.User.__table__.insert(), users)
+    vendedor_ids = list(range(1, vendedores + 1))
+    indicador_ids = list(range(vendedores + 1, vendedores + indicadores + 1))
+
+    status_opcoes = list(models.LeadStatus)
+    status_pesos = [0.3, 0.25, 0.2, 0.15, 0.1]
+    inicio = datetime.now() - timedelta(days=dias)
+    segundos = dias * 86400
+
+    for offset in range(0, total, BATCH_SIZE):
+        rows = [
+            {
+                "client_name": f"Cliente {offset + i}",
+                "phone": f"(11) 9{random.randint(1000, 9999)}-{random.randint(1000, 9999)}",
+                "city_state": "São Paulo/SP",
+                "observation": None,
+                "status": status,
+                "indicador_id": random.choice(indicador_ids),
+                "vendedor_id": random.choice(vendedor_ids),
+                "created_at": inicio + timedelta(seconds=random.randint(0, segundos)),
+            }
+            for i, status in enumerate(random.choices(status_opcoes, weights=status_pesos, k=min(BATCH_SIZE, total - offset)))
+        ]
+        with engine.begin() as conn:
+            conn.execute(models.Lead.__table__.insert(), rows)
+    return vendedor_ids, indicador_ids
+
+def raw_leads_per_day(db, **filters):
+    # Estatísticas agregadas direto da tabela de leads (as rotas leem o rollup lead_daily_counts)
+    dia = func.date(models.Lead.created_at)
+    query = database._filter_leads(db.query(dia, func.count(models.Lead.id)), **filters)
+    return query.group_by(dia).order_by(dia).all()
+
+def raw_lead_status_counts(db, **filters):
+    query = database._filter_leads(db.query(models.Lead.status, func.count(models.Lead.id)), **filters)
+    return dict(query.group_by(models.Lead.status).all())
+
+def leads_page(db, **filters):
+    # Mesma consulta de GET /leads/, com as colunas que já existem antes da migração 002
+    columns = [column for column in database.LEAD_COLUMNS if column.key != "duplicate_of_id"]
+    return db.execute(database.leads_page_statement(limit=100, columns=columns, **filters)).all()
+
+def hot_queries(vendedor_id: int, indicador_id: int):
+    desde = (datetime.now() - timedelta(days=30)).date()
+    return {
+        "GET /leads/ (gestor)": lambda db: leads_page(db),
+        "GET /leads/ (vendedor)": lambda db: leads_page(db, vendedor_id=vendedor_id),
+        "GET /leads/ (indicador)": lambda db: leads_page(db, indicador_id=indicador_id),
+        "leads por dia (30 dias)": lambda db: raw_leads_per_day(db, start_date=desde),
+        "leads por dia (vendedor)": lambda db: raw_leads_per_day(db, vendedor_id=vendedor_id),
+        "contagem por status (30 dias)": lambda db: raw_lead_status_counts(db, start_date=desde),
+        "leads por status (novo)": lambda db: db.query(models.Lead.id, models.Lead.created_at)
+            .filter(models.Lead.status == models.LeadStatus.NOVO)
+            .order_by(models.Lead.created_at.desc()).limit(100).all(),
+    }
+
+def explain(engine, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+    if engine.dialect.name == "sqlite":
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+def measure(engine, queries, repeat: int):
+    Session = sessionmaker(bind=engine)
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    results = {}
+    for name, query in queries.items():
+        captured.clear()
+        event.listen(engine, "before_cursor_execute", capture)
+        with Session() as db:
+            query(db)
+        event.remove(engine, "before_cursor_execute", capture)
+        plan = explain(engine, *captured[-1])
+
+        timings = []
+        for _ in range(repeat):
+            with Session() as db:
+                start = time.perf_counter()
+                query(db)
+                timings.append((time.perf_counter() - start) * 1000)
+        results[name] = {"plan": plan, "median_ms": statistics.median(timings), "max_ms": max(timings)}
+    return results
+
+def report(label, results):
+    print(f"\n===== {label} =====")
+    for name, result in results.items():
+        print(f"\n{name}: mediana {result['median_ms']:.2f} ms (máx {result['max_ms']:.2f} ms)")
+        for line in result["plan"]:
+            print(f"    {line}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", default=None, help="Banco vazio para o benchmark (padrão: SQLite temporário)")
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.database_url
+    if url is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    engine = database.create_db_engine(url)
+
+    # Schema "antigo": tabelas sem os índices compostos
+    migrations.run_migrations(engine, target=INDEX_MIGRATION - 1)
+
+    start = time.perf_counter()
+    vendedor_ids, indicador_ids = generate_leads(engine, args.leads)
+    print(f"{args.leads} leads gerados em {time.perf_counter() - start:.1f} s ({engine.dialect.name})")
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    queries = hot_queries(vendedor_ids[0], indicador_ids[0])
+    antes = measure(engine, queries, args.repeat)
+    report("ANTES (sem índices compostos)", antes)
+
+    start = time.perf_counter()
+    migrations.run_migrations(engine)
+    print(f"\nMigração de índices aplicada em {time.perf_counter() - start:.1f} s")
+    if engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    depois = measure(engine, queries, args.repeat)
+    report("DEPOIS (com índices compostos)", depois)
+
+    print("\n===== RESUMO (mediana) =====")
+    for name in queries:
+        print(f"{name:40s} {antes[name]['median_ms']:10.2f} ms -> {depois[name]['median_ms']:10.2f} ms")
+
+    engine.dispose()
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,64 @@ from app.models import User, Lead, LeadStatus
 from datetime import datetime, timedelta
 import random
 
+# Nomes de clientes variados
+NOMES = [
+    "Maria Silva", "João Santos", "Ana Costa", "Pedro Oliveira", "Carla Souza",
+    "Lucas Ferreira", "Juliana Lima", "Roberto Alves", "Fernanda Rocha", "Bruno Martins",
+    "Patricia Gomes", "Rafael Barbosa", "Camila Ribeiro", "Diego Cardoso", "Leticia Dias",
+    "Marcos Pereira", "Renata Castro", "Thiago Monteiro", "Gabriela Freitas", "Felipe Araujo",
+    "Beatriz Cunha", "Andre Teixeira", "Vanessa Pinto", "Ricardo Moreira", "Amanda Correia",
+    "Gustavo Ramos", "Larissa Cavalcanti", "Fabio Melo", "Tatiana Borges", "Rodrigo Nunes"
+]
+
+CIDADES = [
+    "São Paulo/SP", "Rio de Janeiro/RJ", "Belo Horizonte/MG", "Curitiba/PR", 
+    "Porto Alegre/RS", "Salvador/BA", "Brasília/DF", "Fortaleza/CE",
+    "Recife/PE", "Manaus/AM", "Goiânia/GO", "Campinas/SP", "Florianópolis/SC"
+]
+
+TELEFONES_BASE = ["11", "21", "31", "41", "51", "71", "61", "85", "81", "92", "62", "19", "48"]
+
+OBSERVACOES = [
+    "Cliente interessado em pacote premium",
+    "Indicado por cliente atual",
+    "Precisa de atendimento urgente",
+    "Solicitou orçamento detalhado",
+    "Cliente corporativo - grande potencial",
+    "Aguardando resposta de proposta",
+    "Demonstrou muito interesse no produto",
+    "Cliente já conhece a marca",
+    None,
+    "Primeiro contato - avaliar necessidades"
+]
+
+STATUS_OPCOES = [
+    LeadStatus.NOVO,
+    LeadStatus.EM_CONTATO,
+    LeadStatus.EM_NEGOCIACAO,
+    LeadStatus.FECHADO,
+    LeadStatus.PERDIDO
+]
+
+# Pesos para distribuição mais realista (mais leads novos/em contato, menos fechados/perdidos)
+STATUS_PESOS = [0.3, 0.25, 0.2, 0.15, 0.1]
+
+def gerar_lead(vendedor_ids, indicador_ids, hoje: datetime, dias: int = 60, rng=random) -> dict:
+    """Dados de um lead aleatório; também usado pelo benchmark da API (benchmarks/bench_api.py)"""
+    # Distribuir leads ao longo dos últimos `dias` dias
+    dias_atras = rng.randint(0, dias)
+    ddd = rng.choice(TELEFONES_BASE)
+    return {
+        "client_name": rng.choice(NOMES),
+        "phone": f"({ddd}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        "city_state": rng.choice(CIDADES),
+        "observation": rng.choice(OBSERVACOES),
+        "status": rng.choices(STATUS_OPCOES, weights=STATUS_PESOS)[0],
+        "indicador_id": rng.choice(indicador_ids),
+        "vendedor_id": rng.choice(vendedor_ids),
+        "created_at": hoje - timedelta(days=dias_atras),
+    }
+
 def populate_database():
     db = SessionLocal()
     
@@ -20,81 +78,14 @@ def populate_database():
         print("Erro: É necessário ter pelo menos 1 vendedor e 1 indicador cadastrados")
         return
     
-    # Nomes de clientes variados
-    nomes = [
-        "Maria Silva", "João Santos", "Ana Costa", "Pedro Oliveira", "Carla Souza",
-        "Lucas Ferreira", "Juliana Lima", "Roberto Alves", "Fernanda Rocha", "Bruno Martins",
-        "Patricia Gomes", "Rafael Barbosa", "Camila Ribeiro", "Diego Cardoso", "Leticia Dias",
-        "Marcos Pereira", "Renata Castro", "Thiago Monteiro", "Gabriela Freitas", "Felipe Araujo",
-        "Beatriz Cunha", "Andre Teixeira", "Vanessa Pinto", "Ricardo Moreira", "Amanda Correia",
-        "Gustavo Ramos", "Larissa Cavalcanti", "Fabio Melo", "Tatiana Borges", "Rodrigo Nunes"
-    ]
-    
-    cidades = [
-        "São Paulo/SP", "Rio de Janeiro/RJ", "Belo Horizonte/MG", "Curitiba/PR", 
-        "Porto Alegre/RS", "Salvador/BA", "Brasília/DF", "Fortaleza/CE",
-        "Recife/PE", "Manaus/AM", "Goiânia/GO", "Campinas/SP", "Florianópolis/SC"
-    ]
-    
-    telefones_base = ["11", "21", "31", "41", "51", "71", "61", "85", "81", "92", "62", "19", "48"]
-    
-    observacoes = [
-        "Cliente interessado em pacote premium",
-        "Indicado por cliente atual",
-        "Precisa de atendimento urgente",
-        "Solicitou orçamento detalhado",
-        "Cliente corporativo - grande potencial",
-        "Aguardando resposta de proposta",
-        "Demonstrou muito interesse no produto",
-        "Cliente já conhece a marca",
-        None,
-        "Primeiro contato - avaliar necessidades"
-    ]
-    
-    status_opcoes = [
-        LeadStatus.NOVO,
-        LeadStatus.EM_CONTATO,
-        LeadStatus.EM_NEGOCIACAO,
-        LeadStatus.FECHADO,
-        LeadStatus.PERDIDO
-    ]
-    
-    # Pesos para distribuição mais realista (mais leads novos/em contato, menos fechados/perdidos)
-    status_pesos = [0.3, 0.25, 0.2, 0.15, 0.1]
-    
     # Criar leads distribuídos nos últimos 60 dias
     hoje = datetime.now()
     leads_criados = 0
     
+    vendedor_ids = [vendedor.id for vendedor in vendedores]
+    indicador_ids = [indicador.id for indicador in indicadores]
     for i in range(150):  # Criar 150 leads
-        # Distribuir leads ao longo dos últimos 60 dias
-        dias_atras = random.randint(0, 60)
-        data_criacao = hoje - timedelta(days=dias_atras)
-        
-        # Selecionar dados aleatórios
-        nome = random.choice(nomes)
-        cidade = random.choice(cidades)
-        ddd = random.choice(telefones_base)
-        telefone = f"({ddd}) 9{random.randint(1000, 9999)}-{random.randint(1000, 9999)}"
-        observacao = random.choice(observacoes)
-        status = random.choices(status_opcoes, weights=status_pesos)[0]
-        
-        vendedor = random.choice(vendedores)
-        indicador = random.choice(indicadores)
-        
-        # Criar lead
-        lead = Lead(
-            client_name=nome,
-            phone=telefone,
-            city_state=cidade,
-            observation=observacao,
-            status=status,
-            indicador_id=indicador.id,
-            vendedor_id=vendedor.id,
-            created_at=data_criacao
-        )
-        
-        db.add(lead)
+        db.add(Lead(**gerar_lead(vendedor_ids, indicador_ids, hoje)))
         leads_criados += 1
     
     db.commit()
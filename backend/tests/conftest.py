@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+# Antes de importar o app: banco SQLite temporário (app.database cria o engine na
+# importação) e sem o worker de email em background
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="indicavende-tests-"), "app.db")
+os.environ["EMAIL_WORKER_ENABLED"] = "false"
+
+import asyncio
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from types import SimpleNamespace
+from app import async_database, auth, database, migrations, models, routing
+from app.main import app
+
+@pytest.fixture
+def engine(tmp_path):
+    """Banco SQLite novo, com todas as migrações aplicadas"""
+    db_engine = database.create_db_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrations.run_migrations(db_engine)
+    yield db_engine
+    db_engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(autouse=True)
+def router(monkeypatch):
+    """Contadores do routing zerados a cada teste (cada um usa um banco novo)"""
+    lead_router = routing.LeadRouter("least_open", {}, routing.ROUTING_RESYNC_SECONDS)
+    monkeypatch.setattr(routing, "router", lead_router)
+    return lead_router
+
+@pytest.fixture
+def users(session_factory):
+    """Ids de um gestor, um indicador e dois vendedores"""
+    db = session_factory()
+    try:
+        created = {}
+        for key, role in (
+            ("gestor", models.UserRole.GESTOR),
+            ("indicador", models.UserRole.INDICADOR),
+            ("vendedor", models.UserRole.VENDEDOR),
+            ("vendedor2", models.UserRole.VENDEDOR),
+        ):
+            user = models.User(name=key.title(), email=f"{key}@example.com", password="-", role=role)
+            db.add(user)
+            db.flush()
+            created[key] = user.id
+        db.commit()
+        return created
+    finally:
+        db.close()
+
+@pytest.fixture
+def auth_headers(users):
+    """Headers com o token do usuário de `users` (chave: "gestor", "indicador"...)"""
+    def headers(key: str, scope: str = None) -> dict:
+        role = "vendedor" if key.startswith("vendedor") else key
+        user = SimpleNamespace(id=users[key], email=f"{key}@example.com", name=key.title(), role=role)
+        return {"Authorization": f"Bearer {auth.create_access_token(user, scope=scope)}"}
+    return headers
+
+@pytest.fixture
+def api(engine, session_factory):
+    """
+    O app com as sessões síncrona e assíncrona no banco do teste. Pool assíncrono com os
+    padrões (5 + 10 conexões) e timeout curto, para uma falta de conexões falhar logo.
+    """
+    async_engine = async_database.create_async_db_engine(str(engine.url), pool_timeout=5)
+    async_sessions = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+    async def get_async_db():
+        async with async_sessions() as db:
+            yield db
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[async_database.get_async_db] = get_async_db
+    app.dependency_overrides[database.get_db] = get_db
+    yield app
+    app.dependency_overrides.clear()
+    asyncio.run(async_engine.dispose())
@@ -0,0 +1,62 @@
+import json
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from app import auth
+
+USER = SimpleNamespace(id=7, email="ana@example.com", name="Ana", role="vendedor")
+
+def tamper(token: str, **claims) -> str:
+    payload, signature = token.split(".")
+    data = {**json.loads(auth._b64decode(payload)), **claims}
+    return f"{auth._b64encode(json.dumps(data).encode('utf-8'))}.{signature}"
+
+def test_token_round_trip():
+    claims = auth.decode_access_token(auth.create_access_token(USER))
+    assert (claims["sub"], claims["email"], claims["name"], claims["role"]) == (7, "ana@example.com", "Ana", "vendedor")
+    assert "scope" not in claims
+
+def test_expired_token_is_rejected():
+    assert auth.decode_access_token(auth.create_access_token(USER, expires_minutes=-1)) is None
+
+@pytest.mark.parametrize("forge", [
+    lambda token: tamper(token, role="gestor"),
+    lambda token: tamper(token, exp=4102444800),
+    lambda token: token[:-2] + ("AA" if not token.endswith("AA") else "BB"),
+    lambda token: token.split(".")[0],
+    lambda token: token + ".x",
+    lambda token: "não.é.token",
+])
+def test_tampered_token_is_rejected(forge):
+    assert auth.decode_access_token(forge(auth.create_access_token(USER))) is None
+
+def test_token_signed_with_another_key_is_rejected(monkeypatch):
+    token = auth.create_access_token(USER)
+    monkeypatch.setattr(auth, "SECRET_KEY", "outra-chave")
+    assert auth.decode_access_token(token) is None
+
+def test_scope_must_match():
+    export = auth.create_access_token(USER, scope="export")
+    session = auth.create_access_token(USER)
+    assert auth.decode_access_token(export, scope="export")["scope"] == "export"
+    assert auth.decode_access_token(export) is None
+    assert auth.decode_access_token(session, scope="export") is None
+
+def test_export_token_does_not_authenticate_the_api(api):
+    client = TestClient(api)
+    export = auth.create_access_token(USER, scope="export")
+    assert client.get("/leads/", headers={"Authorization": f"Bearer {export}"}).status_code == 401
+    # e o token de sessão não serve como link de exportação
+    session = auth.create_access_token(USER)
+    assert client.get("/leads/export", params={"token": session}).status_code == 401
+
+def test_missing_secret_key_generates_a_random_key(monkeypatch, capsys):
+    monkeypatch.delenv("SECRET_KEY", raising=False)
+    monkeypatch.delenv("SESSION_SECRET", raising=False)
+    first, second = auth._secret_key(), auth._secret_key()
+    assert first != second and len(first) >= 32
+    assert "SECRET_KEY não definida" in capsys.readouterr().out
+    monkeypatch.setenv("SESSION_SECRET", "da-sessao")
+    assert auth._secret_key() == "da-sessao"
+    monkeypatch.setenv("SECRET_KEY", "definida")
+    assert auth._secret_key() == "definida"
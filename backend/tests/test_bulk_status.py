@@ -0,0 +1,68 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app import database, models, schemas
+
+@pytest.fixture
+def client(api):
+    return TestClient(api)
+
+@pytest.fixture
+def leads(session_factory, users) -> dict:
+    """Dois leads em aberto de cada vendedor: {nome do vendedor: [ids]}"""
+    db = session_factory()
+    try:
+        created = {}
+        for key in ("vendedor", "vendedor2"):
+            created[key] = [
+                database.create_lead(db, schemas.LeadCreate(
+                    client_name=f"Cliente {key} {i}", phone=f"(11) 9{len(key)}{i:03d}-0000",
+                    city_state="São Paulo/SP", vendedor_id=users[key],
+                ), users["indicador"]).id
+                for i in range(2)
+            ]
+        return created
+    finally:
+        db.close()
+
+def statuses(session_factory) -> dict:
+    db = session_factory()
+    try:
+        return {lead_id: status.value for lead_id, status in db.execute(select(models.Lead.id, models.Lead.status))}
+    finally:
+        db.close()
+
+def test_vendedor_only_updates_own_leads(client, auth_headers, leads, session_factory):
+    every = leads["vendedor"] + leads["vendedor2"]
+    response = client.patch("/leads/bulk-status", headers=auth_headers("vendedor"), json={"ids": every, "status": "fechado"})
+    assert response.json() == {"updated": 2}
+    current = statuses(session_factory)
+    assert {current[lead_id] for lead_id in leads["vendedor"]} == {"fechado"}
+    assert {current[lead_id] for lead_id in leads["vendedor2"]} == {"novo"}
+
+def test_gestor_updates_by_filter(client, auth_headers, leads, users, session_factory):
+    response = client.patch("/leads/bulk-status", headers=auth_headers("gestor"), json={
+        "filter": {"vendedor_id": users["vendedor2"]}, "status": "perdido",
+    })
+    assert response.json() == {"updated": 2}
+    assert {statuses(session_factory)[lead_id] for lead_id in leads["vendedor2"]} == {"perdido"}
+
+def test_ids_and_filter_are_combined(client, auth_headers, leads, users):
+    response = client.patch("/leads/bulk-status", headers=auth_headers("gestor"), json={
+        "ids": [leads["vendedor"][0], leads["vendedor2"][0]], "filter": {"vendedor_id": users["vendedor2"]}, "status": "fechado",
+    })
+    assert response.json() == {"updated": 1}
+
+def test_indicador_cannot_bulk_update(client, auth_headers, leads):
+    response = client.patch("/leads/bulk-status", headers=auth_headers("indicador"), json={"ids": leads["vendedor"], "status": "fechado"})
+    assert response.status_code == 403
+
+@pytest.mark.parametrize("body, status_code", [
+    ({"ids": [], "status": "fechado"}, 422),
+    ({"ids": [], "filter": {"status": "novo"}, "status": "fechado"}, 422),
+    ({"status": "fechado"}, 400),
+    ({"filter": {}, "status": "fechado"}, 400),
+])
+def test_requires_ids_or_criteria(client, auth_headers, leads, session_factory, body, status_code):
+    assert client.patch("/leads/bulk-status", headers=auth_headers("gestor"), json=body).status_code == status_code
+    assert set(statuses(session_factory).values()) == {"novo"}
@@ -0,0 +1,64 @@
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app import database
+
+def lead(i: int) -> dict:
+    return {"client_name": f"Cliente {i}", "phone": f"(11) 9{i:04d}-0000", "city_state": "São Paulo/SP"}
+
+@pytest.fixture
+def client(api):
+    return TestClient(api)
+
+async def create_concurrently(app, headers: dict, count: int) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        return await asyncio.gather(*(client.post("/leads/", headers=headers, json=lead(i)) for i in range(count)))
+
+def test_token_round_trip(client, auth_headers):
+    headers = auth_headers("gestor")
+    created = [client.post("/leads/", headers=headers, json=lead(i)).json()["id"] for i in range(5)]
+
+    full = client.get("/leads/changes", headers=headers).json()
+    assert sorted(lead["id"] for lead in full["upserts"]) == created and not full["has_more"]
+    client.put(f"/leads/{created[0]}", headers=headers, json={"status": "em_contato"})
+    client.delete(f"/leads/{created[1]}", headers=headers)
+
+    changes = client.get("/leads/changes", headers=headers, params={"since": full["since"]}).json()
+    assert [(lead["id"], lead["status"]) for lead in changes["upserts"]] == [(created[0], "em_contato")]
+    assert changes["deletes"] == [created[1]]
+    assert client.get("/leads/changes", headers=headers, params={"since": changes["since"]}).json()["upserts"] == []
+
+def test_pages_with_has_more(client, auth_headers):
+    headers = auth_headers("gestor")
+    for i in range(5):
+        client.post("/leads/", headers=headers, json=lead(i))
+    first = client.get("/leads/changes", headers=headers, params={"limit": 3}).json()
+    assert len(first["upserts"]) == 3 and first["has_more"]
+    rest = client.get("/leads/changes", headers=headers, params={"since": first["since"], "limit": 3}).json()
+    assert len(rest["upserts"]) == 2 and not rest["has_more"]
+
+@pytest.mark.parametrize("since", ["0", "invalido"])
+def test_invalid_token_is_bad_request(client, auth_headers, since):
+    response = client.get("/leads/changes", headers=auth_headers("gestor"), params={"since": since})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Token inválido"
+
+def test_concurrent_creates_beyond_pool_size(api, client, auth_headers, session_factory):
+    headers = auth_headers("indicador")
+    etag = client.get("/leads/", headers=headers).headers["etag"]
+    # Bem acima de pool_size + max_overflow (15): cada escrita usa uma única conexão
+    count = 60
+    responses = asyncio.run(create_concurrently(api, headers, count))
+    assert [response.status_code for response in responses] == [200] * count
+
+    db = session_factory()
+    try:
+        # Uma versão por escrita, incrementada na própria transação
+        assert database.get_data_version(db, database.LEADS_SCOPE) == count
+    finally:
+        db.close()
+    assert client.get("/leads/", headers={**headers, "If-None-Match": etag}).status_code == 200
+    changes = client.get("/leads/changes", headers=headers).json()
+    assert len(changes["upserts"]) == count
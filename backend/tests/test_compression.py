@@ -0,0 +1,87 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from app import compression
+
+BODY = "lead;" * 1000
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(compression.CompressionMiddleware)
+
+    @app.get("/big")
+    def big():
+        return PlainTextResponse(BODY)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((BODY for _ in range(3)), media_type="text/csv")
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter([BODY]), media_type="text/event-stream")
+
+    return TestClient(app)
+
+@pytest.fixture
+def with_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "available_encodings", lambda: ("br", "gzip"))
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("deflate", None),
+    ("", None),
+    ("gzip;q=0", None),
+    ("*", "gzip"),
+    ("br", None),
+])
+def test_negotiate_without_brotli(monkeypatch, accept, expected):
+    monkeypatch.setattr(compression, "available_encodings", lambda: ("gzip",))
+    assert compression.negotiate_encoding(accept) == expected
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, deflate, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("gzip;q=0.8, br;q=0.9", "br"),
+    ("BR", "br"),
+    ("*;q=0.1, gzip;q=0", "br"),
+    ("br;q=abc, gzip", "gzip"),
+])
+def test_negotiate_with_brotli(with_brotli, accept, expected):
+    assert compression.negotiate_encoding(accept) == expected
+
+def test_gzip_response(client):
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(BODY)
+    assert response.text == BODY
+
+def test_small_and_unaccepted_responses_are_not_compressed(client):
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+
+def test_gzip_streaming_response(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == BODY * 3
+
+def test_event_stream_is_not_compressed(client):
+    response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+def test_brotli_response(client):
+    # Dependência opcional; com ela instalada, o httpx também decodifica br
+    pytest.importorskip("brotli")
+    response = client.get("/big", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.text == BODY
@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import func, select
+from app import database, dedup, models, schemas
+
+def lead(phone: str, observation: str = None, name: str = "Ana") -> schemas.LeadCreate:
+    return schemas.LeadCreate(client_name=name, phone=phone, city_state="São Paulo/SP", observation=observation)
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+def lead_count(db) -> int:
+    return db.scalar(select(func.count()).select_from(models.Lead))
+
+@pytest.mark.parametrize("phone, expected", [
+    ("(11) 98765-4321", "11987654321"),
+    ("+55 11 98765-4321", "11987654321"),
+    ("011 98765 4321", "11987654321"),
+    ("(11) 8765-4321", "11987654321"),
+    ("(11) 3456-7890", "1134567890"),
+    ("sem telefone", None),
+])
+def test_normalize_phone(phone, expected):
+    assert dedup.normalize_phone(phone) == expected
+
+def test_reject_refuses_same_phone(db, users):
+    original = database.create_lead(db, lead("(11) 98765-4321"), users["indicador"], policy="reject")
+
+    with pytest.raises(dedup.DuplicateLeadError) as error:
+        database.create_lead(db, lead("+55 11 98765 4321"), users["indicador"], policy="reject")
+    assert error.value.lead_id == original.id
+    assert lead_count(db) == 1
+
+def test_merge_appends_observation_to_original(db, users):
+    original = database.create_lead(db, lead("(11) 98765-4321", "primeiro contato"), users["indicador"], policy="merge")
+
+    merged = database.create_lead(db, lead("11 98765-4321", "ligar à tarde"), users["indicador"], policy="merge")
+    assert merged.id == original.id
+    assert merged.observation == "primeiro contato\nligar à tarde"
+    # A mesma observação não é repetida
+    again = database.create_lead(db, lead("11 98765-4321", "ligar à tarde"), users["indicador"], policy="merge")
+    assert again.observation == "primeiro contato\nligar à tarde"
+    assert lead_count(db) == 1
+
+def test_flag_creates_lead_pointing_to_original(db, users):
+    original = database.create_lead(db, lead("(11) 98765-4321"), users["indicador"], policy="flag")
+
+    duplicate = database.create_lead(db, lead("(11) 8765-4321", name="Ana Souza"), users["indicador"], policy="flag")
+    assert duplicate.id != original.id
+    assert duplicate.duplicate_of_id == original.id
+    assert duplicate.phone_normalized == original.phone_normalized
+    assert lead_count(db) == 2
+
+@pytest.mark.parametrize("policy, results", [
+    ("reject", ["created", "rejected", "rejected", "created"]),
+    ("merge", ["created", "merged", "merged", "created"]),
+    ("flag", ["created", "flagged", "flagged", "created"]),
+])
+def test_bulk_applies_policy_to_existing_and_batch_duplicates(db, users, policy, results):
+    existing = database.create_lead(db, lead("(21) 3333-4444", "antigo"), users["indicador"], policy=policy)
+
+    outcome = database.bulk_create_leads(db, [
+        lead("(11) 98765-4321", "a"),
+        lead("11 98765-4321", "b"),
+        lead("21 3333-4444", "c"),
+        lead("(31) 2222-1111"),
+    ], users["indicador"], policy)
+
+    assert [result for result, _ in outcome] == results
+    first_id = outcome[0][1]
+    if policy == "flag":
+        flagged = {row.id: row.duplicate_of_id for row in db.execute(select(models.Lead.id, models.Lead.duplicate_of_id))}
+        assert flagged[outcome[1][1]] == first_id
+        assert flagged[outcome[2][1]] == existing.id
+    else:
+        assert outcome[1][1] == first_id
+        assert outcome[2][1] == existing.id
+    if policy == "merge":
+        observations = dict(db.execute(select(models.Lead.id, models.Lead.observation)).all())
+        assert observations[first_id] == "a\nb"
+        assert observations[existing.id] == "antigo\nc"
+    assert lead_count(db) == 1 + results.count("created") + results.count("flagged")
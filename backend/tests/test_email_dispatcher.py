@@ -0,0 +1,119 @@
+from datetime import timedelta
+import pytest
+from app import email_service, models
+from app.fake_smtp import FakeSMTPServer
+
+@pytest.fixture
+def smtp_server():
+    with FakeSMTPServer() as server:
+        yield server
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Relógio do dispatcher controlado pelo teste: clock.advance(segundos)"""
+    class Clock:
+        # Um segundo à frente: o default de next_attempt_at (CURRENT_TIMESTAMP no SQLite) é
+        # truncado no segundo e pode cair no segundo seguinte ao início do teste
+        now = email_service._utcnow() + timedelta(seconds=1)
+
+        def advance(self, seconds: float):
+            self.now += timedelta(seconds=seconds)
+
+    clock = Clock()
+    monkeypatch.setattr(email_service, "_utcnow", lambda: clock.now)
+    return clock
+
+@pytest.fixture
+def dispatcher(session_factory, smtp_server):
+    connection = email_service.SMTPConnection("localhost", smtp_server.port, "teste", "senha", use_tls=False, timeout=5)
+    dispatcher = email_service.EmailDispatcher(session_factory, connection, batch_size=10)
+    yield dispatcher
+    connection.close()
+
+def queue_welcome(session_factory, recipient: str = "ana@example.com") -> int:
+    db = session_factory()
+    try:
+        email = email_service.queue_welcome_email(db, recipient, "Ana")
+        db.commit()
+        return email.id
+    finally:
+        db.close()
+
+def outbox(session_factory, email_id: int) -> models.EmailOutbox:
+    db = session_factory()
+    try:
+        return db.get(models.EmailOutbox, email_id)
+    finally:
+        db.close()
+
+def test_sends_queued_email(session_factory, smtp_server, dispatcher, clock):
+    email_id = queue_welcome(session_factory)
+
+    assert dispatcher.process_batch() == 1
+
+    email = outbox(session_factory, email_id)
+    assert email.status == models.EmailStatus.SENT
+    assert email.attempts == 1
+    assert email.sent_at is not None
+    assert [message["To"] for message in smtp_server.messages] == ["ana@example.com"]
+    assert dispatcher.process_batch() == 0
+
+def test_transient_failure_is_retried_after_backoff(session_factory, smtp_server, dispatcher, clock):
+    email_id = queue_welcome(session_factory)
+    smtp_server.failures = 1
+
+    assert dispatcher.process_batch() == 1
+    email = outbox(session_factory, email_id)
+    assert email.status == models.EmailStatus.PENDING
+    assert email.attempts == 1
+    assert "451" in email.last_error
+    assert smtp_server.messages == []
+
+    # Antes do backoff o email não é elegível
+    delay = email_service.retry_delay(1).total_seconds()
+    clock.advance(delay - 5)
+    assert dispatcher.process_batch() == 0
+
+    clock.advance(5)
+    assert dispatcher.process_batch() == 1
+    email = outbox(session_factory, email_id)
+    assert email.status == models.EmailStatus.SENT
+    assert email.attempts == 2
+    assert email.last_error is None
+    assert len(smtp_server.messages) == 1
+
+def test_marks_failed_after_max_attempts(session_factory, smtp_server, dispatcher, clock, monkeypatch):
+    monkeypatch.setattr(email_service, "EMAIL_MAX_ATTEMPTS", 3)
+    email_id = queue_welcome(session_factory)
+    smtp_server.failures = -1
+
+    for attempt in range(1, 4):
+        assert dispatcher.process_batch() == 1
+        assert outbox(session_factory, email_id).attempts == attempt
+        clock.advance(email_service.EMAIL_RETRY_MAX_SECONDS)
+
+    email = outbox(session_factory, email_id)
+    assert email.status == models.EmailStatus.FAILED
+    assert dispatcher.process_batch() == 0
+    assert smtp_server.messages == []
+
+def test_reclaims_email_after_lease_expires(session_factory, smtp_server, dispatcher, clock):
+    email_id = queue_welcome(session_factory)
+    # Worker que reservou o email e caiu antes de enviar
+    db = session_factory()
+    try:
+        assert dispatcher._claim(db) == [email_id]
+    finally:
+        db.close()
+    assert outbox(session_factory, email_id).status == models.EmailStatus.SENDING
+
+    # Ainda na posse do outro worker
+    clock.advance(email_service.EMAIL_LEASE_SECONDS - 5)
+    assert dispatcher.process_batch() == 0
+
+    clock.advance(5)
+    assert dispatcher.process_batch() == 1
+    email = outbox(session_factory, email_id)
+    assert email.status == models.EmailStatus.SENT
+    assert email.attempts == 2
+    assert len(smtp_server.messages) == 1
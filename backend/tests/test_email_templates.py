@@ -0,0 +1,43 @@
+import email
+from email.header import decode_header, make_header
+from app import email_service
+
+CONTEXT = {
+    "vendedor_name": "Júlia",
+    "indicador_name": "Pedro",
+    "client_name": "Ana <Souza>",
+    "phone": "(11) 98765-4321",
+    "city_state": "São Paulo/SP",
+    "observation": "Nenhuma",
+}
+
+def parts(message) -> dict:
+    return {part.get_content_type(): part.get_payload(decode=True).decode("utf-8") for part in message.walk() if not part.is_multipart()}
+
+def test_message_fills_recipient_fields_and_fixed_fields():
+    message = email.message_from_bytes(email_service.build_message("lead_assigned", "julia@example.com", CONTEXT).as_bytes())
+    assert str(make_header(decode_header(message["Subject"]))) == "Novo lead para você: Ana <Souza>"
+    content = parts(message)
+    assert "Ana <Souza>" in content["text/plain"] and email_service.APP_URL in content["text/plain"]
+    assert "Ana &lt;Souza&gt;" in content["text/html"] and email_service.APP_URL in content["text/html"]
+
+def test_each_message_has_its_own_parts_and_boundary():
+    first = email_service.build_message("lead_assigned", "julia@example.com", CONTEXT)
+    second = email_service.build_message("lead_assigned", "julia@example.com", CONTEXT)
+    # O boundary é escolhido ao serializar
+    first.as_bytes(), second.as_bytes()
+    assert first.get_boundary() != second.get_boundary()
+    assert not {id(part) for part in first.get_payload()} & {id(part) for part in second.get_payload()}
+    # Alterar uma mensagem não afeta as outras
+    first.get_payload()[0]["X-Teste"] = "1"
+    assert second.get_payload()[0]["X-Teste"] is None
+
+def test_fixed_fields_are_bound_at_load(tmp_path):
+    (tmp_path / "_layout.html").write_text('<a href="$app_url">$content</a>', encoding="utf-8")
+    for kind in email_service.EMAIL_SUBJECTS:
+        (tmp_path / f"{kind}.txt").write_text("$app_url", encoding="utf-8")
+        (tmp_path / f"{kind}.html").write_text("oi", encoding="utf-8")
+    templates = email_service.load_templates(str(tmp_path), app_url="https://a.example/?x=1&y=2")
+    _, text, html = templates["welcome"].render({"user_name": "Ana"})
+    assert text == "https://a.example/?x=1&y=2"
+    assert html == '<a href="https://a.example/?x=1&amp;y=2">oi</a>'
@@ -0,0 +1,76 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import etags, models
+
+LEAD = {"client_name": "Ana", "phone": "(11) 90000-0001", "city_state": "São Paulo/SP"}
+
+@pytest.fixture
+def client(api):
+    return TestClient(api)
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    ('W/"3-abc"', True),
+    ('"3-abc"', True),
+    ('"1-xyz", W/"3-abc"', True),
+    ("*", True),
+    ('W/"4-abc"', False),
+    (None, False),
+    ("", False),
+])
+def test_weak_comparison(if_none_match, expected):
+    assert etags.matches(if_none_match, 'W/"3-abc"') is expected
+
+def test_make_etag_depends_on_version_and_parts():
+    assert etags.make_etag(1, "gestor", 1) == etags.make_etag(1, "gestor", 1)
+    assert etags.make_etag(1, "gestor", 1) != etags.make_etag(2, "gestor", 1)
+    assert etags.make_etag(1, "gestor", 1) != etags.make_etag(1, "vendedor", 1)
+
+def revalidate(client, path: str, headers: dict, etag: str):
+    return client.get(path, headers={**headers, "If-None-Match": etag})
+
+def test_leads_not_modified_until_a_write(client, auth_headers):
+    headers = auth_headers("gestor")
+    first = client.get("/leads/", headers=headers)
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == etags.CACHE_CONTROL
+
+    not_modified = revalidate(client, "/leads/", headers, etag)
+    assert (not_modified.status_code, not_modified.content) == (304, b"")
+    assert not_modified.headers["etag"] == etag
+    # ETag de outro usuário (corpo diferente) não vale
+    assert revalidate(client, "/leads/", auth_headers("vendedor"), etag).status_code == 200
+
+    lead_id = client.post("/leads/", headers=headers, json=LEAD).json()["id"]
+    changed = revalidate(client, "/leads/", headers, etag)
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    etag = changed.headers["etag"]
+    client.put(f"/leads/{lead_id}", headers=headers, json={"status": "em_contato"})
+    assert revalidate(client, "/leads/", headers, etag).status_code == 200
+
+def test_stats_follow_the_leads_version(client, auth_headers):
+    headers = auth_headers("gestor")
+    for path in ("/stats/leads/daily", "/stats/funnel", "/stats/stage-durations", "/stats/leaderboard"):
+        etag = client.get(path, headers=headers).headers["etag"]
+        assert revalidate(client, path, headers, etag).status_code == 304
+    etag = client.get("/stats/leads/daily", headers=headers).headers["etag"]
+    client.post("/leads/", headers=headers, json=LEAD)
+    assert revalidate(client, "/stats/leads/daily", headers, etag).status_code == 200
+
+def test_users_follow_the_users_version(client, auth_headers, session_factory):
+    headers = auth_headers("gestor")
+    etags_before = {path: client.get(path, headers=headers).headers["etag"] for path in ("/users/", "/vendedores/")}
+    for path, etag in etags_before.items():
+        assert revalidate(client, path, headers, etag).status_code == 304
+    # Escrever leads não muda a versão dos usuários
+    client.post("/leads/", headers=headers, json=LEAD)
+    assert revalidate(client, "/users/", headers, etags_before["/users/"]).status_code == 304
+
+    db = session_factory()
+    try:
+        db.add(models.User(name="Nova", email="nova@example.com", password="-", role=models.UserRole.VENDEDOR))
+        db.commit()
+    finally:
+        db.close()
+    for path, etag in etags_before.items():
+        response = revalidate(client, path, headers, etag)
+        assert response.status_code == 200 and "nova@example.com" in response.text
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from app import database, events, models, schemas
+
+@pytest.fixture
+def broker(monkeypatch):
+    lead_broker = events.EventBroker(max_queue=10)
+    monkeypatch.setattr(events, "broker", lead_broker)
+    return lead_broker
+
+def lead(i: int, vendedor_id: int) -> schemas.LeadCreate:
+    return schemas.LeadCreate(client_name=f"Cliente {i}", phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP", vendedor_id=vendedor_id)
+
+def drain(queue) -> list:
+    received = []
+    while not queue.empty():
+        received.append(queue.get_nowait())
+    return received
+
+def subscribed(broker, topics: dict, write) -> dict:
+    """Eventos recebidos em cada grupo de tópicos enquanto `write()` grava"""
+    async def scenario():
+        with broker.subscribe(topics["gestor"]) as gestor, broker.subscribe(topics["vendedor"]) as vendedor, \
+                broker.subscribe(topics["indicador"]) as indicador:
+            write()
+            # deliver agenda a entrega no loop
+            await asyncio.sleep(0)
+            return {"gestor": drain(gestor), "vendedor": drain(vendedor), "indicador": drain(indicador)}
+    return asyncio.run(scenario())
+
+def topics(users, vendedor: str = "vendedor") -> dict:
+    return {
+        "gestor": [events.ALL_LEADS_TOPIC],
+        "vendedor": [events.vendedor_topic(users[vendedor])],
+        "indicador": [events.indicador_topic(users["indicador"])],
+    }
+
+def test_events_are_published_after_commit(broker, session_factory, users):
+    created = []
+
+    def write():
+        db = session_factory()
+        try:
+            created.append(database.create_lead(db, lead(1, users["vendedor"]), users["indicador"]).id)
+            database.update_lead_status(db, created[0], schemas.LeadUpdate(status=models.LeadStatus.EM_CONTATO))
+            # Transação desfeita não publica nada
+            database.prepare_lead(db, lead(2, users["vendedor"]), users["indicador"])
+            db.flush()
+            db.rollback()
+        finally:
+            db.close()
+
+    received = subscribed(broker, topics(users), write)
+    expected = [
+        {"type": event_type, "lead_id": created[0], "vendedor_id": users["vendedor"], "indicador_id": users["indicador"]}
+        for event_type in ("lead_created", "lead_updated")
+    ]
+    assert received == {"gestor": expected, "vendedor": expected, "indicador": expected}
+
+def test_events_of_other_vendedores_are_not_delivered(broker, session_factory, users):
+    def write():
+        db = session_factory()
+        try:
+            database.create_lead(db, lead(1, users["vendedor"]), users["indicador"])
+        finally:
+            db.close()
+
+    received = subscribed(broker, topics(users, "vendedor2"), write)
+    assert [len(received[key]) for key in ("gestor", "vendedor", "indicador")] == [1, 0, 1]
+
+def test_large_commit_becomes_one_bulk_event_per_topic(broker, session_factory, users, monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_MAX_PER_COMMIT", 2)
+
+    def write():
+        db = session_factory()
+        try:
+            database.bulk_create_leads(db, [lead(i, users["vendedor"]) for i in range(3)], users["indicador"])
+        finally:
+            db.close()
+
+    received = subscribed(broker, topics(users), write)
+    assert received == {key: [{"type": "leads_bulk_changed", "count": 3}] for key in ("gestor", "vendedor", "indicador")}
+
+def test_slow_subscriber_gets_resync(broker):
+    async def scenario():
+        with broker.subscribe(["t"]) as queue:
+            for i in range(broker.max_queue + 1):
+                broker.publish(["t"], {"type": "lead_created", "lead_id": i})
+            await asyncio.sleep(0)
+            return drain(queue)
+
+    assert asyncio.run(scenario()) == [{"type": "resync"}]
+    assert broker.subscriber_count() == 0
+
+def test_sse_stream(broker, monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_KEEPALIVE_SECONDS", 0.01)
+    monkeypatch.setattr(events, "EVENTS_MAX_STREAM_SECONDS", 0.05)
+
+    async def scenario():
+        stream = events.sse_stream(["t"])
+        chunks = [await stream.__anext__()]
+        broker.publish(["t"], {"type": "lead_deleted", "lead_id": 1})
+        chunks += [chunk async for chunk in stream]
+        return chunks
+
+    chunks = asyncio.run(scenario())
+    assert chunks[0] == f"retry: {events.EVENTS_RETRY_MS}\n\n"
+    assert chunks[1] == 'event: lead_deleted\ndata: {"type": "lead_deleted", "lead_id": 1}\n\n'
+    assert set(chunks[2:]) <= {": keepalive\n\n"}
+    # Encerrado pelo limite de duração, o assinante é removido
+    assert broker.subscriber_count() == 0
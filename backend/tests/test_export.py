@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+import pytest
+from fastapi.testclient import TestClient
+from app import database, export, schemas
+
+@pytest.fixture
+def client(api, session_factory, users, monkeypatch):
+    # A exportação abre a própria sessão (o corpo é enviado depois que o endpoint retorna)
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    db = session_factory()
+    try:
+        for i, vendedor in enumerate(("vendedor", "vendedor", "vendedor2")):
+            database.create_lead(db, schemas.LeadCreate(
+                client_name=f"Cliente {i}", phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP",
+                observation="Ligar à tarde", vendedor_id=users[vendedor],
+            ), users["indicador"])
+    finally:
+        db.close()
+    return TestClient(api)
+
+def test_csv(client, auth_headers):
+    response = client.get("/leads/export", headers=auth_headers("gestor"))
+    assert response.headers["content-type"] == "text/csv; charset=utf-8"
+    assert response.headers["content-disposition"].startswith('attachment; filename="relatorio_leads_')
+    assert response.content.startswith("﻿".encode("utf-8"))
+    rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+    assert list(rows[0]) == export.EXPORT_HEADER
+    assert [row["client_name"] for row in rows] == ["Cliente 0", "Cliente 1", "Cliente 2"]
+    assert {row["status"] for row in rows} == {"novo"} and rows[0]["observation"] == "Ligar à tarde"
+
+def test_ndjson_is_scoped_to_the_vendedor(client, auth_headers, users):
+    response = client.get("/leads/export", headers=auth_headers("vendedor"), params={"format": "ndjson", "vendedor_id": users["vendedor2"]})
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["client_name"] for row in rows] == ["Cliente 0", "Cliente 1"]
+    assert {row["vendedor_id"] for row in rows} == {users["vendedor"]}
+
+def test_parquet(client, auth_headers):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = client.get("/leads/export", headers=auth_headers("gestor"), params={"format": "parquet"})
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 3
+    assert table.column("status").to_pylist() == ["novo"] * 3
+
+def test_unknown_format_is_rejected(client, auth_headers):
+    assert client.get("/leads/export", headers=auth_headers("gestor"), params={"format": "xlsx"}).status_code == 422
+
+def test_export_link_token(client, auth_headers, users):
+    link = client.post("/leads/export/link", headers=auth_headers("vendedor2")).json()
+    assert link["expires_in"] == 5 * 60
+    # O link funciona sem o header de autenticação, com o escopo do perfil de quem o gerou
+    response = client.get("/leads/export", params={"token": link["token"], "format": "ndjson"})
+    assert [json.loads(line)["vendedor_id"] for line in response.text.splitlines()] == [users["vendedor2"]]
+    # mas não autentica o restante da API
+    assert client.get("/leads/", headers={"Authorization": f"Bearer {link['token']}"}).status_code == 401
+
+def test_invalid_export_token(client, auth_headers):
+    response = client.get("/leads/export", params={"token": "invalido"})
+    assert response.status_code == 401 and response.json()["detail"] == "Link de exportação inválido ou expirado"
@@ -0,0 +1,116 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+from app import database, models, schemas, stats
+
+S = models.LeadStatus
+
+@pytest.fixture
+def leads(session_factory, users) -> dict:
+    """Leads com o caminho de status percorrido de fato (histórico gravado pelas escritas)"""
+    paths = {
+        "a": ("vendedor", [S.EM_CONTATO, S.EM_NEGOCIACAO, S.FECHADO]),
+        "b": ("vendedor", [S.EM_CONTATO, S.PERDIDO]),
+        "c": ("vendedor2", [S.FECHADO]),
+        "d": ("vendedor2", []),
+    }
+    db = session_factory()
+    try:
+        created = {}
+        for i, (key, (vendedor, path)) in enumerate(paths.items()):
+            lead = database.create_lead(db, schemas.LeadCreate(
+                client_name=key, phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP", vendedor_id=users[vendedor],
+            ), users["indicador"])
+            for status in path:
+                database.update_lead_status(db, lead.id, schemas.LeadUpdate(status=status))
+            created[key] = lead.id
+        return created
+    finally:
+        db.close()
+
+def stages(funnel: dict) -> list:
+    return [(s["status"], s["reached"], s["lost"], s["conversion_from_previous"], s["conversion_from_start"]) for s in funnel["stages"]]
+
+def test_funnel_counts_stages_actually_recorded(session_factory, users, leads):
+    db = session_factory()
+    try:
+        funnel = stats.lead_funnel(db)
+    finally:
+        db.close()
+    assert funnel["total_leads"] == 4
+    # c pulou de novo para fechado: conta em fechado, mas não em contato nem negociação
+    assert stages(funnel) == [
+        (S.NOVO, 4, 0, None, 100.0),
+        (S.EM_CONTATO, 2, 1, 50.0, 50.0),
+        (S.EM_NEGOCIACAO, 1, 0, 50.0, 25.0),
+        (S.FECHADO, 2, 0, 100.0, 50.0),
+    ]
+    by_vendedor = {v["vendedor_id"]: v for v in funnel["by_vendedor"]}
+    assert [s["reached"] for s in by_vendedor[users["vendedor"]]["stages"]] == [2, 2, 1, 1]
+    assert stages(by_vendedor[users["vendedor2"]]) == [
+        (S.NOVO, 2, 0, None, 100.0),
+        (S.EM_CONTATO, 0, 0, 0.0, 0.0),
+        (S.EM_NEGOCIACAO, 0, 0, None, 0.0),
+        (S.FECHADO, 1, 0, None, 50.0),
+    ]
+
+def test_funnel_filters(session_factory, users, leads):
+    db = session_factory()
+    try:
+        assert stats.lead_funnel(db, vendedor_id=users["vendedor2"])["total_leads"] == 2
+        empty = stats.lead_funnel(db, start_date=datetime(2100, 1, 1).date())
+        assert (empty["total_leads"], empty["by_vendedor"]) == (0, [])
+        assert {(s["reached"], s["conversion_from_start"]) for s in empty["stages"]} == {(0, None)}
+    finally:
+        db.close()
+
+def test_transitions_close_the_previous_stage(session_factory, leads):
+    db = session_factory()
+    try:
+        history = models.LeadStatusChange
+        rows = db.execute(
+            select(history.to_status, history.seconds_in_stage).where(history.lead_id == leads["a"]).order_by(history.id)
+        ).all()
+    finally:
+        db.close()
+    assert [status for status, _ in rows] == [S.NOVO, S.EM_CONTATO, S.EM_NEGOCIACAO, S.FECHADO]
+    # Só a etapa atual fica sem duração
+    assert [seconds is not None for _, seconds in rows] == [True, True, True, False]
+
+def test_stage_duration_percentiles(session_factory, users):
+    history = models.LeadStatusChange
+    rows = [
+        *({"vendedor_id": users["vendedor"], "to_status": S.NOVO, "seconds_in_stage": s} for s in (40, 10, 30, 20)),
+        {"vendedor_id": users["vendedor"], "to_status": S.EM_CONTATO, "seconds_in_stage": 100},
+        {"vendedor_id": users["vendedor2"], "to_status": S.NOVO, "seconds_in_stage": 50},
+        # Etapa atual (sem duração) fica de fora
+        {"vendedor_id": users["vendedor2"], "to_status": S.EM_CONTATO, "seconds_in_stage": None},
+    ]
+    db = session_factory()
+    try:
+        db.execute(insert(history), [{"lead_id": i, "changed_at": datetime(2025, 9, 1), **row} for i, row in enumerate(rows)])
+        db.commit()
+        result = stats.stage_durations(db)
+        only_vendedor2 = stats.stage_durations(db, vendedor_id=users["vendedor2"])
+    finally:
+        db.close()
+
+    def summary(stage_list):
+        return [(s["status"], s["transitions"], s["median_seconds"], s["p90_seconds"]) for s in stage_list]
+
+    # Nearest-rank: mediana = posição ceil(n/2), p90 = posição ceil(0.9 n)
+    assert summary(result["stages"]) == [(S.NOVO, 5, 30.0, 50.0), (S.EM_CONTATO, 1, 100.0, 100.0)]
+    by_vendedor = {v["vendedor_id"]: summary(v["stages"]) for v in result["by_vendedor"]}
+    assert by_vendedor == {
+        users["vendedor"]: [(S.NOVO, 4, 20.0, 40.0), (S.EM_CONTATO, 1, 100.0, 100.0)],
+        users["vendedor2"]: [(S.NOVO, 1, 50.0, 50.0)],
+    }
+    assert summary(only_vendedor2["stages"]) == [(S.NOVO, 1, 50.0, 50.0)]
+
+def test_endpoints_are_for_gestor(api, auth_headers, leads):
+    client = TestClient(api)
+    for path in ("/stats/funnel", "/stats/stage-durations"):
+        assert client.get(path, headers=auth_headers("gestor")).status_code == 200
+        assert client.get(path, headers=auth_headers("indicador")).status_code == 403
+    assert client.get("/stats/funnel", headers=auth_headers("gestor")).json()["stages"][3]["reached"] == 2
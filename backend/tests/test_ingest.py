@@ -0,0 +1,70 @@
+import io
+import json
+import pytest
+from sqlalchemy import select
+from app import ingest, models
+
+@pytest.fixture
+def db(session_factory, engine):
+    # Falha só no banco, depois da validação: a linha com este nome aborta o INSERT
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TRIGGER reject_lead BEFORE INSERT ON leads WHEN NEW.client_name = 'Falha' "
+            "BEGIN SELECT RAISE(ABORT, 'lead recusado'); END"
+        )
+    session = session_factory()
+    yield session
+    session.close()
+
+def ndjson(*rows) -> io.StringIO:
+    return io.StringIO("\n".join(row if isinstance(row, str) else json.dumps(row) for row in rows))
+
+def row(name: str, phone: str, **extra) -> dict:
+    return {"client_name": name, "phone": phone, "city_state": "São Paulo/SP", **extra}
+
+def client_names(db) -> list:
+    return list(db.execute(select(models.Lead.client_name).order_by(models.Lead.id)).scalars())
+
+def test_database_error_fails_only_its_row(db, users):
+    importer = ingest.BulkLeadImport(db, users["indicador"], batch_size=10)
+    result = importer.run(ndjson(
+        row("Ana", "(11) 90000-0001"),
+        row("Falha", "(11) 90000-0002"),
+        row("Carla", "(11) 90000-0003"),
+    ), "ndjson")
+
+    assert result["created"] == 2
+    assert result["failed"] == 1
+    assert result["errors"] == [{"row": 2, "error": "Erro ao gravar: IntegrityError"}]
+    assert client_names(db) == ["Ana", "Carla"]
+
+def test_database_error_does_not_affect_other_batches(db, users):
+    importer = ingest.BulkLeadImport(db, users["indicador"], batch_size=2)
+    result = importer.run(ndjson(
+        row("Ana", "(11) 90000-0001"),
+        row("Bruno", "(11) 90000-0002"),
+        row("Falha", "(11) 90000-0003"),
+        row("Duda", "(11) 90000-0004"),
+        row("Edu", "(11) 90000-0005"),
+    ), "ndjson")
+
+    assert (result["created"], result["failed"]) == (4, 1)
+    assert [error["row"] for error in result["errors"]] == [3]
+    assert client_names(db) == ["Ana", "Bruno", "Duda", "Edu"]
+
+def test_invalid_rows_are_reported_and_skipped(db, users):
+    importer = ingest.BulkLeadImport(db, users["indicador"], batch_size=10)
+    result = importer.run(ndjson(
+        row("Ana", "(11) 90000-0001"),
+        "{sem fechar",
+        {"client_name": "Sem telefone", "city_state": "São Paulo/SP"},
+        row("Bruno", "(11) 90000-0002", vendedor_id=users["indicador"]),
+        row("Carla", "(11) 90000-0003", vendedor_id=users["vendedor2"]),
+    ), "ndjson")
+
+    assert (result["created"], result["failed"]) == (2, 3)
+    errors = {error["row"]: error["error"] for error in result["errors"]}
+    assert errors[2].startswith("Formato inválido")
+    assert errors[3].startswith("phone:")
+    assert errors[4] == f"vendedor_id {users['indicador']} não é um vendedor"
+    assert client_names(db) == ["Ana", "Carla"]
@@ -0,0 +1,67 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import database, models, schemas, stats
+from app.cache import TTLCache
+
+@pytest.fixture
+def builds(monkeypatch) -> list:
+    """Cache novo (as versões se repetem entre os bancos dos testes) e as reconstruções feitas"""
+    monkeypatch.setattr(stats, "leaderboard_cache", TTLCache(maxsize=16, ttl=300))
+    calls = []
+    build = stats._build_leaderboard
+
+    def counted(*args):
+        calls.append(args[1:])
+        return build(*args)
+
+    monkeypatch.setattr(stats, "_build_leaderboard", counted)
+    return calls
+
+@pytest.fixture
+def client(api, session_factory, users):
+    # vendedor: 3 leads, 1 fechado; vendedor2: 1 lead, fechado
+    db = session_factory()
+    try:
+        for i, (vendedor, closed) in enumerate((("vendedor", True), ("vendedor", False), ("vendedor", False), ("vendedor2", True))):
+            lead = database.create_lead(db, schemas.LeadCreate(
+                client_name=f"Cliente {i}", phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP", vendedor_id=users[vendedor],
+            ), users["indicador"])
+            if closed:
+                database.update_lead_status(db, lead.id, schemas.LeadUpdate(status=models.LeadStatus.FECHADO))
+    finally:
+        db.close()
+    return TestClient(api)
+
+def ranking(response) -> list:
+    return [(row["vendedor_id"], row["leads"], row["closed"]) for row in response.json()["vendedores"]]
+
+def test_rankings(client, auth_headers, users, builds):
+    headers = auth_headers("gestor")
+    by_closed = client.get("/stats/leaderboard", headers=headers)
+    # Empate em fechados: desempata pela taxa de conversão
+    assert ranking(by_closed) == [(users["vendedor2"], 1, 1), (users["vendedor"], 3, 1)]
+    by_leads = client.get("/stats/leaderboard", headers=headers, params={"rank_by": "leads", "limit": 1})
+    assert ranking(by_leads) == [(users["vendedor"], 3, 1)]
+    assert by_closed.json()["vendedores"][0]["avg_seconds_to_close"] is not None
+    assert [(row["indicador_id"], row["leads"]) for row in by_closed.json()["indicadores"]] == [(users["indicador"], 4)]
+    # Ordenação e limite diferentes saem do mesmo ranking em cache
+    assert len(builds) == 1
+
+def test_cache_is_keyed_on_the_leads_version(client, auth_headers, users, builds):
+    headers = auth_headers("gestor")
+    client.get("/stats/leaderboard", headers=headers)
+    client.get("/stats/leaderboard", headers=headers)
+    assert len(builds) == 1
+    # Período diferente é outra entrada
+    client.get("/stats/leaderboard", headers=headers, params={"days": 7})
+    assert len(builds) == 2
+
+    client.post("/leads/", headers=headers, json={
+        "client_name": "Nova", "phone": "(11) 98888-0000", "city_state": "São Paulo/SP", "vendedor_id": users["vendedor2"],
+    })
+    after_write = client.get("/stats/leaderboard", headers=headers, params={"rank_by": "leads"})
+    assert len(builds) == 3
+    assert (users["vendedor2"], 2, 1) in ranking(after_write)
+
+def test_leaderboard_is_for_gestor(client, auth_headers):
+    assert client.get("/stats/leaderboard", headers=auth_headers("vendedor")).status_code == 403
@@ -0,0 +1,72 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import metrics
+
+def sample(text: str, name: str, **labels) -> float:
+    """Valor da série `name` com exatamente estes rótulos (0 se ainda não existe)"""
+    series = name + metrics._format_labels(labels.keys(), labels.values())
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+@pytest.fixture
+def client(api):
+    return TestClient(api)
+
+@pytest.fixture
+def registry(monkeypatch):
+    fresh = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", fresh)
+    return fresh
+
+def test_requests_are_labeled_by_route_template(client, auth_headers):
+    headers = auth_headers("gestor")
+    lead_id = client.post("/leads/", headers=headers, json={"client_name": "Ana", "phone": "(11) 90000-0001", "city_state": "São Paulo/SP"}).json()["id"]
+    before = client.get("/metrics").text
+
+    client.put(f"/leads/{lead_id}", headers=headers, json={"status": "em_contato"})
+    client.put("/leads/999999", headers=headers, json={"status": "em_contato"})
+    client.get("/rota/inexistente")
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    after = response.text
+    # O id do lead não vira rótulo: as duas atualizações caem na mesma rota
+    route = {"method": "PUT", "route": "/leads/{lead_id}"}
+    assert sample(after, "http_requests_total", **route, status="200") - sample(before, "http_requests_total", **route, status="200") == 1
+    assert sample(after, "http_requests_total", **route, status="404") - sample(before, "http_requests_total", **route, status="404") == 1
+    assert f'route="/leads/{lead_id}"' not in after
+    unmatched = {"method": "GET", "route": "unmatched", "status": "404"}
+    assert sample(after, "http_requests_total", **unmatched) - sample(before, "http_requests_total", **unmatched) == 1
+    assert sample(after, "http_request_duration_seconds_count", **route) - sample(before, "http_request_duration_seconds_count", **route) == 2
+
+def test_database_queries_are_counted_per_request(client, auth_headers):
+    before = client.get("/metrics").text
+    client.get("/leads/", headers=auth_headers("gestor"))
+    after = client.get("/metrics").text
+    route = {"method": "GET", "route": "/leads/"}
+    assert sample(after, "http_request_db_queries_count", **route) - sample(before, "http_request_db_queries_count", **route) == 1
+    # Versão e página: pelo menos duas consultas nesta requisição
+    assert sample(after, "http_request_db_queries_sum", **route) - sample(before, "http_request_db_queries_sum", **route) >= 2
+    assert sample(after, "db_query_duration_seconds_count", operation="SELECT") > sample(before, "db_query_duration_seconds_count", operation="SELECT")
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = metrics.Histogram("teste_seconds", "Teste", ("rota",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/a")
+    text = registry.render()
+    assert [sample(text, "teste_seconds_bucket", rota="/a", le=le) for le in ("0.1", "1", "+Inf")] == [1, 3, 4]
+    assert (sample(text, "teste_seconds_count", rota="/a"), sample(text, "teste_seconds_sum", rota="/a")) == (4, 6.05)
+    assert "# TYPE teste_seconds histogram" in text
+
+def test_label_values_are_escaped(registry):
+    counter = metrics.Counter("teste_total", "Teste", ("valor",))
+    counter.inc('a"b\\c\nd')
+    assert 'teste_total{valor="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+def test_function_metrics_are_read_at_collection(registry):
+    values = {"x": 1}
+    metrics.Gauge("teste_gauge", "Teste", function=lambda: values["x"])
+    values["x"] = 7
+    assert sample(registry.render(), "teste_gauge") == 7
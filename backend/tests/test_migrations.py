@@ -0,0 +1,87 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import func, inspect, select
+from sqlalchemy.orm import sessionmaker
+from app import database, migrations, models, schemas
+
+ALL_VERSIONS = [version for version, _, _ in migrations.MIGRATIONS]
+
+@pytest.fixture
+def baseline_engine(tmp_path):
+    """Banco como o app criava antes das migrações: só users e leads, já com dados"""
+    db_engine = database.create_db_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    migrations.baseline_metadata.create_all(db_engine)
+    users = migrations.baseline_metadata.tables["users"]
+    leads = migrations.baseline_metadata.tables["leads"]
+    with db_engine.begin() as conn:
+        conn.execute(users.insert(), [
+            {"id": 1, "name": "Pedro", "email": "pedro@example.com", "password": "-", "role": "INDICADOR"},
+            {"id": 2, "name": "Juliano", "email": "juliano@example.com", "password": "-", "role": "VENDEDOR"},
+        ])
+        conn.execute(leads.insert(), [
+            {"client_name": "Ana", "phone": "(11) 98765-4321", "city_state": "São Paulo/SP", "status": "NOVO",
+             "indicador_id": 1, "vendedor_id": 2, "created_at": datetime(2025, 9, 1, 10)},
+            {"client_name": "Bruno", "phone": "(21) 3333-4444", "city_state": "Rio/RJ", "status": "FECHADO",
+             "indicador_id": 1, "vendedor_id": 2, "created_at": datetime(2025, 9, 2, 10), "updated_at": datetime(2025, 9, 5, 10)},
+            {"client_name": "Ana S.", "phone": "+55 11 98765 4321", "city_state": "São Paulo/SP", "status": "EM_CONTATO",
+             "indicador_id": 1, "vendedor_id": 2, "created_at": datetime(2025, 9, 3, 10), "updated_at": datetime(2025, 9, 4, 10)},
+        ])
+    yield db_engine
+    db_engine.dispose()
+
+def count(conn, model) -> int:
+    return conn.execute(select(func.count()).select_from(model)).scalar()
+
+def test_migrates_baseline_database(baseline_engine):
+    assert migrations.run_migrations(baseline_engine) == ALL_VERSIONS
+
+    with baseline_engine.connect() as conn:
+        assert migrations.applied_versions(conn) == set(ALL_VERSIONS)
+        leads = dict(conn.execute(select(models.Lead.client_name, models.Lead.phone_normalized)).all())
+        assert leads == {"Ana": "11987654321", "Bruno": "2133334444", "Ana S.": "11987654321"}
+        # Os leads existentes entram no log, no rollup e no histórico
+        assert [(txid, operation) for txid, operation in conn.execute(select(models.LeadChange.txid, models.LeadChange.operation))] == [
+            (0, models.ChangeOperation.INSERT)
+        ] * 3
+        assert conn.execute(select(func.sum(models.LeadDailyCount.total))).scalar() == 3
+        assert count(conn, models.LeadStatusChange) == 5
+        assert set(conn.execute(select(models.DataVersion.scope)).scalars()) == {"leads", "users"}
+        indexes = {index["name"] for index in inspect(conn).get_indexes("lead_changes")}
+        assert "ix_lead_changes_txid_seq" in indexes
+
+def test_migrations_are_applied_once(baseline_engine):
+    assert migrations.run_migrations(baseline_engine, target=4) == [1, 2, 3, 4]
+    assert migrations.run_migrations(baseline_engine) == ALL_VERSIONS[4:]
+    assert migrations.run_migrations(baseline_engine) == []
+
+def test_migrated_database_accepts_new_leads(baseline_engine):
+    migrations.run_migrations(baseline_engine)
+    db = sessionmaker(bind=baseline_engine)()
+    try:
+        lead = database.create_lead(db, schemas.LeadCreate(
+            client_name="Ana", phone="11 98765-4321", city_state="São Paulo/SP"
+        ), 1, policy="flag")
+        assert lead.vendedor_id == 2
+        # O original é o lead mais antigo com o telefone
+        assert lead.duplicate_of_id == 1
+        assert database.get_data_version(db, database.LEADS_SCOPE) == 1
+    finally:
+        db.close()
+
+def test_migrated_schema_matches_models(tmp_path):
+    # As migrações congeladas precisam chegar ao mesmo schema que models.py descreve hoje
+    db_engine = database.create_db_engine(f"sqlite:///{tmp_path / 'novo.db'}")
+    try:
+        migrations.run_migrations(db_engine)
+        with db_engine.connect() as conn:
+            inspector = inspect(conn)
+            for table in models.Base.metadata.sorted_tables:
+                columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+                assert set(columns) == set(table.c.keys()), table.name
+                for model_column in table.c:
+                    assert columns[model_column.name]["nullable"] == model_column.nullable, (table.name, model_column.name)
+                indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+                assert indexes == {index.name for index in table.indexes}, table.name
+            assert inspector.has_table("lead_search")
+    finally:
+        db_engine.dispose()
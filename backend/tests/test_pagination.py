@@ -0,0 +1,81 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from app import database, models, schemas
+
+def create_leads(session_factory, indicador_id: int, vendedor_id: int, count: int) -> list:
+    db = session_factory()
+    try:
+        leads = [
+            schemas.LeadCreate(client_name=f"Cliente {i}", phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP", vendedor_id=vendedor_id)
+            for i in range(count)
+        ]
+        return [lead_id for _, lead_id in database.bulk_create_leads(db, leads, indicador_id)]
+    finally:
+        db.close()
+
+def read_all_pages(session_factory, limit: int, **filters) -> list:
+    db = session_factory()
+    try:
+        ids, cursor, pages = [], None, 0
+        while True:
+            leads = db.execute(database.leads_page_statement(cursor, limit, **filters)).scalars().all()
+            page, cursor = database.split_page(leads, limit)
+            ids += [lead.id for lead in page]
+            pages += 1
+            if cursor is None:
+                return ids, pages
+    finally:
+        db.close()
+
+def test_cursor_round_trip():
+    lead = models.Lead(id=42, created_at=datetime(2025, 10, 8, 14, 30, 5))
+    assert database.decode_cursor(database.encode_cursor(lead)) == (lead.created_at, 42)
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm9uc2Vuc2U=", "MjAyNS0xMC0wOHxhYmM=", "ção"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Cursor inválido"):
+        database.decode_cursor(cursor)
+
+def test_pages_cover_every_lead_once(session_factory, users):
+    ids = create_leads(session_factory, users["indicador"], users["vendedor"], 25)
+    # Mesmo created_at em vários leads: o id desempata
+    db = session_factory()
+    try:
+        db.execute(update(models.Lead).where(models.Lead.id.in_(ids[5:15])).values(created_at=datetime(2025, 1, 1)))
+        db.commit()
+    finally:
+        db.close()
+
+    page_ids, pages = read_all_pages(session_factory, 10)
+    assert sorted(page_ids) == sorted(ids)
+    assert len(page_ids) == len(set(page_ids))
+    assert pages == 3
+    # Do mais recente para o mais antigo; os empatados em ordem decrescente de id
+    assert page_ids[-10:] == sorted(ids[5:15], reverse=True)
+
+def test_pages_respect_filters(session_factory, users):
+    own = create_leads(session_factory, users["indicador"], users["vendedor"], 7)
+    create_leads(session_factory, users["indicador"], users["vendedor2"], 5)
+
+    page_ids, _ = read_all_pages(session_factory, 3, vendedor_id=users["vendedor"])
+    assert sorted(page_ids) == sorted(own)
+
+def test_api_pages_follow_next_cursor(api, auth_headers, session_factory, users):
+    created = create_leads(session_factory, users["indicador"], users["vendedor"], 5)
+    client = TestClient(api)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/leads/", headers=auth_headers("gestor"), params=params).json()
+        seen += [lead["id"] for lead in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(created) and len(seen) == len(set(seen))
+
+def test_api_invalid_cursor_is_bad_request(api, auth_headers):
+    response = TestClient(api).get("/leads/", headers=auth_headers("gestor"), params={"cursor": "invalido"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor inválido"
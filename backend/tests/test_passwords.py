@@ -0,0 +1,62 @@
+import asyncio
+from threading import Event
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app import auth, models, passwords
+
+@pytest.fixture
+def ana(session_factory):
+    """Usuário com senha "segredo" em hash de custo 4"""
+    db = session_factory()
+    try:
+        user = models.User(name="Ana", email="ana@example.com", password=passwords.PasswordHasher(4, 1, 1).hash("segredo"), role=models.UserRole.VENDEDOR)
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def stored_hash(session_factory, user_id: int) -> str:
+    db = session_factory()
+    try:
+        return db.execute(select(models.User.password).where(models.User.id == user_id)).scalar()
+    finally:
+        db.close()
+
+def test_full_queue_is_rejected_with_503():
+    hasher = passwords.PasswordHasher(4, workers=1, max_queue=2)
+    release = Event()
+
+    async def scenario():
+        blocked = [asyncio.ensure_future(hasher._submit(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert hasher.stats()["pending"] == 2 and hasher.stats()["queue_depth"] == 1
+        with pytest.raises(HTTPException) as rejected:
+            await hasher.hash_async("segredo")
+        release.set()
+        await asyncio.gather(*blocked)
+        return rejected.value
+
+    error = asyncio.run(scenario())
+    assert (error.status_code, error.headers) == (503, {"Retry-After": "1"})
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["pending"] == 0
+
+def test_login_is_503_when_the_hasher_is_full(api, ana, monkeypatch):
+    monkeypatch.setattr(auth, "hasher", passwords.PasswordHasher(4, workers=1, max_queue=0))
+    response = TestClient(api).post("/auth/login", json={"email": "ana@example.com", "password": "segredo"})
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
+
+def test_login_rehashes_with_the_configured_cost(api, ana, session_factory, monkeypatch):
+    monkeypatch.setattr(auth, "hasher", passwords.PasswordHasher(5, workers=1, max_queue=4))
+    client = TestClient(api)
+    assert client.post("/auth/login", json={"email": "ana@example.com", "password": "errada"}).status_code == 401
+    assert stored_hash(session_factory, ana).startswith("$2b$04$")
+
+    assert client.post("/auth/login", json={"email": "ana@example.com", "password": "segredo"}).status_code == 200
+    rehashed = stored_hash(session_factory, ana)
+    assert rehashed.startswith("$2b$05$") and auth.hasher.verify("segredo", rehashed)
+    # Já no custo configurado: o próximo login não regrava
+    assert client.post("/auth/login", json={"email": "ana@example.com", "password": "segredo"}).status_code == 200
+    assert stored_hash(session_factory, ana) == rehashed
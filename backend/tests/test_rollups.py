@@ -0,0 +1,69 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from app import models, rollups
+
+def rollup(session_factory) -> dict:
+    db = session_factory()
+    try:
+        counts = models.LeadDailyCount
+        return {
+            (day, status, vendedor_id, indicador_id): total
+            for day, status, vendedor_id, indicador_id, total in db.execute(
+                select(counts.day, counts.status, counts.vendedor_id, counts.indicador_id, counts.total).where(counts.total != 0)
+            )
+        }
+    finally:
+        db.close()
+
+def recomputed(session_factory) -> dict:
+    db = session_factory()
+    try:
+        return {tuple(row[:4]): row[4] for row in db.execute(rollups.lead_groups_statement())}
+    finally:
+        db.close()
+
+def test_rollup_matches_leads_after_each_write(api, auth_headers, session_factory, users):
+    client = TestClient(api)
+    gestor, vendedor = auth_headers("gestor"), auth_headers("vendedor")
+
+    def check():
+        assert rollup(session_factory) == recomputed(session_factory)
+
+    ids = [
+        client.post("/leads/", headers=gestor, json={
+            "client_name": f"Cliente {i}", "phone": f"(11) 9{i:04d}-0000", "city_state": "São Paulo/SP",
+            "vendedor_id": users["vendedor" if i % 2 else "vendedor2"],
+        }).json()["id"]
+        for i in range(6)
+    ]
+    check()
+    client.post("/leads/bulk", headers=gestor, json=[
+        {"client_name": f"Lote {i}", "phone": f"(21) 9{i:04d}-0000", "city_state": "Rio/RJ"} for i in range(4)
+    ])
+    check()
+    client.put(f"/leads/{ids[0]}", headers=gestor, json={"status": "em_contato"})
+    client.put(f"/leads/{ids[0]}", headers=gestor, json={"status": "fechado"})
+    # Mesmo status: nada muda
+    client.put(f"/leads/{ids[0]}", headers=gestor, json={"status": "fechado"})
+    check()
+    assert client.patch("/leads/bulk-status", headers=vendedor, json={"ids": ids, "status": "perdido"}).json() == {"updated": 3}
+    check()
+    client.patch("/leads/bulk-status", headers=gestor, json={"filter": {"status": "novo"}, "status": "em_negociacao"})
+    check()
+    for lead_id in ids[:3]:
+        assert client.delete(f"/leads/{lead_id}", headers=gestor).status_code == 204
+    check()
+    assert sum(rollup(session_factory).values()) == 7
+
+def test_rebuild_restores_the_rollup(session_factory, api, auth_headers):
+    client = TestClient(api)
+    client.post("/leads/", headers=auth_headers("gestor"), json={"client_name": "Ana", "phone": "(11) 90000-0001", "city_state": "São Paulo/SP"})
+    db = session_factory()
+    try:
+        # Divergência, como depois de alterar leads direto no banco
+        db.execute(models.LeadDailyCount.__table__.update().values(total=99))
+        rollups.rebuild(db.connection())
+        db.commit()
+    finally:
+        db.close()
+    assert rollup(session_factory) == recomputed(session_factory)
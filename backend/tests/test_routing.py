@@ -0,0 +1,143 @@
+import asyncio
+from threading import Barrier, Thread
+import httpx
+from sqlalchemy import func, select
+from app import database, models, routing, schemas
+
+def lead(phone: str, city_state: str = "São Paulo/SP") -> schemas.LeadCreate:
+    return schemas.LeadCreate(client_name="Cliente", phone=phone, city_state=city_state)
+
+def open_leads(session_factory) -> dict:
+    db = session_factory()
+    try:
+        return dict(db.execute(
+            select(models.Lead.vendedor_id, func.count())
+            .where(models.Lead.status.in_(routing.OPEN_STATUSES))
+            .group_by(models.Lead.vendedor_id)
+        ).all())
+    finally:
+        db.close()
+
+def total_leads(session_factory) -> dict:
+    db = session_factory()
+    try:
+        return dict(db.execute(select(models.Lead.vendedor_id, func.count()).group_by(models.Lead.vendedor_id)).all())
+    finally:
+        db.close()
+
+def totals(router) -> dict:
+    return {vendedor_id: load["total"] for vendedor_id, load in router._loads.items()}
+
+def settle(router, session_factory) -> dict:
+    """Em aberto por vendedor segundo o router, depois de uma decisão (que recarrega se preciso)"""
+    db = session_factory()
+    try:
+        database.route_leads(db, [{"city_state": "São Paulo/SP"}])
+        db.rollback()
+    finally:
+        db.close()
+    return {vendedor_id: load["open"] for vendedor_id, load in router._loads.items()}
+
+def test_least_open_balances_sequential_leads(session_factory, users, router):
+    db = session_factory()
+    try:
+        assigned = [database.create_lead(db, lead(f"(11) 9{i:04d}-0000"), users["indicador"]).vendedor_id for i in range(6)]
+    finally:
+        db.close()
+    assert assigned == [users["vendedor"], users["vendedor2"]] * 3
+    assert router.stats()["reloads"] == 1
+
+def test_counters_follow_status_changes(session_factory, users, router):
+    db = session_factory()
+    try:
+        first = database.create_lead(db, lead("(11) 90000-0001"), users["indicador"])
+        database.create_lead(db, lead("(11) 90000-0002"), users["indicador"])
+        database.update_lead_status(db, first.id, schemas.LeadUpdate(status=models.LeadStatus.FECHADO))
+        # O vendedor do lead fechado tem menos leads em aberto
+        third = database.create_lead(db, lead("(11) 90000-0003"), users["indicador"])
+        assert third.vendedor_id == first.vendedor_id
+        assert router._loads[first.vendedor_id]["closed"] == 1
+    finally:
+        db.close()
+    assert settle(router, session_factory) == {users["vendedor"]: 1, users["vendedor2"]: 1}
+
+def test_counters_match_database_after_concurrent_writes(session_factory, users, router):
+    threads, per_thread = 4, 10
+    barrier = Barrier(threads)
+    errors = []
+
+    def worker(k: int):
+        db = session_factory()
+        try:
+            barrier.wait()
+            for i in range(per_thread):
+                if i % 2:
+                    database.create_lead(db, lead(f"(31) 9{k}{i:03d}-2222", "Belo Horizonte/MG"), users["indicador"])
+                else:
+                    database.bulk_create_leads(db, [lead(f"(41) 9{k}{i:03d}-333{j}", "Curitiba/PR") for j in range(3)], users["indicador"])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    workers = [Thread(target=worker, args=(k,)) for k in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert errors == []
+    truth = open_leads(session_factory)
+    assert sum(truth.values()) == threads * (per_thread // 2) * 4
+    # Decisões concorrentes são aproximadas, mas a distribuição fica equilibrada
+    assert abs(truth[users["vendedor"]] - truth[users["vendedor2"]]) <= threads * 3
+    # e os contadores voltam a bater com o banco
+    assert settle(router, session_factory) == truth
+
+def test_reload_does_not_count_a_write_twice(session_factory, users, router):
+    db = session_factory()
+    try:
+        database.create_lead(db, lead("(11) 90000-0001"), users["indicador"])
+    finally:
+        db.close()
+    held, load = [], router._load
+
+    def load_after_concurrent_write(session):
+        # Outra transação grava entre a leitura da versão (em route_leads) e a recarga;
+        # o commit dela chega ao router só depois que a recarga já contou a linha
+        router._load = load
+        router.commit = lambda deltas, version: held.append((deltas, version))
+        writer = session_factory()
+        try:
+            database.create_lead(writer, lead("(11) 90000-0002"), users["indicador"])
+        finally:
+            writer.close()
+            del router.commit
+        return load(session)
+
+    router._load = load_after_concurrent_write
+    router._version = None
+    settle(router, session_factory)
+    assert len(held) == 1
+    router.commit(*held[0])
+    assert totals(router) == total_leads(session_factory)
+
+def test_counters_match_database_after_concurrent_api_creates(api, auth_headers, session_factory, users, router):
+    count = 60
+
+    async def create_all():
+        transport = httpx.ASGITransport(app=api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            return await asyncio.gather(*(
+                client.post("/leads/", headers=auth_headers("indicador"), json={
+                    "client_name": f"Cliente {i}", "phone": f"(11) 9{i:04d}-0000", "city_state": "São Paulo/SP"
+                }) for i in range(count)
+            ))
+
+    responses = asyncio.run(create_all())
+    assert [response.status_code for response in responses] == [200] * count
+    truth = total_leads(session_factory)
+    assert sum(truth.values()) == count
+    # Commits fora de ordem forçam a recarga; depois dela nenhuma escrita falta ou se repete
+    assert settle(router, session_factory) == open_leads(session_factory)
+    assert totals(router) == truth
@@ -0,0 +1,57 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import search
+
+@pytest.fixture
+def client(api, auth_headers, users):
+    test_client = TestClient(api)
+    leads = [
+        ("José da Silva", "(11) 98765-4321", "São Paulo/SP", "vendedor", None),
+        ("Maria Silva", "(21) 3333-4444", "Rio de Janeiro/RJ", "vendedor2", "Cliente pediu orçamento"),
+        ("Ana Souza", "(31) 99999-0000", "Belo Horizonte/MG", "vendedor", "Conhece o José Silva"),
+    ]
+    test_client.ids = {}
+    for name, phone, city, vendedor, observation in leads:
+        test_client.ids[name] = test_client.post("/leads/", headers=auth_headers("gestor"), json={
+            "client_name": name, "phone": phone, "city_state": city, "vendedor_id": users[vendedor], "observation": observation,
+        }).json()["id"]
+    return test_client
+
+def names(response) -> list:
+    return [lead["client_name"] for lead in response.json()["items"]]
+
+def find(client, headers, q: str, **params):
+    return client.get("/leads/search", headers=headers, params={"q": q, **params})
+
+@pytest.mark.parametrize("q, expected", [
+    ("jose", ["José da Silva", "Ana Souza"]),
+    ("SÃO PAULO", ["José da Silva"]),
+    ("98765-4321", ["José da Silva"]),
+    ("(21) 3333", ["Maria Silva"]),
+    ("orcamento", ["Maria Silva"]),
+    ("silva jose", ["José da Silva", "Ana Souza"]),
+    ("inexistente", []),
+])
+def test_matches_and_ranking(client, auth_headers, q, expected):
+    # Nome pesa mais que observação
+    assert names(find(client, auth_headers("gestor"), q)) == expected
+
+def test_results_are_scoped_by_role(client, auth_headers):
+    assert sorted(names(find(client, auth_headers("gestor"), "silva"))) == ["Ana Souza", "José da Silva", "Maria Silva"]
+    assert sorted(names(find(client, auth_headers("vendedor"), "silva"))) == ["Ana Souza", "José da Silva"]
+    assert names(find(client, auth_headers("vendedor2"), "silva")) == ["Maria Silva"]
+    # Os leads foram indicados pelo gestor
+    assert names(find(client, auth_headers("indicador"), "silva")) == []
+    assert len(names(find(client, auth_headers("gestor"), "silva"))) == 3
+
+def test_index_follows_writes(client, auth_headers):
+    headers = auth_headers("gestor")
+    client.patch("/leads/bulk-status", headers=headers, json={"ids": [client.ids["Maria Silva"]], "status": "em_contato", "observation": "Retornar na sexta"})
+    assert names(find(client, headers, "sexta")) == ["Maria Silva"]
+    assert names(find(client, headers, "orcamento")) == []
+    client.delete(f"/leads/{client.ids['José da Silva']}", headers=headers)
+    assert names(find(client, headers, "jose")) == ["Ana Souza"]
+
+def test_short_terms(client, auth_headers):
+    assert search.query_terms("de SP jose") == ["jose"]
+    assert find(client, auth_headers("gestor"), "ab").status_code == 422
@@ -0,0 +1,66 @@
+from datetime import date, datetime
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from app import database, models, rollups, schemas, stats
+
+DAY = date(2025, 9, 1)
+
+@pytest.fixture
+def leads(session_factory, users):
+    """
+    1, 2 e 3 leads em três dias seguidos; um fechado e um perdido.
+    Criados pelo caminho normal e depois com a criação antecipada, com o rollup reconstruído
+    """
+    rows = [
+        (1, "vendedor", models.LeadStatus.FECHADO),
+        (2, "vendedor", None), (2, "vendedor2", models.LeadStatus.PERDIDO),
+        (3, "vendedor", None), (3, "vendedor", None), (3, "vendedor", models.LeadStatus.EM_CONTATO),
+    ]
+    db = session_factory()
+    try:
+        for i, (day, vendedor, status) in enumerate(rows):
+            lead = database.create_lead(db, schemas.LeadCreate(
+                client_name=f"Cliente {i}", phone=f"(11) 9{i:04d}-0000", city_state="São Paulo/SP", vendedor_id=users[vendedor],
+            ), users["indicador"])
+            if status is not None:
+                database.update_lead_status(db, lead.id, schemas.LeadUpdate(status=status))
+            db.execute(update(models.Lead).where(models.Lead.id == lead.id).values(created_at=datetime(2025, 9, day, 10)))
+        rollups.rebuild(db.connection())
+        db.commit()
+    finally:
+        db.close()
+
+def test_daily_stats(session_factory, leads):
+    db = session_factory()
+    try:
+        result = stats.leads_daily_stats(db)
+    finally:
+        db.close()
+    assert (result["total_leads"], result["closed"], result["lost"], result["in_progress"]) == (6, 1, 1, 4)
+    assert result["conversion_rate"] == pytest.approx(100 / 6)
+    assert result["series"] == [{"date": "2025-09-01", "count": 1}, {"date": "2025-09-02", "count": 2}, {"date": "2025-09-03", "count": 3}]
+    assert (result["days"], result["mean"], result["median"], result["mode"], result["std"]) == (3, 2.0, 2.0, 1.0, 1.0)
+    assert (result["min"], result["max"], result["skewness"]) == (1.0, 3.0, 0.0)
+    # Curtose precisa de 4 dias; o intervalo usa t de Student com 2 graus de liberdade
+    assert result["kurtosis"] is None
+    assert result["ci_lower"] == pytest.approx(2 - 4.302653 / 3 ** 0.5)
+    assert result["ci_upper"] == pytest.approx(2 + 4.302653 / 3 ** 0.5)
+
+def test_daily_stats_filters(session_factory, users, leads):
+    db = session_factory()
+    try:
+        by_vendedor = stats.leads_daily_stats(db, vendedor_id=users["vendedor"])
+        by_period = stats.leads_daily_stats(db, start_date=date(2025, 9, 2), end_date=date(2025, 9, 2))
+        empty = stats.leads_daily_stats(db, start_date=date(2025, 10, 1))
+    finally:
+        db.close()
+    assert [day["count"] for day in by_vendedor["series"]] == [1, 1, 3]
+    assert (by_period["total_leads"], by_period["days"], by_period["std"]) == (2, 1, None)
+    assert (empty["total_leads"], empty["days"], empty["conversion_rate"], empty["series"]) == (0, 0, 0.0, [])
+
+def test_daily_stats_endpoint_is_for_gestor(api, auth_headers, leads):
+    client = TestClient(api)
+    response = client.get("/stats/leads/daily", headers=auth_headers("gestor"))
+    assert response.status_code == 200 and response.json()["total_leads"] == 6
+    assert client.get("/stats/leads/daily", headers=auth_headers("vendedor")).status_code == 403
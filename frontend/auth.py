@@ -1,6 +1,35 @@
 import requests
 import streamlit as st
 import os
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+
+LEADS_PAGE_SIZE = 50
+# Respostas GET guardadas por sessão do usuário
+HTTP_CACHE_SIZE = 50
+HTTP_POOL_SIZE = int(os.getenv("FRONTEND_HTTP_POOL_SIZE", "20"))
+
+# Por quantos segundos uma resposta GET é reaproveitada sem requisição nenhuma (os reruns
+# do Streamlit a cada interação não chegam ao backend); depois disso ela é revalidada com
+# If-None-Match. Vale o prefixo mais longo que casar com o endpoint; sem prefixo, 0.
+CACHE_TTLS = {
+    "/auth/me": 300,
+    "/vendedores/": 300,
+    "/users/": 60,
+    "/stats/": 30,
+    "/leads/": 10,
+}
+
+# GETs invalidados por uma escrita bem-sucedida, pelo prefixo mais longo do endpoint
+# da escrita; escritas sem regra limpam o cache inteiro
+CACHE_INVALIDATIONS = {
+    "/leads/export/link": (),
+    "/leads/": ("/leads/", "/stats/"),
+    "/auth/register": ("/users/", "/vendedores/"),
+}
 
 # Detecta automaticamente o ambiente
 # Para Streamlit Cloud, use a variável de ambiente BACKEND_URL
@@ -17,9 +46,50 @@ else:
     # Desenvolvimento local
     BASE_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 
+# URL do backend vista pelo navegador (links de download); por padrão a mesma usada pelo servidor
+PUBLIC_BACKEND_URL = os.getenv("PUBLIC_BACKEND_URL", BASE_URL)
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    Sessão HTTP do processo, compartilhada entre usuários: reaproveita conexões keep-alive
+    com o backend. Não guarda estado de usuário (o token vai em cada requisição e cookies
+    são recusados).
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _longest_prefix(rules: dict, endpoint: str):
+    path = endpoint.split("?")[0]
+    matches = [prefix for prefix in rules if path.startswith(prefix)]
+    return max(matches, key=len) if matches else None
+
+def invalidate_cache(*prefixes):
+    """
+    Vence as respostas em cache cujos endpoints começam com os prefixos (todas, sem
+    prefixos). Elas continuam guardadas para a revalidação: o que não mudou volta como 304.
+    """
+    cache = st.session_state.get("http_cache")
+    if not cache:
+        return
+    for key, (response, _) in cache.items():
+        if not prefixes or key[1].startswith(prefixes):
+            cache[key] = (response, 0)
+
+def _invalidate_after_write(endpoint: str):
+    prefix = _longest_prefix(CACHE_INVALIDATIONS, endpoint)
+    if prefix is None:
+        invalidate_cache()
+    elif CACHE_INVALIDATIONS[prefix]:
+        invalidate_cache(*CACHE_INVALIDATIONS[prefix])
+
 def login(email: str, password: str):
     try:
-        response = requests.post(f"{BASE_URL}/auth/login", json={
+        response = get_http_session().post(f"{BASE_URL}/auth/login", json={
             "email": email,
             "password": password
         })
@@ -33,7 +103,7 @@ def login(email: str, password: str):
 
 def register(name: str, email: str, password: str, role: str):
     try:
-        response = requests.post(f"{BASE_URL}/auth/register", json={
+        response = get_http_session().post(f"{BASE_URL}/auth/register", json={
             "name": name,
             "email": email,
             "password": password,
@@ -54,6 +124,10 @@ def register(name: str, email: str, password: str, role: str):
 
 def logout():
     st.session_state.user = None
+    st.session_state.pop("http_cache", None)
+    listener = st.session_state.pop("lead_listener", None)
+    if listener is not None:
+        listener.stop()
 
 def get_current_user():
     return st.session_state.get('user')
@@ -63,18 +137,77 @@ def make_authenticated_request(endpoint: str, method: str = "GET", data: dict =
     if not user:
         return None
     
-    headers = {"X-User-Email": user.get('email')}
+    headers = {"Authorization": f"Bearer {user.get('access_token')}"}
     url = f"{BASE_URL}{endpoint}"
+    session = get_http_session()
     
     try:
         if method == "GET":
-            response = requests.get(url, headers=headers)
-        elif method == "POST":
-            response = requests.post(url, json=data, headers=headers)
-        elif method == "PUT":
-            response = requests.put(url, json=data, headers=headers)
+            cache = st.session_state.setdefault("http_cache", OrderedDict())
+            key = (user.get("id"), endpoint)
+            cached = cache.get(key)
+            ttl = CACHE_TTLS.get(_longest_prefix(CACHE_TTLS, endpoint), 0)
+            if cached is not None:
+                cached_response, fresh_until = cached
+                if time.monotonic() < fresh_until:
+                    cache.move_to_end(key)
+                    return cached_response
+                # Vencida: revalida, e em 304 o backend não reenvia o corpo
+                if "ETag" in cached_response.headers:
+                    headers["If-None-Match"] = cached_response.headers["ETag"]
+            response = session.get(url, headers=headers)
+            if response.status_code == 304 and cached is not None:
+                cache[key] = (cached[0], time.monotonic() + ttl)
+                cache.move_to_end(key)
+                return cached[0]
+            if response.status_code == 200 and (ttl or "ETag" in response.headers):
+                cache[key] = (response, time.monotonic() + ttl)
+                cache.move_to_end(key)
+                while len(cache) > HTTP_CACHE_SIZE:
+                    cache.popitem(last=False)
+        else:
+            response = session.request(method, url, json=data, headers=headers)
+            if response.status_code < 400:
+                _invalidate_after_write(endpoint)
         
+        if response.status_code == 401:
+            # Token expirado: força novo login
+            logout()
+            st.warning("Sua sessão expirou. Faça login novamente.")
         return response
     except Exception as e:
         st.error(f"Erro ao conectar com o servidor: {e}")
         return None
+
+def get_leads_page(page_key: str, limit: int = LEADS_PAGE_SIZE):
+    """
+    Busca a página atual de leads. A pilha de cursores já visitados fica em
+    st.session_state[page_key], permitindo voltar para a página anterior.
+    """
+    cursors = st.session_state.setdefault(page_key, [None])
+    params = {"limit": limit}
+    if cursors[-1]:
+        params["cursor"] = cursors[-1]
+    
+    response = make_authenticated_request(f"/leads/?{urlencode(params)}")
+    if response and response.status_code == 200:
+        return response.json()
+    if response is not None and response.status_code == 400:
+        # Cursor expirado/inválido: volta para a primeira página
+        st.session_state[page_key] = [None]
+    return None
+
+def show_page_controls(page_key: str, next_cursor: str = None):
+    cursors = st.session_state.setdefault(page_key, [None])
+    
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if len(cursors) > 1 and st.button("⬅️ Anterior", key=f"{page_key}_prev"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Página {len(cursors)}")
+    with col3:
+        if next_cursor and st.button("Próxima ➡️", key=f"{page_key}_next"):
+            cursors.append(next_cursor)
+            st.rerun()
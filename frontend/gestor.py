@@ -1,12 +1,11 @@
 
 import streamlit as st
-from auth import get_current_user, make_authenticated_request
+from auth import get_current_user, make_authenticated_request, get_leads_page, show_page_controls, invalidate_cache, PUBLIC_BACKEND_URL
+from live import live_updates
+from urllib.parse import urlencode
 import pandas as pd
-from datetime import datetime
 import numpy as np 
-import scipy.stats as stats
 import matplotlib.pyplot as plt
-import time
 
 def show_gestor_interface():
     menu = st.sidebar.selectbox("Menu Gestor", ["Dashboard", "Leads", "Usuários"])
@@ -22,51 +21,40 @@ def show_gestor_dashboard():
     st.header("📊 Dashboard Executivo")
     
     # Controles de atualização
-    col1, col2, col3 = st.columns([2, 2, 1])
+    col1, col2 = st.columns([4, 1])
     
     with col1:
-        auto_refresh = st.checkbox("🔄 Atualização Automática", value=False, key="auto_refresh")
+        live = st.checkbox("🔴 Atualização ao vivo", value=False, key="live_dashboard")
     
     with col2:
-        if auto_refresh:
-            refresh_interval = st.selectbox(
-                "Intervalo de atualização",
-                options=[10, 30, 60, 120],
-                format_func=lambda x: f"{x} segundos",
-                key="refresh_interval"
-            )
-    
-    with col3:
         if st.button("🔄 Atualizar Agora", use_container_width=True):
+            # Ignora o TTL do cache; o que não mudou volta como 304
+            invalidate_cache()
             st.rerun()
     
-    # Auto-refresh logic
-    if auto_refresh:
-        time.sleep(refresh_interval)
-        st.rerun()
+    # Eventos do backend (SSE) refazem a página assim que um lead é criado ou alterado
+    if live:
+        live_updates("gestor_dashboard")
     
     st.markdown("---")
 
-    response = make_authenticated_request("/leads/")
+    # Estatísticas agregadas no backend: o payload não cresce com a tabela de leads
+    response = make_authenticated_request("/stats/leads/daily")
     if response and response.status_code == 200:
-        leads = response.json()
+        resumo = response.json()
 
-        if not leads:
+        if resumo['total_leads'] == 0:
             st.info("📭 Nenhum lead cadastrado ainda.")
             return
 
-        # Converter datas
-        for lead in leads:
-            lead['created_date'] = datetime.strptime(lead['created_at'][:10], '%Y-%m-%d')
-
         # ===== MÉTRICAS PRINCIPAIS =====
         st.subheader("📈 Visão Geral de Performance")
 
-        total_leads = len(leads)
-        fechados = len([l for l in leads if l['status'] == 'fechado'])
-        perdidos = len([l for l in leads if l['status'] == 'perdido'])
-        em_andamento = total_leads - fechados - perdidos
-        taxa_conversao = (fechados / total_leads * 100) if total_leads > 0 else 0
+        total_leads = resumo['total_leads']
+        fechados = resumo['closed']
+        perdidos = resumo['lost']
+        em_andamento = resumo['in_progress']
+        taxa_conversao = resumo['conversion_rate']
 
         col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("📋 Total de Leads", total_leads)
@@ -77,40 +65,34 @@ def show_gestor_dashboard():
 
         st.markdown("---")
 
+        show_funnel_analytics()
+
+        st.markdown("---")
+
+        show_leaderboard()
+
+        st.markdown("---")
+
         # ===== ESTATÍSTICAS DESCRITIVAS =====
         st.subheader("📊 Análise Inteligente de Performance")
 
-        df_leads = pd.DataFrame(leads)
-        df_leads['data'] = pd.to_datetime(df_leads['created_at'], format='ISO8601').dt.date
-        leads_por_dia_series = df_leads.groupby('data').size()
+        leads_por_dia_series = np.array([dia['count'] for dia in resumo['series']])
 
         if len(leads_por_dia_series) > 0:
-            # Calcular estatísticas
-            media = leads_por_dia_series.mean()
-            mediana = leads_por_dia_series.median()
-            desvio_padrao = leads_por_dia_series.std()
-            modo_valores = leads_por_dia_series.mode()
-            moda = modo_valores.iloc[0] if len(modo_valores) > 0 else 0
-            minimo = leads_por_dia_series.min()
-            maximo = leads_por_dia_series.max()
-            
-            # Assimetria (Skewness)
-            assimetria = leads_por_dia_series.skew()
-            
-            # Curtose (Kurtosis)
-            curtose = leads_por_dia_series.kurtosis()
+            # Estatísticas já calculadas pelo backend (None quando não há dias suficientes)
+            media = resumo['mean']
+            mediana = resumo['median']
+            desvio_padrao = resumo['std'] or 0
+            moda = resumo['mode']
+            minimo = resumo['min']
+            maximo = resumo['max']
+            assimetria = resumo['skewness'] or 0
+            curtose = resumo['kurtosis'] or 0
 
             # Intervalo de confiança (95%)
-            confianca = 0.95
-            graus_liberdade = len(leads_por_dia_series) - 1
-            ic_inferior = 0
-            ic_superior = 0
-            if graus_liberdade > 0:
-                t_critico = stats.t.ppf((1 + confianca) / 2, graus_liberdade)
-                erro_padrao = desvio_padrao / np.sqrt(len(leads_por_dia_series))
-                margem_erro = t_critico * erro_padrao
-                ic_inferior = media - margem_erro
-                ic_superior = media + margem_erro
+            graus_liberdade = resumo['days'] - 1
+            ic_inferior = resumo['ci_lower'] or 0
+            ic_superior = resumo['ci_upper'] or 0
 
             # Exibir métricas em cards - Linha 1
             col1, col2, col3, col4 = st.columns(4)
@@ -367,14 +349,7 @@ def show_gestor_dashboard():
             # Download dos Dados
             st.markdown("---")
             st.subheader("📥 Exportar Dados")
-            csv = df_leads.to_csv(index=False)
-            st.download_button(
-                label="⬇️ Baixar Relatório Completo (CSV)",
-                data=csv,
-                file_name=f"relatorio_leads_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+            show_export_controls()
 
         else:
             st.info("📊 Dados insuficientes para calcular estatísticas. Aguarde mais leads serem cadastrados.")
@@ -382,3 +357,229 @@ def show_gestor_dashboard():
         st.markdown("---")
     else:
         st.error("❌ Erro ao carregar dados do dashboard")
+
+def _format_duration(seconds):
+    horas = seconds / 3600
+    return f"{horas / 24:.1f} dias" if horas >= 48 else f"{horas:.1f} h"
+
+def show_funnel_analytics():
+    # Funil e tempos por etapa calculados no backend a partir do histórico de status
+    st.subheader("🔻 Funil de Conversão")
+
+    funil = make_authenticated_request("/stats/funnel")
+    duracoes = make_authenticated_request("/stats/stage-durations")
+    vendedores = make_authenticated_request("/vendedores/")
+    if not (funil and funil.status_code == 200 and duracoes and duracoes.status_code == 200):
+        st.error("❌ Erro ao carregar o funil de conversão")
+        return
+    funil, duracoes = funil.json(), duracoes.json()
+    nomes = {v["id"]: v["name"] for v in vendedores.json()} if vendedores and vendedores.status_code == 200 else {}
+
+    def etapa(status):
+        return status.replace('_', ' ').title()
+
+    def percentual(valor):
+        return f"{valor:.1f}%" if valor is not None else "—"
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Leads que passaram por cada etapa**")
+        st.dataframe(pd.DataFrame([
+            {
+                "Etapa": etapa(e["status"]),
+                "Alcançaram": e["reached"],
+                "Conversão da etapa anterior": percentual(e["conversion_from_previous"]),
+                "Conversão desde a entrada": percentual(e["conversion_from_start"]),
+                "Perdidos nesta etapa": e["lost"],
+            }
+            for e in funil["stages"]
+        ]), hide_index=True, use_container_width=True)
+    with col2:
+        st.markdown("**Tempo em cada etapa (mediana / p90)**")
+        if duracoes["stages"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "Etapa": etapa(d["status"]),
+                    "Mediana": _format_duration(d["median_seconds"]),
+                    "p90": _format_duration(d["p90_seconds"]),
+                    "Transições": d["transitions"],
+                }
+                for d in duracoes["stages"]
+            ]), hide_index=True, use_container_width=True)
+        else:
+            st.info("Ainda não há leads que avançaram de etapa.")
+
+    with st.expander("👥 Funil e tempos por vendedor"):
+        tempos = {
+            (v["vendedor_id"], d["status"]): d
+            for v in duracoes["by_vendedor"] for d in v["stages"]
+        }
+        linhas = []
+        for v in funil["by_vendedor"]:
+            for e in v["stages"]:
+                tempo = tempos.get((v["vendedor_id"], e["status"]))
+                linhas.append({
+                    "Vendedor": nomes.get(v["vendedor_id"], f"ID {v['vendedor_id']}"),
+                    "Etapa": etapa(e["status"]),
+                    "Alcançaram": e["reached"],
+                    "Conversão da etapa anterior": percentual(e["conversion_from_previous"]),
+                    "Mediana na etapa": _format_duration(tempo["median_seconds"]) if tempo else "—",
+                    "p90 na etapa": _format_duration(tempo["p90_seconds"]) if tempo else "—",
+                })
+        st.dataframe(pd.DataFrame(linhas), hide_index=True, use_container_width=True)
+
+def show_leaderboard():
+    st.subheader("🏆 Rankings")
+
+    janelas = {"Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90, "Todo o período": None}
+    criterios = {"Fechamentos": "closed", "Leads recebidos": "leads", "Taxa de conversão": "conversion_rate"}
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        janela = st.selectbox("Período", list(janelas), index=1, key="leaderboard_window")
+    with col2:
+        criterio = st.selectbox("Ordenar por", list(criterios), key="leaderboard_rank_by")
+    with col3:
+        limite = st.number_input("Top", min_value=1, max_value=100, value=10, key="leaderboard_limit")
+
+    params = {"limit": int(limite), "rank_by": criterios[criterio]}
+    if janelas[janela]:
+        params["days"] = janelas[janela]
+    response = make_authenticated_request(f"/stats/leaderboard?{urlencode(params)}")
+    if not response or response.status_code != 200:
+        st.error("❌ Erro ao carregar os rankings")
+        return
+    ranking = response.json()
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Vendedores**")
+        st.dataframe(pd.DataFrame([
+            {
+                "Vendedor": v["name"],
+                "Leads": v["leads"],
+                "Fechados": v["closed"],
+                "Conversão": f"{v['conversion_rate']:.1f}%",
+                "Tempo médio até fechar": _format_duration(v["avg_seconds_to_close"]) if v["avg_seconds_to_close"] is not None else "—",
+            }
+            for v in ranking["vendedores"]
+        ]), hide_index=True, use_container_width=True)
+    with col2:
+        st.markdown("**Indicadores**")
+        st.dataframe(pd.DataFrame([
+            {
+                "Indicador": i["name"],
+                "Leads": i["leads"],
+                "Fechados": i["closed"],
+                "Conversão": f"{i['conversion_rate']:.1f}%",
+                "Perdidos": f"{i['loss_rate']:.1f}%",
+            }
+            for i in ranking["indicadores"]
+        ]), hide_index=True, use_container_width=True)
+
+def show_export_controls():
+    # O arquivo é gerado em streaming pelo backend e baixado direto pelo navegador,
+    # sem passar pela memória do Streamlit
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        formato = st.selectbox("Formato", ["csv", "ndjson", "parquet"], format_func=str.upper, key="export_format")
+    with col2:
+        periodo = st.date_input("Período (opcional)", value=[], key="export_period")
+    with col3:
+        status = st.selectbox(
+            "Status",
+            ["", "novo", "em_contato", "em_negociacao", "fechado", "perdido"],
+            format_func=lambda x: x.replace('_', ' ').title() if x else "Todos",
+            key="export_status"
+        )
+    
+    if st.button("📄 Gerar Link do Relatório", use_container_width=True):
+        response = make_authenticated_request("/leads/export/link", "POST")
+        if response and response.status_code == 200:
+            params = {"format": formato, "token": response.json()["token"]}
+            if len(periodo) == 2:
+                params["start_date"], params["end_date"] = periodo[0].isoformat(), periodo[1].isoformat()
+            if status:
+                params["status"] = status
+            st.link_button(
+                "⬇️ Baixar Relatório Completo",
+                f"{PUBLIC_BACKEND_URL}/leads/export?{urlencode(params)}",
+                use_container_width=True
+            )
+            st.caption(f"Link válido por {response.json()['expires_in'] // 60} minutos.")
+        else:
+            st.error("❌ Erro ao gerar relatório")
+
+LEAD_TABLE_COLUMNS = ["id", "client_name", "phone", "city_state", "status", "vendedor_id", "indicador_id", "created_at"]
+
+def show_lead_search(query: str):
+    response = make_authenticated_request(f"/leads/search?{urlencode({'q': query, 'limit': 50})}")
+    if not response or response.status_code != 200:
+        st.error("Erro ao buscar leads")
+        return
+    
+    items = response.json()["items"]
+    if not items:
+        st.info("🔍 Nenhum lead encontrado.")
+        return
+    
+    st.caption(f"{len(items)} resultado(s), mais relevantes primeiro")
+    st.dataframe(pd.DataFrame(items)[LEAD_TABLE_COLUMNS], use_container_width=True, hide_index=True)
+
+def show_gestor_leads():
+    st.header("📋 Todos os Leads")
+    
+    query = st.text_input("🔍 Buscar", placeholder="Nome, telefone, cidade ou observação").strip()
+    if len(query) >= 3:
+        show_lead_search(query)
+        return
+    if query:
+        st.caption("Digite pelo menos 3 caracteres para buscar.")
+    
+    page = get_leads_page("gestor_leads_cursors")
+    if page is None:
+        st.error("Erro ao carregar leads")
+        return
+    
+    if not page["items"]:
+        st.info("📭 Nenhum lead cadastrado ainda.")
+        return
+    
+    df_leads = pd.DataFrame(page["items"])
+    st.dataframe(
+        df_leads[LEAD_TABLE_COLUMNS],
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    show_page_controls("gestor_leads_cursors", page["next_cursor"])
+
+def show_gestor_usuarios():
+    st.header("👥 Usuários")
+    
+    response = make_authenticated_request("/users/")
+    if not response or response.status_code != 200:
+        st.error("Erro ao carregar usuários")
+        return
+    
+    usuarios = response.json()
+    if not usuarios:
+        st.info("📭 Nenhum usuário cadastrado ainda.")
+        return
+    
+    df_usuarios = pd.DataFrame(usuarios)
+    
+    col1, col2, col3 = st.columns(3)
+    contagem = df_usuarios["role"].value_counts()
+    with col1:
+        st.metric("Gestores", int(contagem.get("gestor", 0)))
+    with col2:
+        st.metric("Vendedores", int(contagem.get("vendedor", 0)))
+    with col3:
+        st.metric("Indicadores", int(contagem.get("indicador", 0)))
+    
+    df_usuarios["role"] = df_usuarios["role"].str.title()
+    st.dataframe(
+        df_usuarios[["id", "name", "email", "role", "created_at"]],
+        use_container_width=True,
+        hide_index=True
+    )
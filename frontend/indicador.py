@@ -1,5 +1,5 @@
 import streamlit as st
-from auth import get_current_user, make_authenticated_request
+from auth import get_current_user, make_authenticated_request, get_leads_page, show_page_controls
 import requests
 
 def show_indicador_interface():
@@ -25,7 +25,9 @@ def show_novo_lead():
         st.warning("Nenhum vendedor disponível no momento.")
         return
     
-    vendedor_options = {f"{v['name']} (ID: {v['id']})": v['id'] for v in vendedores}
+    # "Automático": o backend escolhe o vendedor (LEAD_ROUTING_STRATEGY)
+    vendedor_options = {"Automático": None}
+    vendedor_options.update({f"{v['name']} (ID: {v['id']})": v['id'] for v in vendedores})
     
     with st.form("novo_lead_form"):
         client_name = st.text_input("Nome do Cliente *")
@@ -49,21 +51,28 @@ def show_novo_lead():
                     "phone": phone,
                     "city_state": city_state,
                     "observation": observation,
-                    "vendedor_id": vendedor_options[vendedor_selecionado]
                 }
+                if vendedor_options[vendedor_selecionado] is not None:
+                    lead_data["vendedor_id"] = vendedor_options[vendedor_selecionado]
                 
                 response = make_authenticated_request("/leads/", "POST", lead_data)
                 if response and response.status_code == 200:
-                    st.success("Lead enviado com sucesso!")
+                    lead = response.json()
+                    if lead.get("duplicate_of_id"):
+                        st.warning(f"Lead enviado, mas o telefone já estava cadastrado (lead #{lead['duplicate_of_id']}).")
+                    else:
+                        st.success("Lead enviado com sucesso!")
+                elif response is not None and response.status_code == 409:
+                    st.error(response.json()["detail"])
                 else:
                     st.error("Erro ao enviar lead")
 
 def show_meus_leads():
     st.header("📊 Meus Leads")
     
-    response = make_authenticated_request("/leads/")
-    if response and response.status_code == 200:
-        leads = response.json()
+    page = get_leads_page("indicador_leads_cursors")
+    if page is not None:
+        leads = page["items"]
         
         if not leads:
             st.info("Nenhum lead enviado ainda.")
@@ -89,5 +98,7 @@ def show_meus_leads():
                        <strong>Vendedor ID:</strong> {lead.get('vendedor_id', 'N/A')}</small>
             </div>
             """, unsafe_allow_html=True)
+        
+        show_page_controls("indicador_leads_cursors", page["next_cursor"])
     else:
         st.error("Erro ao carregar leads")
@@ -0,0 +1,103 @@
+import json
+import threading
+import requests
+import streamlit as st
+from auth import BASE_URL, get_current_user, invalidate_cache
+
+# Intervalo da verificação local (sem requisição ao backend) de novos eventos
+LIVE_CHECK_SECONDS = 1
+RECONNECT_SECONDS = 3
+
+class LeadEventListener(threading.Thread):
+    """
+    Mantém uma conexão SSE com /events/leads em segundo plano e conta os eventos
+    recebidos. Não usa a API do Streamlit: a página só compara `version`.
+    """
+
+    def __init__(self, token: str):
+        super().__init__(name="lead-events", daemon=True)
+        self.token = token
+        self.version = 0
+        self.last_event = None
+        self.connected = False
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with requests.get(
+                    f"{BASE_URL}/events/leads",
+                    headers={"Authorization": f"Bearer {self.token}", "Accept": "text/event-stream"},
+                    stream=True,
+                    # O backend manda keepalive a cada 15 s
+                    timeout=(5, 60),
+                ) as response:
+                    if response.status_code == 401:
+                        # Token expirado: o próximo request da página leva ao login
+                        return
+                    response.raise_for_status()
+                    self.connected = True
+                    self._consume(response)
+            except requests.RequestException:
+                pass
+            self.connected = False
+            self._stopped.wait(RECONNECT_SECONDS)
+
+    def _consume(self, response):
+        event_type, data = None, []
+        for line in response.iter_lines(decode_unicode=True):
+            if self._stopped.is_set():
+                return
+            if not line:
+                if data:
+                    self._dispatch(event_type, "\n".join(data))
+                event_type, data = None, []
+            elif line.startswith("event:"):
+                event_type = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].lstrip())
+            # Comentários (": keepalive") e "retry:" são ignorados
+
+    def _dispatch(self, event_type: str, data: str):
+        try:
+            self.last_event = json.loads(data)
+        except ValueError:
+            self.last_event = {"type": event_type}
+        self.version += 1
+
+    def stop(self):
+        self._stopped.set()
+
+def get_lead_listener():
+    """Listener da sessão; recriado se o token mudou ou a conexão foi encerrada de vez"""
+    token = get_current_user().get("access_token")
+    listener = st.session_state.get("lead_listener")
+    if listener is None or listener.token != token or not listener.is_alive():
+        if listener is not None:
+            listener.stop()
+        listener = LeadEventListener(token)
+        listener.start()
+        st.session_state.lead_listener = listener
+    return listener
+
+@st.fragment(run_every=LIVE_CHECK_SECONDS)
+def _watch_lead_events(key: str):
+    listener = st.session_state.get("lead_listener")
+    if listener is None:
+        return
+    seen_key = f"{key}_seen_events"
+    if listener.version != st.session_state.get(seen_key, listener.version):
+        st.session_state[seen_key] = listener.version
+        # As respostas em cache ainda dentro do TTL ficaram desatualizadas
+        invalidate_cache("/leads/", "/stats/")
+        st.rerun()
+    st.session_state[seen_key] = listener.version
+    st.caption("🟢 Ao vivo" if listener.connected else "🟡 Reconectando...")
+
+def live_updates(key: str):
+    """
+    Recarrega a página quando o backend publica eventos de leads. A verificação
+    periódica é local; a página só é refeita (e revalidada) quando algo mudou.
+    """
+    get_lead_listener()
+    _watch_lead_events(key)
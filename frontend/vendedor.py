@@ -1,18 +1,33 @@
 import streamlit as st
-from auth import get_current_user, make_authenticated_request
+from auth import get_current_user, make_authenticated_request, get_leads_page, show_page_controls
+from live import live_updates
 import pandas as pd
 
+STATUS_OPTIONS = ["novo", "em_contato", "em_negociacao", "fechado", "perdido"]
+STATUS_LABELS = {
+    "novo": "Novo",
+    "em_contato": "Em Contato",
+    "em_negociacao": "Em Negociação",
+    "fechado": "Fechado",
+    "perdido": "Perdido"
+}
+
 def show_vendedor_interface():
     st.header("💼 Painel do Vendedor")
     
-    response = make_authenticated_request("/leads/")
-    if response and response.status_code == 200:
-        leads = response.json()
+    if st.checkbox("🔴 Atualização ao vivo", value=False, key="live_vendedor"):
+        live_updates("vendedor_leads")
+    
+    page = get_leads_page("vendedor_leads_cursors")
+    if page is not None:
+        leads = page["items"]
         
         if not leads:
             st.info("Nenhum lead atribuído ainda.")
             return
         
+        show_bulk_status_update(leads)
+        
         for lead in leads:
             with st.expander(f"🔹 {lead['client_name']} - {lead['status'].replace('_', ' ').title()}"):
                 col1, col2 = st.columns([2, 1])
@@ -23,21 +38,13 @@ def show_vendedor_interface():
                     st.write(f"**Observação:** {lead['observation'] or 'Nenhuma'}")
                     st.write(f"**Data:** {lead['created_at'][:10]}")
                 
-                with col2:
-                    status_options = ["novo", "em_contato", "em_negociacao", "fechado", "perdido"]
-                    status_labels = {
-                        "novo": "Novo",
-                        "em_contato": "Em Contato",
-                        "em_negociacao": "Em Negociação",
-                        "fechado": "Fechado",
-                        "perdido": "Perdido"
-                    }
-                    
-                    current_index = status_options.index(lead['status'])
+                # Formulário: digitar ou trocar o status não refaz a página até o envio
+                with col2, st.form(f"update_form_{lead['id']}", border=False):
+                    current_index = STATUS_OPTIONS.index(lead['status'])
                     new_status = st.selectbox(
                         "Status",
-                        options=status_options,
-                        format_func=lambda x: status_labels[x],
+                        options=STATUS_OPTIONS,
+                        format_func=lambda x: STATUS_LABELS[x],
                         index=current_index,
                         key=f"status_{lead['id']}"
                     )
@@ -48,7 +55,7 @@ def show_vendedor_interface():
                         key=f"obs_{lead['id']}"
                     )
                     
-                    if st.button("Atualizar", key=f"update_{lead['id']}"):
+                    if st.form_submit_button("Atualizar"):
                         update_data = {
                             "status": new_status,
                             "observation": new_observation
@@ -59,5 +66,39 @@ def show_vendedor_interface():
                             st.rerun()
                         else:
                             st.error("Erro ao atualizar lead")
+        
+        show_page_controls("vendedor_leads_cursors", page["next_cursor"])
     else:
         st.error("Erro ao carregar leads")
+
+def show_bulk_status_update(leads):
+    with st.expander("🗂️ Atualizar vários leads de uma vez"):
+        lead_names = {lead['id']: f"{lead['client_name']} - {STATUS_LABELS[lead['status']]}" for lead in leads}
+        
+        with st.form("bulk_status_form"):
+            selecionados = st.multiselect(
+                "Leads",
+                options=list(lead_names.keys()),
+                format_func=lambda lead_id: lead_names[lead_id]
+            )
+            new_status = st.selectbox(
+                "Novo status",
+                options=STATUS_OPTIONS,
+                format_func=lambda x: STATUS_LABELS[x]
+            )
+            new_observation = st.text_area("Observação (opcional, substitui a atual)")
+            submit = st.form_submit_button("Atualizar selecionados")
+            
+            if submit:
+                if not selecionados:
+                    st.error("Selecione pelo menos um lead")
+                else:
+                    update_data = {"ids": selecionados, "status": new_status}
+                    if new_observation:
+                        update_data["observation"] = new_observation
+                    response = make_authenticated_request("/leads/bulk-status", "PATCH", update_data)
+                    if response and response.status_code == 200:
+                        st.success(f"{response.json()['updated']} lead(s) atualizado(s)!")
+                        st.rerun()
+                    else:
+                        st.error("Erro ao atualizar leads")